@@ -1,4 +1,10 @@
+# Large scripts parse into hundreds of thousands of nodes, so every node class declares
+# __slots__ instead of carrying a __dict__. Attributes filled in by later passes, such as
+# the resolver's depth and slot, must be listed in the class's __slots__ as well.
+
 class ASTNode:
+    __slots__ = ('line', 'column')
+
     def __init__(self, line=None, column=None):
         self.line = line
         self.column = column
@@ -7,39 +13,56 @@ class ASTNode:
         raise NotImplementedError
 
 class Program(ASTNode):
+    __slots__ = ('statements', 'resolved')
+
     def __init__(self, statements, line=None, column=None):
         super().__init__(line, column)
         self.statements = statements
+        self.resolved = False
 
     def accept(self, visitor):
         return visitor.visit_program(self)
 
 class Statement(ASTNode):
-    pass
+    __slots__ = ()
 
 class Expression(ASTNode):
+    __slots__ = ()
+
     def __init__(self, line=None, column=None):
         super().__init__(line, column)
 
 class VariableDeclaration(Statement):
+    __slots__ = ('name', 'value', 'slot')
+
     def __init__(self, name, value, line=None, column=None):
         super().__init__(line, column)
         self.name = name
         self.value = value
+        # Filled in by the resolver; a slot of None means a global
+        self.slot = None
 
     def accept(self, visitor):
         return visitor.visit_variable_declaration(self)
 
 class Assignment(Statement):
+    __slots__ = ('name', 'value', 'depth', 'slot', 'fallback')
+
     def __init__(self, name, value, line=None, column=None):
         super().__init__(line, column)
         self.name = name
         self.value = value
+        self.depth = None
+        self.slot = None
+        # Outer (depth, slot) addresses of the same name, assigned while the slot is unset
+        self.fallback = ()
 
     def accept(self, visitor):
         return visitor.visit_assignment(self)
 
 class IfStatement(Statement):
+    __slots__ = ('condition', 'then_block', 'else_block')
+
     def __init__(self, condition, then_block, else_block=None, line=None, column=None):
         super().__init__(line, column)
         self.condition = condition
@@ -50,6 +73,8 @@ class IfStatement(Statement):
         return visitor.visit_if_statement(self)
 
 class WhileStatement(Statement):
+    __slots__ = ('condition', 'body')
+
     def __init__(self, condition, body, line=None, column=None):
         super().__init__(line, column)
         self.condition = condition
@@ -59,6 +84,8 @@ class WhileStatement(Statement):
         return visitor.visit_while_statement(self)
 
 class ForStatement(Statement):
+    __slots__ = ('initializer', 'condition', 'increment', 'body')
+
     def __init__(self, initializer, condition, increment, body, line=None, column=None):
         super().__init__(line, column)
         self.initializer = initializer
@@ -69,7 +96,23 @@ class ForStatement(Statement):
     def accept(self, visitor):
         return visitor.visit_for_statement(self)
 
+class ForInStatement(Statement):
+    # for (name in iterable) body; like a for loop's `let`, the loop variable is
+    # declared in the enclosing scope
+    __slots__ = ('name', 'iterable', 'body', 'slot')
+
+    def __init__(self, name, iterable, body, line=None, column=None):
+        super().__init__(line, column)
+        self.name = name
+        self.iterable = iterable
+        self.body = body
+
+    def accept(self, visitor):
+        return visitor.visit_for_in_statement(self)
+
 class BreakStatement(Statement):
+    __slots__ = ()
+
     def __init__(self, line=None, column=None):
         super().__init__(line, column)
 
@@ -77,6 +120,8 @@ class BreakStatement(Statement):
         return visitor.visit_break_statement(self)
 
 class ContinueStatement(Statement):
+    __slots__ = ()
+
     def __init__(self, line=None, column=None):
         super().__init__(line, column)
 
@@ -84,32 +129,45 @@ class ContinueStatement(Statement):
         return visitor.visit_continue_statement(self)
 
 class FunctionDefinition(Statement):
+    __slots__ = ('name', 'parameters', 'body', 'slot', 'frame_size')
+
     def __init__(self, name, parameters, body, line=None, column=None):
         super().__init__(line, column)
         self.name = name
         self.parameters = parameters
         self.body = body
+        self.slot = None
+        self.frame_size = 0
 
     def accept(self, visitor):
         return visitor.visit_function_definition(self)
 
 class ReturnStatement(Statement):
+    __slots__ = ('value', 'tail_call')
+
     def __init__(self, value=None, line=None, column=None):
         super().__init__(line, column)
         self.value = value
+        # Set by the resolver for `return f(...)` inside a function
+        self.tail_call = False
 
     def accept(self, visitor):
         return visitor.visit_return_statement(self)
 
 class BlockStatement(Statement):
+    __slots__ = ('statements', 'frame_size')
+
     def __init__(self, statements, line=None, column=None):
         super().__init__(line, column)
         self.statements = statements
+        self.frame_size = 0
 
     def accept(self, visitor):
         return visitor.visit_block_statement(self)
 
 class ExpressionStatement(Statement):
+    __slots__ = ('expression',)
+
     def __init__(self, expression, line=None, column=None):
         super().__init__(line, column)
         self.expression = expression
@@ -118,6 +176,8 @@ class ExpressionStatement(Statement):
         return visitor.visit_expression_statement(self)
 
 class BinaryExpression(Expression):
+    __slots__ = ('left', 'operator', 'right')
+
     def __init__(self, left, operator, right, line=None, column=None):
         super().__init__(line, column)
         self.left = left
@@ -127,7 +187,95 @@ class BinaryExpression(Expression):
     def accept(self, visitor):
         return visitor.visit_binary_expression(self)
 
+# One node class per binary operator, built by the parser. They keep `operator`, so
+# visitors that only implement visit_binary_expression handle them unchanged.
+class Add(BinaryExpression):
+    __slots__ = ()
+
+    def __init__(self, left, right, line=None, column=None):
+        super().__init__(left, '+', right, line, column)
+
+class Subtract(BinaryExpression):
+    __slots__ = ()
+
+    def __init__(self, left, right, line=None, column=None):
+        super().__init__(left, '-', right, line, column)
+
+class Multiply(BinaryExpression):
+    __slots__ = ()
+
+    def __init__(self, left, right, line=None, column=None):
+        super().__init__(left, '*', right, line, column)
+
+class Divide(BinaryExpression):
+    __slots__ = ()
+
+    def __init__(self, left, right, line=None, column=None):
+        super().__init__(left, '/', right, line, column)
+
+class Modulo(BinaryExpression):
+    __slots__ = ()
+
+    def __init__(self, left, right, line=None, column=None):
+        super().__init__(left, '%', right, line, column)
+
+class Equal(BinaryExpression):
+    __slots__ = ()
+
+    def __init__(self, left, right, line=None, column=None):
+        super().__init__(left, '==', right, line, column)
+
+class NotEqual(BinaryExpression):
+    __slots__ = ()
+
+    def __init__(self, left, right, line=None, column=None):
+        super().__init__(left, '!=', right, line, column)
+
+class Less(BinaryExpression):
+    __slots__ = ()
+
+    def __init__(self, left, right, line=None, column=None):
+        super().__init__(left, '<', right, line, column)
+
+class Greater(BinaryExpression):
+    __slots__ = ()
+
+    def __init__(self, left, right, line=None, column=None):
+        super().__init__(left, '>', right, line, column)
+
+class LessEqual(BinaryExpression):
+    __slots__ = ()
+
+    def __init__(self, left, right, line=None, column=None):
+        super().__init__(left, '<=', right, line, column)
+
+class GreaterEqual(BinaryExpression):
+    __slots__ = ()
+
+    def __init__(self, left, right, line=None, column=None):
+        super().__init__(left, '>=', right, line, column)
+
+class In(BinaryExpression):
+    __slots__ = ()
+
+    def __init__(self, left, right, line=None, column=None):
+        super().__init__(left, 'in', right, line, column)
+
+class And(BinaryExpression):
+    __slots__ = ()
+
+    def __init__(self, left, right, line=None, column=None):
+        super().__init__(left, '&&', right, line, column)
+
+class Or(BinaryExpression):
+    __slots__ = ()
+
+    def __init__(self, left, right, line=None, column=None):
+        super().__init__(left, '||', right, line, column)
+
 class UnaryExpression(Expression):
+    __slots__ = ('operator', 'operand')
+
     def __init__(self, operator, operand, line=None, column=None):
         super().__init__(line, column)
         self.operator = operator
@@ -136,7 +284,21 @@ class UnaryExpression(Expression):
     def accept(self, visitor):
         return visitor.visit_unary_expression(self)
 
+class Not(UnaryExpression):
+    __slots__ = ()
+
+    def __init__(self, operand, line=None, column=None):
+        super().__init__('!', operand, line, column)
+
+class Negate(UnaryExpression):
+    __slots__ = ()
+
+    def __init__(self, operand, line=None, column=None):
+        super().__init__('-', operand, line, column)
+
 class Literal(Expression):
+    __slots__ = ('value',)
+
     def __init__(self, value, line=None, column=None):
         super().__init__(line, column)
         self.value = value
@@ -145,35 +307,68 @@ class Literal(Expression):
         return visitor.visit_literal(self)
 
 class Variable(Expression):
+    __slots__ = ('name', 'depth', 'slot', 'fallback', 'cache_version', 'cached_value')
+
     def __init__(self, name, line=None, column=None):
         super().__init__(line, column)
         self.name = name
+        self.depth = None
+        self.slot = None
+        # Outer (depth, slot) addresses of the same name, read while the slot is unset
+        self.fallback = ()
+        # Inline cache of the tree interpreter, valid while the global environment's
+        # version equals cache_version
+        self.cache_version = None
+        self.cached_value = None
+
+    def __getstate__(self):
+        return inline_cache_cleared(self)
 
     def accept(self, visitor):
         return visitor.visit_variable(self)
 
 class FunctionCall(Expression):
+    __slots__ = ('name', 'arguments', 'depth', 'slot', 'fallback', 'cache_version', 'cached_value', 'cached_is_function')
+
     def __init__(self, name, arguments, line=None, column=None):
         super().__init__(line, column)
         self.name = name
         self.arguments = arguments
+        self.depth = None
+        self.slot = None
+        self.fallback = ()
+        # Inline cache, as on Variable; cached_is_function tells user functions from builtins
+        self.cache_version = None
+        self.cached_value = None
+        self.cached_is_function = False
+
+    def __getstate__(self):
+        return inline_cache_cleared(self)
 
     def accept(self, visitor):
         return visitor.visit_function_call(self)
 
 class BooleanLiteral(Literal):
+    __slots__ = ()
+
     def __init__(self, value, line=None, column=None):
         super().__init__(value, line, column)
 
 class NumberLiteral(Literal):
+    __slots__ = ()
+
     def __init__(self, value, line=None, column=None):
         super().__init__(float(value) if '.' in str(value) else int(value), line, column)
 
 class StringLiteral(Literal):
+    __slots__ = ()
+
     def __init__(self, value, line=None, column=None):
         super().__init__(value, line, column)
 
 class ArrayLiteral(Expression):
+    __slots__ = ('elements',)
+
     def __init__(self, elements, line=None, column=None):
         super().__init__(line, column)
         self.elements = elements
@@ -181,7 +376,30 @@ class ArrayLiteral(Expression):
     def accept(self, visitor):
         return visitor.visit_array_literal(self)
 
+class MapLiteral(Expression):
+    __slots__ = ('keys', 'values')
+
+    def __init__(self, keys, values, line=None, column=None):
+        super().__init__(line, column)
+        self.keys = keys
+        self.values = values
+
+    def accept(self, visitor):
+        return visitor.visit_map_literal(self)
+
+class SetLiteral(Expression):
+    __slots__ = ('elements',)
+
+    def __init__(self, elements, line=None, column=None):
+        super().__init__(line, column)
+        self.elements = elements
+
+    def accept(self, visitor):
+        return visitor.visit_set_literal(self)
+
 class ArrayAccess(Expression):
+    __slots__ = ('array', 'index')
+
     def __init__(self, array, index, line=None, column=None):
         super().__init__(line, column)
         self.array = array
@@ -191,6 +409,8 @@ class ArrayAccess(Expression):
         return visitor.visit_array_access(self)
 
 class ArrayAssignment(Statement):
+    __slots__ = ('array', 'index', 'value')
+
     def __init__(self, array, index, value, line=None, column=None):
         super().__init__(line, column)
         self.array = array
@@ -201,6 +421,8 @@ class ArrayAssignment(Statement):
         return visitor.visit_array_assignment(self)
 
 class PrefixIncrement(Expression):
+    __slots__ = ('operand',)
+
     def __init__(self, operand, line=None, column=None):
         super().__init__(line, column)
         self.operand = operand
@@ -209,6 +431,8 @@ class PrefixIncrement(Expression):
         return visitor.visit_prefix_increment(self)
 
 class PrefixDecrement(Expression):
+    __slots__ = ('operand',)
+
     def __init__(self, operand, line=None, column=None):
         super().__init__(line, column)
         self.operand = operand
@@ -217,6 +441,8 @@ class PrefixDecrement(Expression):
         return visitor.visit_prefix_decrement(self)
 
 class PostfixIncrement(Expression):
+    __slots__ = ('operand',)
+
     def __init__(self, operand, line=None, column=None):
         super().__init__(line, column)
         self.operand = operand
@@ -225,9 +451,93 @@ class PostfixIncrement(Expression):
         return visitor.visit_postfix_increment(self)
 
 class PostfixDecrement(Expression):
+    __slots__ = ('operand',)
+
     def __init__(self, operand, line=None, column=None):
         super().__init__(line, column)
         self.operand = operand
 
     def accept(self, visitor):
         return visitor.visit_postfix_decrement(self)
+
+NODE_FIELDS = {}
+
+def node_fields(node_class):
+    # Every slot of a node class, base classes first
+    fields = NODE_FIELDS.get(node_class)
+    if fields is None:
+        fields = tuple(name for cls in reversed(node_class.__mro__) for name in cls.__dict__.get('__slots__', ()))
+        NODE_FIELDS[node_class] = fields
+    return fields
+
+def inline_cache_cleared(node):
+    # Pickled state of a node with an inline cache, which holds run-time values such as
+    # bound builtins and is left out
+    state = {name: getattr(node, name) for name in node_fields(node.__class__)}
+    state['cache_version'] = None
+    state['cached_value'] = None
+    if 'cached_is_function' in state:
+        state['cached_is_function'] = False
+    return None, state
+
+def child_nodes(node):
+    for name in node_fields(node.__class__):
+        value = getattr(node, name, None)
+        if isinstance(value, ASTNode):
+            yield value
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, ASTNode):
+                    yield item
+
+def walk(node):
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(child_nodes(node))
+
+def declares_names(statements):
+    # A block only needs its own Environment if it defines something directly in it
+    for statement in statements:
+        if isinstance(statement, (VariableDeclaration, FunctionDefinition)):
+            return True
+        if isinstance(statement, ForStatement) and isinstance(statement.initializer, VariableDeclaration):
+            return True
+        if isinstance(statement, ForInStatement):
+            return True
+    return False
+
+BINARY_NODES = {
+    '+': Add,
+    '-': Subtract,
+    '*': Multiply,
+    '/': Divide,
+    '%': Modulo,
+    '==': Equal,
+    '!=': NotEqual,
+    '<': Less,
+    '>': Greater,
+    '<=': LessEqual,
+    '>=': GreaterEqual,
+    'in': In,
+    '&&': And,
+    '||': Or,
+}
+
+UNARY_NODES = {
+    '!': Not,
+    '-': Negate,
+}
+
+def binary_expression(left, operator, right, line=None, column=None):
+    node_class = BINARY_NODES.get(operator)
+    if node_class is None:
+        return BinaryExpression(left, operator, right, line, column)
+    return node_class(left, right, line, column)
+
+def unary_expression(operator, operand, line=None, column=None):
+    node_class = UNARY_NODES.get(operator)
+    if node_class is None:
+        return UnaryExpression(operator, operand, line, column)
+    return node_class(operand, line, column)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+# Cost of single edits to a large script with the incremental front end, against a full
+# lex and parse of the same source:
+#   python bench/incremental_bench.py --lines 50000
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lexer import Lexer
+from parser import Parser
+from ast_nodes import ASTNode, node_fields
+from incremental import IncrementalParser
+
+def generate_source(lines, seed=7):
+    rng = random.Random(seed)
+    parts = []
+    i = 0
+    while len(parts) < lines:
+        parts.extend([
+            f'def compute_{i}(alpha, beta) {{',
+            f'    let total = alpha * {i} + beta / 3.25 - {rng.randint(0, 999)};',
+            f'    if (total >= 100 && beta != 0) {{ total += 1; }}',
+            f'    for (let k = 0; k < 10; k++) {{ total = total % 7; }}',
+            f'    return [total, "item {i}"];',
+            f'}}',
+            f'let value_{i} = compute_{i}({i}, 2);',
+            f'print(value_{i});',
+        ])
+        i += 1
+    return '\n'.join(parts[:lines]) + '\n'
+
+def full_parse(source):
+    return Parser(Lexer(source).tokens()).parse_program()
+
+def dump(node):
+    if isinstance(node, ASTNode):
+        return (node.__class__.__name__,) + tuple((name, dump(getattr(node, name, None))) for name in node_fields(node.__class__))
+    if isinstance(node, list):
+        return [dump(item) for item in node]
+    return node
+
+def number_offsets(source, rng, count, low, high):
+    # Offsets of the number after "beta / " in randomly chosen functions
+    offsets = []
+    while len(offsets) < count:
+        offset = source.find('3.25', rng.randint(int(len(source) * low), int(len(source) * high)))
+        if offset != -1:
+            offsets.append(offset)
+    return offsets
+
+def time_edits(document, edits):
+    timings = []
+    for make_edit in edits:
+        start, end, text = make_edit(document.source)
+        began = time.process_time()
+        document.edit(start, end, text)
+        timings.append(time.process_time() - began)
+    timings.sort()
+    return timings[len(timings) // 2], timings[-1]
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Measure incremental re-parsing")
+    arg_parser.add_argument('--lines', type=int, default=50000, help="lines in the generated script (default: 50000)")
+    arg_parser.add_argument('--edits', type=int, default=50, help="edits per scenario")
+    args = arg_parser.parse_args()
+
+    rng = random.Random(1)
+    source = generate_source(args.lines)
+    print(f"source: {args.lines} lines, {len(source) / 1_000_000:.1f} MB")
+
+    began = time.process_time()
+    full_parse(source)
+    print(f"full lex + parse: {(time.process_time() - began) * 1000:.0f} ms")
+
+    began = time.process_time()
+    document = IncrementalParser(source)
+    print(f"initial incremental parse: {(time.process_time() - began) * 1000:.0f} ms")
+
+    def replace_number(low, high):
+        def make_edit(source):
+            offset = number_offsets(source, rng, 1, low, high)[0]
+            return offset, offset + 4, str(rng.randint(1, 9))
+        return make_edit
+
+    def insert_line(low, high):
+        def make_edit(source):
+            offset = source.index('\n', rng.randint(int(len(source) * low), int(len(source) * high))) + 1
+            return offset, offset, 'print(1);\n'
+        return make_edit
+
+    def delete_line(low, high):
+        def make_edit(source):
+            offset = source.index('\nprint(', rng.randint(int(len(source) * low), int(len(source) * high))) + 1
+            return offset, source.index('\n', offset) + 1, ''
+        return make_edit
+
+    scenarios = [
+        ("edit a number, middle of file", replace_number(0.4, 0.6)),
+        ("insert a line, end of file", insert_line(0.9, 0.99)),
+        ("insert a line, middle of file", insert_line(0.4, 0.6)),
+        ("insert a line, start of file", insert_line(0.0, 0.05)),
+        ("delete a line, middle of file", delete_line(0.4, 0.6)),
+    ]
+    for label, make_edit in scenarios:
+        median, worst = time_edits(document, [make_edit] * args.edits)
+        print(f"{label:32} median {median * 1000:7.2f} ms, worst {worst * 1000:7.2f} ms")
+
+    if dump(document.program) != dump(full_parse(document.source)):
+        print("incremental result differs from a full parse")
+        sys.exit(1)
+    print("incremental result matches a full parse")
+
+if __name__ == "__main__":
+    main()
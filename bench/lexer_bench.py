@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+# Tokenization throughput on a generated multi-megabyte script:
+#   python bench/lexer_bench.py --size 3
+#   python bench/lexer_bench.py --compare /path/to/old/lexer.py
+# --compare loads another lexer.py, checks that it produces the same tokens and reports
+# the speedup over it.
+
+import os
+import sys
+import time
+import random
+import argparse
+import importlib.util
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lexer import Lexer
+
+def generate_source(size, seed=7):
+    rng = random.Random(seed)
+    parts = []
+    total = 0
+    i = 0
+    while total < size:
+        chunk = (f'// helper number {i}\n'
+                 f'def compute_{i}(alpha, beta) {{\n'
+                 f'    let total_{i} = alpha * {i} + beta / 3.25 - {rng.randint(0, 999)};\n'
+                 f'    if (total_{i} >= 100 && beta != 0 || alpha <= -1) {{ total_{i} += 1; }}\n'
+                 f'    /* block comment\n       spanning lines */\n'
+                 f'    let label = "item \\"{i}\\"\\n" + str(total_{i});\n'
+                 f'    for (let k = 0; k < 10; k++) {{ total_{i} = total_{i} % 7; }}\n'
+                 f'    return [total_{i}, label, true, false];\n'
+                 f'}}\n')
+        parts.append(chunk)
+        total += len(chunk)
+        i += 1
+    return ''.join(parts)
+
+def load_lexer(path):
+    spec = importlib.util.spec_from_file_location('compared_lexer', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.Lexer
+
+def best_time(lexer_class, source, repeat):
+    best = None
+    tokens = None
+    for _ in range(repeat):
+        start = time.process_time()
+        tokens = lexer_class(source).tokenize()
+        elapsed = time.process_time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, tokens
+
+def token_tuples(tokens):
+    return [(token.type, token.value, token.line, token.column) for token in tokens]
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Measure tokenization speed")
+    arg_parser.add_argument('--size', type=float, default=3.0, help="generated source size in MB (default: 3)")
+    arg_parser.add_argument('--repeat', type=int, default=3, help="runs per lexer; the best is reported")
+    arg_parser.add_argument('--file', help="tokenize this file instead of a generated source")
+    arg_parser.add_argument('--compare', help="path of another lexer.py to compare against")
+    args = arg_parser.parse_args()
+
+    if args.file:
+        with open(args.file, 'r') as f:
+            source = f.read()
+    else:
+        source = generate_source(int(args.size * 1_000_000))
+
+    elapsed, tokens = best_time(Lexer, source, args.repeat)
+    megabytes = len(source) / 1_000_000
+    print(f"source: {megabytes:.1f} MB, {len(tokens)} tokens")
+    print(f"lexer:  {elapsed:.3f}s ({megabytes / elapsed:.1f} MB/s, {len(tokens) / elapsed / 1000:.0f}k tokens/s)")
+
+    if args.compare:
+        other_elapsed, other_tokens = best_time(load_lexer(args.compare), source, args.repeat)
+        print(f"other:  {other_elapsed:.3f}s ({megabytes / other_elapsed:.1f} MB/s)")
+        if token_tuples(tokens) != token_tuples(other_tokens):
+            print("tokens differ")
+            sys.exit(1)
+        print(f"tokens identical, speedup {other_elapsed / elapsed:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+# Memory taken by the parsed tree of a large generated script:
+#   python bench/memory_bench.py --lines 200000
+# Reports the shallow size of the nodes themselves, everything the front end leaves
+# allocated per node (lists, strings and numbers included), and the peak RSS.
+
+import os
+import gc
+import sys
+import time
+import argparse
+import resource
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lexer import Lexer
+from parser import Parser
+from ast_nodes import walk
+from incremental_bench import generate_source
+
+def parse(source):
+    return Parser(Lexer(source).tokens()).parse_program()
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Measure the memory used by parsed programs")
+    arg_parser.add_argument('--lines', type=int, default=200000, help="lines in the generated script (default: 200000)")
+    args = arg_parser.parse_args()
+
+    source = generate_source(args.lines)
+    rss_before = peak_rss_mb()
+    began = time.process_time()
+    program = parse(source)
+    elapsed = time.process_time() - began
+    rss_after = peak_rss_mb()
+
+    nodes = list(walk(program))
+    # Counts a per-instance __dict__ too, for comparing against trees that had one
+    shallow = sum(sys.getsizeof(node) + (sys.getsizeof(node.__dict__) if hasattr(node, '__dict__') else 0) for node in nodes)
+    del nodes, program
+    gc.collect()
+
+    tracemalloc.start()
+    program = parse(source)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    count = sum(1 for _ in walk(program))
+
+    print(f"source: {args.lines} lines, {len(source) / 1_000_000:.1f} MB, {count} nodes, parsed in {elapsed:.2f}s")
+    print(f"node objects:      {shallow / count:6.1f} bytes per node")
+    print(f"retained by tree:  {retained / count:6.1f} bytes per node ({retained / 1_000_000:.0f} MB)")
+    print(f"front-end peak:    {peak / 1_000_000:6.0f} MB traced")
+    print(f"peak RSS:          {rss_after:6.0f} MB ({rss_after - rss_before:.0f} MB for parsing)")
+
+if __name__ == "__main__":
+    main()
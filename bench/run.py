@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+# Benchmark runner for the workloads in bench/workloads. Each workload is timed in three
+# phases, Lexer.tokenize, Parser.parse_program and interpret (scope resolution
+# included), the last once per engine:
+#   python bench/run.py                                  # all workloads, all engines
+#   python bench/run.py fib closures --engine vm --repeat 10
+#   python bench/run.py --json results.json             # save results
+#   python bench/run.py --baseline results.json          # compare against saved results
+#   python bench/run.py --sample-interval 1               # also time the tree engine under --sample
+# Comparing against a baseline exits with status 1 if any phase's median got slower than
+# the baseline's by more than --threshold.
+
+import io
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import statistics
+import contextlib
+
+BENCH_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIRECTORY))
+
+from lexer import Lexer
+from parser import Parser
+from optimizer import Optimizer
+from main import ENGINES
+from profiler import Sampler
+
+WORKLOAD_DIRECTORY = os.path.join(BENCH_DIRECTORY, 'workloads')
+RESULTS_FORMAT = 1
+
+def find_workloads(names=None):
+    workloads = {}
+    for filename in sorted(os.listdir(WORKLOAD_DIRECTORY)):
+        if filename.endswith('.ss'):
+            workloads[filename[:-3]] = os.path.join(WORKLOAD_DIRECTORY, filename)
+    if names:
+        unknown = [name for name in names if name not in workloads]
+        if unknown:
+            raise SystemExit(f"Unknown workload(s): {', '.join(unknown)}; available: {', '.join(workloads)}")
+        workloads = {name: workloads[name] for name in names}
+    return workloads
+
+def measure(function, warmup, repeat, setup=None):
+    # Runs setup() untimed before every call and times function(setup's result)
+    times = []
+    result = None
+    for run in range(warmup + repeat):
+        argument = setup() if setup else None
+        start = time.perf_counter()
+        result = function(argument)
+        elapsed = time.perf_counter() - start
+        if run >= warmup:
+            times.append(elapsed)
+    return times, result
+
+def summarize(times):
+    return {
+        'runs': len(times),
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.fmean(times),
+        'stdev': statistics.stdev(times) if len(times) > 1 else 0.0,
+    }
+
+def run_workload(path, engines, warmup, repeat, optimize=False, sample_interval=None):
+    with open(path, 'r') as f:
+        source = f.read()
+
+    phases = {}
+    times, tokens = measure(lambda _: Lexer(source).tokenize(), warmup, repeat)
+    phases['lex'] = summarize(times)
+    times, _ = measure(lambda _: Parser(tokens).parse_program(), warmup, repeat)
+    phases['parse'] = summarize(times)
+
+    def fresh_program():
+        program = Parser(tokens).parse_program()
+        return Optimizer().optimize(program) if optimize else program
+
+    outputs = {}
+    for engine in engines:
+        def interpret(program):
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                ENGINES[engine]().interpret(program)
+            return output.getvalue()
+
+        times, outputs[engine] = measure(interpret, warmup, repeat, fresh_program)
+        phases[f'interpret:{engine}'] = summarize(times)
+
+    if sample_interval and 'tree' in engines:
+        # The sampler's overhead, next to the plain interpret:tree phase
+        samplers = []
+        def sampled(program):
+            sampler = Sampler(path, sample_interval)
+            samplers.append(sampler)
+            output = io.StringIO()
+            sampler.start()
+            try:
+                with contextlib.redirect_stdout(output):
+                    ENGINES['tree']().interpret(program)
+            finally:
+                sampler.stop()
+            return output.getvalue()
+
+        times, outputs['tree+sample'] = measure(sampled, warmup, repeat, fresh_program)
+        phases['interpret:tree+sample'] = summarize(times)
+        phases['interpret:tree+sample']['samples'] = statistics.median(sampler.samples for sampler in samplers[warmup:])
+        phases['interpret:tree+sample']['handler'] = statistics.median(sampler.overhead for sampler in samplers[warmup:])
+
+    # Every engine has to agree, or the timings are not comparing the same work
+    if len(set(outputs.values())) > 1:
+        raise SystemExit(f"{path}: engines produced different output: {', '.join(outputs)}")
+    return phases
+
+def compare(results, baseline, threshold):
+    # Returns (workload, phase, baseline median, median, ratio) for every phase measured
+    # in both, and whether any of them regressed beyond the threshold
+    rows = []
+    regressed = False
+    for workload, phases in results['workloads'].items():
+        for phase, stats in phases.items():
+            previous = baseline.get('workloads', {}).get(workload, {}).get(phase)
+            if previous is None:
+                continue
+            ratio = stats['median'] / previous['median'] if previous['median'] else float('inf')
+            if ratio > 1 + threshold:
+                regressed = True
+            rows.append((workload, phase, previous['median'], stats['median'], ratio))
+    return rows, regressed
+
+def format_seconds(seconds):
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:8.1f} us"
+    if seconds < 1:
+        return f"{seconds * 1e3:8.2f} ms"
+    return f"{seconds:8.3f} s "
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Time SimpleScript workloads phase by phase")
+    arg_parser.add_argument('workloads', nargs='*', help="workload names (default: all in bench/workloads)")
+    arg_parser.add_argument('--engine', action='append', choices=sorted(ENGINES),
+                            help="engine to interpret with; repeat for several (default: all)")
+    arg_parser.add_argument('--warmup', type=int, default=1, help="untimed runs before measuring (default: 1)")
+    arg_parser.add_argument('--repeat', type=int, default=5, help="timed runs per phase (default: 5)")
+    arg_parser.add_argument('-O', dest='optimize', action='store_true', help="optimize programs before interpreting")
+    arg_parser.add_argument('--json', dest='json_path', help="write the results to this file")
+    arg_parser.add_argument('--baseline', help="results file from an earlier run to compare against")
+    arg_parser.add_argument('--sample-interval', type=float, metavar='MS',
+                            help="also time the tree engine while sampling every MS milliseconds of CPU time")
+    arg_parser.add_argument('--threshold', type=float, default=0.10,
+                            help="slowdown of a median that counts as a regression (default: 0.10)")
+    args = arg_parser.parse_args()
+
+    if args.repeat < 1:
+        arg_parser.error("--repeat must be at least 1")
+    if args.sample_interval is not None and args.sample_interval <= 0:
+        arg_parser.error("--sample-interval must be positive")
+    sample_interval = args.sample_interval / 1000 if args.sample_interval else None
+    engines = args.engine or sorted(ENGINES)
+
+    results = {
+        'format': RESULTS_FORMAT,
+        'python': platform.python_version(),
+        'implementation': sys.implementation.cache_tag,
+        'optimize': args.optimize,
+        'warmup': args.warmup,
+        'repeat': args.repeat,
+        'sample_interval': sample_interval,
+        'workloads': {},
+    }
+    print(f"{'workload':14} {'phase':22} {'median':>11} {'min':>11} {'stdev':>11}")
+    for name, path in find_workloads(args.workloads).items():
+        phases = run_workload(path, engines, args.warmup, args.repeat, args.optimize, sample_interval)
+        results['workloads'][name] = phases
+        for phase, stats in phases.items():
+            print(f"{name:14} {phase:22} {format_seconds(stats['median'])} {format_seconds(stats['min'])} "
+                  f"{format_seconds(stats['stdev'])}" +
+                  (f"  {stats['samples']:.0f} samples, {format_seconds(stats['handler']).strip()} in handler"
+                   if 'samples' in stats else ''))
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json_path}")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        rows, regressed = compare(results, baseline, args.threshold)
+        print()
+        print(f"{'workload':14} {'phase':22} {'baseline':>11} {'current':>11} {'change':>8}")
+        for workload, phase, before, after, ratio in rows:
+            flag = '  REGRESSION' if ratio > 1 + args.threshold else ''
+            print(f"{workload:14} {phase:22} {format_seconds(before)} {format_seconds(after)} {(ratio - 1) * 100:+7.1f}%{flag}")
+        if regressed:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
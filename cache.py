@@ -0,0 +1,118 @@
+import gc
+import hashlib
+import os
+import pickle
+import sys
+from lexer import Lexer
+from parser import Parser
+from optimizer import Optimizer
+from stats import phase
+
+# Parsed programs are cached next to their scripts, like Python's __pycache__:
+#   examples/hello.ss -> examples/__pycache__/hello.cpython-311.ssc
+# Each entry records the hash of the source it was parsed from and the interpreter
+# version that parsed it; a mismatch on either is a miss and the entry is rewritten.
+# Optimized entries hold constants folded by running the interpreter's own operators and
+# builtins, so their version also covers the runtime modules.
+
+CACHE_DIRECTORY = '__pycache__'
+CACHE_SUFFIX = '.ssc'
+
+# Bump when the entry layout changes. Edits to the modules below already change the
+# interpreter version on their own.
+CACHE_FORMAT = 1
+FRONT_END_MODULES = ('lexer.py', 'parser.py', 'ast_nodes.py', 'optimizer.py')
+FOLDING_MODULES = ('interpreter.py', 'resolver.py', 'errors.py', 'ropes.py', 'typed_arrays.py', 'sequences.py')
+
+_interpreter_versions = {}
+
+def interpreter_version(optimize=False):
+    version = _interpreter_versions.get(optimize)
+    if version is None:
+        digest = hashlib.sha256(f"{CACHE_FORMAT}:{sys.implementation.cache_tag}".encode())
+        directory = os.path.dirname(os.path.abspath(__file__))
+        modules = FRONT_END_MODULES + FOLDING_MODULES if optimize else FRONT_END_MODULES
+        for module in modules:
+            with open(os.path.join(directory, module), 'rb') as f:
+                digest.update(f.read())
+        version = _interpreter_versions[optimize] = digest.hexdigest()
+    return version
+
+def source_hash(source_code):
+    return hashlib.sha256(source_code.encode('utf-8')).hexdigest()
+
+def cache_path(filename, optimize=False):
+    directory, name = os.path.split(os.path.abspath(filename))
+    stem = name[:-3] if name.endswith('.ss') else name
+    tag = sys.implementation.cache_tag + ('.opt' if optimize else '')
+    return os.path.join(directory, CACHE_DIRECTORY, f"{stem}.{tag}{CACHE_SUFFIX}")
+
+def compile_source(source_code, optimize=False, stats=None):
+    if stats is None:
+        program = Parser(Lexer(source_code).tokens()).parse_program()
+    else:
+        # Lexing runs to completion first so the two phases can be timed apart
+        with stats.phase('lex'):
+            tokens = Lexer(source_code).tokenize()
+        stats.tokens = len(tokens)
+        with stats.phase('parse'):
+            program = Parser(tokens).parse_program()
+    if optimize:
+        with phase(stats, 'optimize'):
+            program = Optimizer().optimize(program)
+    return program
+
+def load(filename, source_code, optimize=False):
+    # Unpickling allocates every node at once; pausing the cyclic collector meanwhile
+    # roughly halves the load time of large programs
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        with open(cache_path(filename, optimize), 'rb') as f:
+            entry = pickle.load(f)
+    except Exception:
+        # Missing, unreadable or corrupt entries are all just misses
+        return None
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    if not isinstance(entry, dict):
+        return None
+    if entry.get('version') != interpreter_version(optimize) or entry.get('source') != source_hash(source_code):
+        return None
+    return entry.get('program')
+
+def store(filename, source_code, program, optimize=False):
+    path = cache_path(filename, optimize)
+    entry = {'version': interpreter_version(optimize), 'source': source_hash(source_code), 'program': program}
+    temporary = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temporary, 'wb') as f:
+            pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+        # Readers never see a partially written entry
+        os.replace(temporary, path)
+        return True
+    except (OSError, pickle.PicklingError, RecursionError):
+        # Caching is best effort: read-only directories or very deep trees just skip it
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
+        return False
+
+def load_program(filename, source_code, optimize=False, use_cache=True, stats=None):
+    # Must be called before the program is resolved, so entries stay engine-independent
+    if not use_cache or not os.path.isfile(filename):
+        return compile_source(source_code, optimize, stats)
+
+    with phase(stats, 'cache load'):
+        program = load(filename, source_code, optimize)
+    if stats is not None:
+        stats.cache_hit = program is not None
+    if program is None:
+        program = compile_source(source_code, optimize, stats)
+        with phase(stats, 'cache store'):
+            store(filename, source_code, program, optimize)
+    return program
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+# Runs scripts under every engine, with and without -O, and checks that they all print
+# the same as the tree engine without -O. Exits with status 1 if any output differs.
+#   python checks/engines.py                          # every examples/*.ss
+#   python checks/engines.py bench/workloads/*.ss
+#   python checks/engines.py examples/hello.ss --engine vm
+# Scripts starting with a shebang line have it dropped, as ss_interpreter.py does.
+# Errors are part of the output compared; scripts that call input() read --input.
+
+import io
+import os
+import sys
+import glob
+import difflib
+import argparse
+import contextlib
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIRECTORY)
+
+from main import ENGINES, run, script_source
+
+def read_script(path):
+    with open(path, 'r') as f:
+        lines = f.readlines()
+    if lines and lines[0].startswith('#!'):
+        return script_source(lines)
+    return ''.join(lines)
+
+def output_of(source, path, engine, optimize, input_text):
+    # stdout of one run, followed by the exit status if the run stopped with one
+    output = io.StringIO()
+    stdin = sys.stdin
+    sys.stdin = io.StringIO(input_text)
+    try:
+        with contextlib.redirect_stdout(output):
+            run(source, path, engine, optimize=optimize, use_cache=False)
+    except SystemExit as e:
+        output.write(f"[exit status {e.code}]\n")
+    finally:
+        sys.stdin = stdin
+    return output.getvalue()
+
+def configurations(engines):
+    return [(engine, optimize) for optimize in (False, True) for engine in engines]
+
+def label(engine, optimize):
+    return f"{engine} -O" if optimize else engine
+
+def check_script(path, engines, input_text):
+    # Returns the differences from the tree engine without -O, one diff per configuration
+    source = read_script(path)
+    expected = output_of(source, path, 'tree', False, input_text)
+    differences = []
+    for engine, optimize in configurations(engines):
+        if engine == 'tree' and not optimize:
+            continue
+        output = output_of(source, path, engine, optimize, input_text)
+        if output != expected:
+            diff = difflib.unified_diff(expected.splitlines(True), output.splitlines(True),
+                                        'tree', label(engine, optimize))
+            differences.append((label(engine, optimize), ''.join(diff)))
+    return differences
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Check that every engine prints the same")
+    arg_parser.add_argument('scripts', nargs='*', help="scripts to run (default: examples/*.ss)")
+    arg_parser.add_argument('--engine', action='append', choices=sorted(ENGINES),
+                            help="engine to compare with the tree engine; repeatable (default: all)")
+    arg_parser.add_argument('--input', default="Alice\n", help="text scripts read with input()")
+    args = arg_parser.parse_args()
+
+    scripts = args.scripts or sorted(glob.glob(os.path.join(ROOT_DIRECTORY, 'examples', '*.ss')))
+    engines = args.engine or list(ENGINES)
+
+    failed = 0
+    for path in scripts:
+        differences = check_script(path, engines, args.input)
+        if differences:
+            failed += 1
+            print(f"{path}: differs under {', '.join(name for name, _ in differences)}")
+            for _, diff in differences:
+                print(diff, end='' if diff.endswith('\n') else '\n')
+        else:
+            print(f"{path}: same under {len(configurations(engines))} configurations")
+
+    if failed:
+        print(f"{failed} of {len(scripts)} scripts differ")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
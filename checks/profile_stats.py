@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+# Checks that `main.py --profile --profile-output` writes a file pstats reads the way
+# cProfile's own dumps are read: a small script is profiled, the dump is loaded with
+# pstats, and the call and caller counts of its functions are compared with the calls
+# the script makes. Exits with status 1 on a mismatch.
+#   python checks/profile_stats.py
+
+import io
+import os
+import sys
+import pstats
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import run
+
+# fact() is called 30 times from the top level and recurses 4 times per call; only the
+# outermost call of each chain is primitive. leaf() is called once per chain, by fact().
+SOURCE = """
+def leaf(x) {
+    return x + 1;
+}
+
+def fact(n) {
+    if (n <= 1) {
+        return leaf(0) * 1;
+    }
+    return n * fact(n - 1);
+}
+
+let total = 0;
+for (let i = 0; i < 30; i++) {
+    total = total + fact(5);
+}
+print(total);
+"""
+
+# (function, caller): (total calls, primitive calls), the order pstats gives caller edges
+EXPECTED_CALLERS = {
+    ('fact', '<module>'): (30, 30),
+    ('fact', 'fact'): (120, 0),
+    ('leaf', 'fact'): (30, 30),
+}
+
+# function: (primitive calls, total calls), the order of the entries themselves
+EXPECTED_CALLS = {
+    'fact': (30, 150),
+    'leaf': (30, 30),
+}
+
+def profile(path):
+    with contextlib.redirect_stdout(io.StringIO()):
+        run(SOURCE, 'profiled.ss', use_cache=False, profile=True, profile_output=path)
+    return pstats.Stats(path)
+
+def check(stats):
+    # Keys are (file, line, name); the script's functions have distinct names
+    failures = []
+    found = set()
+    for (_, _, name), (cc, nc, tt, ct, callers) in stats.stats.items():
+        if name in EXPECTED_CALLS and (cc, nc) != EXPECTED_CALLS[name]:
+            failures.append(f"{name}: {cc} primitive of {nc} calls, expected {EXPECTED_CALLS[name]}")
+        for (_, _, caller), edge in callers.items():
+            found.add((name, caller))
+            expected = EXPECTED_CALLERS.get((name, caller))
+            if expected is not None and edge[:2] != expected:
+                failures.append(f"{name} called by {caller}: {edge[0]}/{edge[1]}, "
+                                f"expected {expected[0]}/{expected[1]}")
+    for function, caller in EXPECTED_CALLERS:
+        if (function, caller) not in found:
+            failures.append(f"{function} has no caller entry for {caller}")
+    return failures
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        stats = profile(os.path.join(directory, 'profile.prof'))
+        failures = check(stats)
+        # The report pstats prints for the dump, which has to load without errors
+        report = io.StringIO()
+        stats.stream = report
+        stats.print_callers()
+
+    for failure in failures:
+        print(failure)
+    if failures:
+        sys.exit(1)
+    print("profile stats OK")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,663 @@
+import operator as op
+from ast_nodes import *
+from interpreter import (Interpreter, Function, RuntimeError, UNSET, BREAK, CONTINUE, ReturnSignal, TailCall,
+                         element_error, fallback_value, fallback_store, contains, make_map, make_set, map_get,
+                         map_set, collection_items, SEQUENCE_TYPES, COLLECTION_TYPES, ITERABLE_TYPES)
+from typed_arrays import TypedArray
+from ropes import concat
+
+COMPARISON_OPERATORS = ('==', '!=', '<', '>', '<=', '>=', 'in', '&&', '||')
+CONSTANT_OPERATORS = ('+', '-', '*', '%', '==', '!=', '<', '>', '<=', '>=')
+
+PYTHON_OPERATORS = {
+    '-': op.sub,
+    '*': op.mul,
+    '%': op.mod,
+    '==': op.eq,
+    '!=': op.ne,
+    '<': op.lt,
+    '>': op.gt,
+    '<=': op.le,
+    '>=': op.ge,
+}
+
+def run_statements(statements):
+    if len(statements) == 0:
+        def run(scope):
+            return None
+    elif len(statements) == 1:
+        run = statements[0]
+    elif len(statements) == 2:
+        first, second = statements
+        def run(scope):
+            signal = first(scope)
+            if signal is not None:
+                return signal
+            return second(scope)
+    else:
+        def run(scope):
+            for statement in statements:
+                signal = statement(scope)
+                if signal is not None:
+                    return signal
+            return None
+    return run
+
+def new_scope(closure, arguments, frame_size):
+    scope = [closure]
+    scope.extend(arguments)
+    if frame_size > len(arguments):
+        scope.extend([UNSET] * (frame_size - len(arguments)))
+    return scope
+
+class CompiledFunction(Function):
+    def __init__(self, name, parameters, body, closure, frame_size, code):
+        super().__init__(name, parameters, body, closure, frame_size)
+        self.code = code
+
+    def call(self, interpreter, arguments):
+        return self.invoke(arguments)
+
+    def invoke(self, arguments):
+        func = self
+        while True:
+            parameters = func.parameters
+            if len(arguments) != len(parameters):
+                raise RuntimeError(f"Function '{func.name}' expects {len(parameters)} arguments, got {len(arguments)}")
+
+            signal = func.code(new_scope(func.closure, arguments, func.frame_size))
+            if signal is None:
+                return None
+            if signal.__class__ is TailCall:
+                func = signal.function
+                arguments = signal.arguments
+                continue
+            if signal is BREAK or signal is CONTINUE:
+                raise RuntimeError("break or continue outside of loop")
+            return signal.value
+
+# Walks the resolved AST once and turns every node into a pre-bound Python closure.
+# Compiled code takes the current local scope list (None at the top level); statements
+# return a completion signal.
+class ClosureCompiler:
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.globals = interpreter.environment.variables
+
+    def compile(self, program):
+        return program.accept(self)
+
+    def compile_expression(self, node):
+        if node is None:
+            return lambda scope: None
+        return node.accept(self)
+
+    def compile_condition(self, node):
+        # Comparisons and logical operators already produce booleans
+        code = self.compile_expression(node)
+        if isinstance(node, BinaryExpression) and node.operator in COMPARISON_OPERATORS:
+            return code
+        if isinstance(node, UnaryExpression) and node.operator == '!':
+            return code
+        is_truthy = self.interpreter.is_truthy
+        return lambda scope: is_truthy(code(scope))
+
+    def visit_program(self, node):
+        return run_statements([statement.accept(self) for statement in node.statements])
+
+    def compile_load(self, node):
+        name = node.name
+        slot = node.slot
+        depth = node.depth
+
+        if slot is None:
+            variables = self.globals
+            def load(scope):
+                if name in variables:
+                    return variables[name]
+                raise RuntimeError(f"Undefined variable '{name}'")
+        elif depth == 0:
+            # Declared earlier in the same scope, but a for-in loop that ran no
+            # iterations leaves its variable unset
+            fallback = node.fallback
+            environment = self.interpreter.environment
+            def load(scope):
+                value = scope[slot]
+                if value is UNSET:
+                    return fallback_value(name, fallback, scope, environment)
+                return value
+        else:
+            fallback = node.fallback
+            environment = self.interpreter.environment
+            def load(scope):
+                outer = scope
+                for _ in range(depth):
+                    outer = outer[0]
+                value = outer[slot]
+                if value is UNSET:
+                    return fallback_value(name, fallback, scope, environment)
+                return value
+        return load
+
+    def compile_store(self, node):
+        name = node.name
+        slot = node.slot
+        depth = node.depth
+
+        if slot is None:
+            variables = self.globals
+            def store(scope, value):
+                variables[name] = value
+        elif depth == 0:
+            def store(scope, value):
+                scope[slot] = value
+        else:
+            fallback = node.fallback
+            environment = self.interpreter.environment
+            def store(scope, value):
+                outer = scope
+                for _ in range(depth):
+                    outer = outer[0]
+                if outer[slot] is UNSET:
+                    fallback_store(name, fallback, scope, environment, value)
+                    return
+                outer[slot] = value
+        return store
+
+    def compile_declaration(self, node, value):
+        name = node.name
+        slot = node.slot
+
+        if slot is None:
+            variables = self.globals
+            def run(scope):
+                variables[name] = value(scope)
+        else:
+            def run(scope):
+                scope[slot] = value(scope)
+        return run
+
+    def visit_variable_declaration(self, node):
+        return self.compile_declaration(node, self.compile_expression(node.value))
+
+    def visit_assignment(self, node):
+        value = self.compile_expression(node.value)
+        name = node.name
+        slot = node.slot
+
+        if slot is None:
+            variables = self.globals
+            def run(scope):
+                variables[name] = value(scope)
+        elif node.depth == 0:
+            def run(scope):
+                scope[slot] = value(scope)
+        else:
+            store = self.compile_store(node)
+            def run(scope):
+                store(scope, value(scope))
+        return run
+
+    def visit_if_statement(self, node):
+        condition = self.compile_condition(node.condition)
+        then_block = node.then_block.accept(self)
+
+        if node.else_block:
+            else_block = node.else_block.accept(self)
+            def run(scope):
+                if condition(scope):
+                    return then_block(scope)
+                return else_block(scope)
+        else:
+            def run(scope):
+                if condition(scope):
+                    return then_block(scope)
+                return None
+        return run
+
+    def visit_while_statement(self, node):
+        condition = self.compile_condition(node.condition)
+        body = node.body.accept(self)
+
+        def run(scope):
+            while condition(scope):
+                signal = body(scope)
+                if signal is not None:
+                    if signal is BREAK:
+                        break
+                    if signal is not CONTINUE:
+                        return signal
+            return None
+        return run
+
+    def visit_for_statement(self, node):
+        initializer = node.initializer.accept(self) if node.initializer else None
+        condition = self.compile_condition(node.condition) if node.condition else None
+        increment = self.compile_expression(node.increment) if node.increment else None
+        body = node.body.accept(self)
+
+        if condition is None:
+            condition = lambda scope: True
+        if increment is None:
+            increment = lambda scope: None
+
+        def run(scope):
+            if initializer is not None:
+                initializer(scope)
+            while condition(scope):
+                signal = body(scope)
+                if signal is not None:
+                    if signal is BREAK:
+                        break
+                    if signal is not CONTINUE:
+                        return signal
+                increment(scope)
+            return None
+        return run
+
+    def visit_for_in_statement(self, node):
+        iterable = self.compile_expression(node.iterable)
+        body = node.body.accept(self)
+        name = node.name
+        slot = node.slot
+        variables = self.globals
+        type_name = self.interpreter.builtin_type
+
+        def run(scope):
+            values = iterable(scope)
+            if not isinstance(values, ITERABLE_TYPES):
+                raise RuntimeError(f"Cannot iterate over a {type_name(values)} value")
+            if isinstance(values, COLLECTION_TYPES):
+                values = collection_items(values)
+            for value in values:
+                if slot is None:
+                    variables[name] = value
+                else:
+                    scope[slot] = value
+                signal = body(scope)
+                if signal is not None:
+                    if signal is BREAK:
+                        break
+                    if signal is not CONTINUE:
+                        return signal
+            return None
+        return run
+
+    def visit_break_statement(self, node):
+        return lambda scope: BREAK
+
+    def visit_continue_statement(self, node):
+        return lambda scope: CONTINUE
+
+    def visit_function_definition(self, node):
+        name = node.name
+        parameters = node.parameters
+        body_node = node.body
+        frame_size = node.frame_size
+        code = run_statements([statement.accept(self) for statement in body_node.statements])
+
+        make_function = lambda scope: CompiledFunction(name, parameters, body_node, scope, frame_size, code)
+        return self.compile_declaration(node, make_function)
+
+    def visit_return_statement(self, node):
+        value = self.compile_expression(node.value)
+        # The signal is consumed by the enclosing call before any other code runs, so one
+        # instance per return statement can be reused, even across recursive calls.
+        signal = ReturnSignal(None)
+
+        if node.tail_call:
+            load = self.compile_load(node.value)
+            arguments = self.compile_arguments(node.value.arguments)
+            tail_call = TailCall(None, None)
+
+            def run(scope):
+                func = load(scope)
+                if func.__class__ is CompiledFunction:
+                    tail_call.function = func
+                    tail_call.arguments = arguments(scope)
+                    return tail_call
+                signal.value = value(scope)
+                return signal
+            return run
+
+        def run(scope):
+            signal.value = value(scope)
+            return signal
+        return run
+
+    def visit_block_statement(self, node):
+        body = run_statements([statement.accept(self) for statement in node.statements])
+        if not node.frame_size:
+            return body
+        padding = [UNSET] * node.frame_size
+        return lambda scope: body([scope] + padding)
+
+    def visit_expression_statement(self, node):
+        expression = self.compile_expression(node.expression)
+
+        def run(scope):
+            expression(scope)
+        return run
+
+    def visit_binary_expression(self, node):
+        operator = node.operator
+        if operator == '&&' or operator == '||':
+            return self.compile_logical(node)
+
+        left = self.compile_expression(node.left)
+        right = self.compile_expression(node.right)
+
+        if isinstance(node.right, Literal) and operator in CONSTANT_OPERATORS:
+            if isinstance(node.left, Variable) and operator in PYTHON_OPERATORS:
+                return self.compile_variable_constant(node.left, PYTHON_OPERATORS[operator], node.right.value)
+            return self.compile_constant_right(left, operator, node.right.value)
+
+        if operator == '+':
+            def evaluate(scope):
+                a = left(scope)
+                b = right(scope)
+                if isinstance(a, str):
+                    return concat(a, b)
+                try:
+                    return a + b
+                except TypeError:
+                    # Mixed string concatenation, e.g. 5 + " items"
+                    if isinstance(b, str):
+                        return str(a) + b
+                    raise
+        elif operator == '-':
+            evaluate = lambda scope: left(scope) - right(scope)
+        elif operator == '*':
+            evaluate = lambda scope: left(scope) * right(scope)
+        elif operator == '/':
+            def evaluate(scope):
+                a = left(scope)
+                b = right(scope)
+                if b == 0 and b.__class__ is not TypedArray:
+                    raise RuntimeError("Division by zero")
+                return a / b
+        elif operator == '%':
+            evaluate = lambda scope: left(scope) % right(scope)
+        elif operator == '==':
+            evaluate = lambda scope: left(scope) == right(scope)
+        elif operator == '!=':
+            evaluate = lambda scope: left(scope) != right(scope)
+        elif operator == '<':
+            evaluate = lambda scope: left(scope) < right(scope)
+        elif operator == '>':
+            evaluate = lambda scope: left(scope) > right(scope)
+        elif operator == '<=':
+            evaluate = lambda scope: left(scope) <= right(scope)
+        elif operator == '>=':
+            evaluate = lambda scope: left(scope) >= right(scope)
+        elif operator == 'in':
+            def evaluate(scope):
+                value = left(scope)
+                return contains(right(scope), value)
+        else:
+            def evaluate(scope):
+                raise RuntimeError(f"Unknown operator: {operator}")
+        return evaluate
+
+    def compile_logical(self, node):
+        # Short-circuits: the right operand only runs when the left does not decide
+        left = self.compile_condition(node.left)
+        right = self.compile_condition(node.right)
+        if node.operator == '&&':
+            return lambda scope: left(scope) and right(scope)
+        return lambda scope: left(scope) or right(scope)
+
+    def compile_constant_right(self, left, operator, constant):
+        # `x < 10`, `n - 1`, `i % 2 == 0`: skip the call that would produce the literal
+        if operator == '+':
+            if isinstance(constant, str):
+                return lambda scope: concat(left(scope), constant)
+            text = str(constant)
+            def evaluate(scope):
+                a = left(scope)
+                if isinstance(a, str):
+                    return concat(a, text)
+                return a + constant
+        elif operator == '-':
+            evaluate = lambda scope: left(scope) - constant
+        elif operator == '*':
+            evaluate = lambda scope: left(scope) * constant
+        elif operator == '%':
+            evaluate = lambda scope: left(scope) % constant
+        elif operator == '==':
+            evaluate = lambda scope: left(scope) == constant
+        elif operator == '!=':
+            evaluate = lambda scope: left(scope) != constant
+        elif operator == '<':
+            evaluate = lambda scope: left(scope) < constant
+        elif operator == '>':
+            evaluate = lambda scope: left(scope) > constant
+        elif operator == '<=':
+            evaluate = lambda scope: left(scope) <= constant
+        elif operator == '>=':
+            evaluate = lambda scope: left(scope) >= constant
+        return evaluate
+
+    def compile_variable_constant(self, node, function, constant):
+        # `i < n`-style operands folded into one closure with an inlined lookup
+        name = node.name
+        slot = node.slot
+
+        if slot is None:
+            variables = self.globals
+            def evaluate(scope):
+                if name in variables:
+                    return function(variables[name], constant)
+                raise RuntimeError(f"Undefined variable '{name}'")
+        elif node.depth == 0:
+            fallback = node.fallback
+            environment = self.interpreter.environment
+            def evaluate(scope):
+                value = scope[slot]
+                if value is UNSET:
+                    value = fallback_value(name, fallback, scope, environment)
+                return function(value, constant)
+        else:
+            load = self.compile_load(node)
+            evaluate = lambda scope: function(load(scope), constant)
+        return evaluate
+
+    def visit_unary_expression(self, node):
+        operand = self.compile_expression(node.operand)
+        operator = node.operator
+
+        if operator == '!':
+            is_truthy = self.interpreter.is_truthy
+            return lambda scope: not is_truthy(operand(scope))
+        elif operator == '-':
+            return lambda scope: -operand(scope)
+
+        def evaluate(scope):
+            operand(scope)
+            raise RuntimeError(f"Unknown unary operator: {operator}")
+        return evaluate
+
+    def visit_literal(self, node):
+        value = node.value
+        return lambda scope: value
+
+    def visit_variable(self, node):
+        return self.compile_load(node)
+
+    def visit_function_call(self, node):
+        name = node.name
+        arguments = self.compile_arguments(node.arguments)
+        interpreter = self.interpreter
+        load = self.compile_load(node)
+
+        def evaluate(scope):
+            func = load(scope)
+
+            if func.__class__ is CompiledFunction:
+                # Inlined CompiledFunction.invoke
+                values = arguments(scope)
+                while True:
+                    parameters = func.parameters
+                    if len(values) != len(parameters):
+                        raise RuntimeError(f"Function '{func.name}' expects {len(parameters)} arguments, got {len(values)}")
+                    signal = func.code(new_scope(func.closure, values, func.frame_size))
+                    if signal is None:
+                        return None
+                    if signal.__class__ is TailCall:
+                        func = signal.function
+                        values = signal.arguments
+                        continue
+                    if signal is BREAK or signal is CONTINUE:
+                        raise RuntimeError("break or continue outside of loop")
+                    return signal.value
+
+            if not callable(func):
+                raise RuntimeError(f"'{name}' is not a function")
+
+            values = arguments(scope)
+            if isinstance(func, Function):
+                return func(interpreter, list(values))
+            # Built-in function
+            return func(*values)
+        return evaluate
+
+    def compile_arguments(self, nodes):
+        arguments = [self.compile_expression(node) for node in nodes]
+
+        if len(arguments) == 0:
+            return lambda scope: ()
+        elif len(arguments) == 1:
+            first, = arguments
+            return lambda scope: (first(scope),)
+        elif len(arguments) == 2:
+            first, second = arguments
+            return lambda scope: (first(scope), second(scope))
+        elif len(arguments) == 3:
+            first, second, third = arguments
+            return lambda scope: (first(scope), second(scope), third(scope))
+        return lambda scope: tuple([argument(scope) for argument in arguments])
+
+    def visit_array_literal(self, node):
+        elements = [self.compile_expression(element) for element in node.elements]
+        return lambda scope: [element(scope) for element in elements]
+
+    def visit_map_literal(self, node):
+        keys = [self.compile_expression(key) for key in node.keys]
+        values = [self.compile_expression(value) for value in node.values]
+        return lambda scope: make_map([key(scope) for key in keys], [value(scope) for value in values])
+
+    def visit_set_literal(self, node):
+        elements = [self.compile_expression(element) for element in node.elements]
+        return lambda scope: make_set([element(scope) for element in elements])
+
+    def visit_array_access(self, node):
+        array_code = self.compile_expression(node.array)
+        index_code = self.compile_expression(node.index)
+
+        def evaluate(scope):
+            array = array_code(scope)
+            index = index_code(scope)
+
+            if not isinstance(array, SEQUENCE_TYPES):
+                if array.__class__ is dict:
+                    return map_get(array, index)
+                raise RuntimeError("Cannot index into non-array value")
+
+            if not isinstance(index, int):
+                raise RuntimeError("Array index must be an integer")
+
+            if index < 0 or index >= len(array):
+                raise RuntimeError(f"Array index {index} out of bounds")
+
+            return array[index]
+        return evaluate
+
+    def visit_array_assignment(self, node):
+        array_code = self.compile_expression(node.array)
+        index_code = self.compile_expression(node.index)
+        value_code = self.compile_expression(node.value)
+
+        def run(scope):
+            array = array_code(scope)
+            index = index_code(scope)
+            value = value_code(scope)
+
+            if not isinstance(array, SEQUENCE_TYPES):
+                if array.__class__ is dict:
+                    map_set(array, index, value)
+                    return
+                raise RuntimeError("Cannot index into non-array value")
+
+            if not isinstance(index, int):
+                raise RuntimeError("Array index must be an integer")
+
+            if index < 0 or index >= len(array):
+                raise RuntimeError(f"Array index {index} out of bounds")
+
+            try:
+                array[index] = value
+            except (TypeError, OverflowError):
+                raise RuntimeError(element_error(array, value))
+        return run
+
+    def compile_step(self, node, delta, postfix, verb):
+        if not isinstance(node.operand, Variable):
+            def evaluate(scope):
+                raise RuntimeError(f"{verb} operator requires a variable")
+            return evaluate
+
+        variable = node.operand
+
+        if variable.slot is not None and variable.depth == 0:
+            name = variable.name
+            slot = variable.slot
+            fallback = variable.fallback
+            environment = self.interpreter.environment
+            def evaluate(scope):
+                current_value = scope[slot]
+                if current_value is UNSET:
+                    current_value = fallback_value(name, fallback, scope, environment)
+                if not isinstance(current_value, (int, float)):
+                    raise RuntimeError(f"{verb} operator requires a numeric value")
+                new_value = current_value + delta
+                scope[slot] = new_value
+                return current_value if postfix else new_value
+            return evaluate
+
+        load = self.compile_load(variable)
+        store = self.compile_store(variable)
+
+        def evaluate(scope):
+            current_value = load(scope)
+            if not isinstance(current_value, (int, float)):
+                raise RuntimeError(f"{verb} operator requires a numeric value")
+            new_value = current_value + delta
+            store(scope, new_value)
+            return current_value if postfix else new_value
+        return evaluate
+
+    def visit_prefix_increment(self, node):
+        return self.compile_step(node, 1, False, "Increment")
+
+    def visit_prefix_decrement(self, node):
+        return self.compile_step(node, -1, False, "Decrement")
+
+    def visit_postfix_increment(self, node):
+        return self.compile_step(node, 1, True, "Increment")
+
+    def visit_postfix_decrement(self, node):
+        return self.compile_step(node, -1, True, "Decrement")
+
+class ClosureInterpreter(Interpreter):
+    supports_hooks = False
+
+    def interpret(self, program):
+        self.resolve(program)
+        code = ClosureCompiler(self).compile(program)
+        signal = code(None)
+
+        if signal is BREAK or signal is CONTINUE:
+            raise RuntimeError("break or continue outside of loop")
+        if signal is not None:
+            return signal.value
+        return None
@@ -0,0 +1,499 @@
+from ast_nodes import *
+
+class Opcode:
+    # Stack and variables
+    LOAD_CONST = 0
+    LOAD_NAME = 1
+    STORE_NAME = 2
+    DEFINE_NAME = 3
+    POP_TOP = 4
+    # LOAD_NAME and STORE_NAME specialized for the innermost scope and for globals
+    LOAD_LOCAL = 5
+    STORE_LOCAL = 6
+    LOAD_GLOBAL = 7
+    STORE_GLOBAL = 8
+
+    # Operators
+    BINARY_ADD = 10
+    BINARY_SUBTRACT = 11
+    BINARY_MULTIPLY = 12
+    BINARY_DIVIDE = 13
+    BINARY_MODULO = 14
+    COMPARE_EQUAL = 15
+    COMPARE_NOT_EQUAL = 16
+    COMPARE_LESS = 17
+    COMPARE_GREATER = 18
+    COMPARE_LESS_EQUAL = 19
+    COMPARE_GREATER_EQUAL = 20
+    COMPARE_IN = 21
+    UNARY_NOT = 23
+    UNARY_NEGATIVE = 24
+
+    # Increment/decrement of a named variable
+    PREFIX_INCREMENT = 30
+    PREFIX_DECREMENT = 31
+    POSTFIX_INCREMENT = 32
+    POSTFIX_DECREMENT = 33
+    INCREMENT_NAME = 34
+    DECREMENT_NAME = 35
+    # Statement-level INCREMENT_NAME and DECREMENT_NAME, specialized likewise
+    INCREMENT_LOCAL = 36
+    DECREMENT_LOCAL = 37
+    INCREMENT_GLOBAL = 38
+    DECREMENT_GLOBAL = 39
+
+    # Control flow
+    JUMP = 40
+    POP_JUMP_IF_FALSE = 41
+    PUSH_SCOPE = 42
+    POP_SCOPE = 43
+    RETURN_VALUE = 44
+    RAISE_ERROR = 45
+    GET_ITER = 46
+    FOR_ITER = 47
+
+    # Functions
+    MAKE_FUNCTION = 50
+    LOAD_FUNCTION = 51
+    CALL_FUNCTION = 52
+    TAIL_CALL = 53
+
+    # Arrays
+    BUILD_ARRAY = 60
+    LOAD_INDEX = 61
+    STORE_INDEX = 62
+
+    # Maps and sets
+    BUILD_MAP = 63
+    BUILD_SET = 64
+
+OPCODE_NAMES = {value: name for name, value in vars(Opcode).items() if not name.startswith('_')}
+
+# Opcodes whose argument indexes into the constant pool or the name table
+CONSTANT_ARGUMENT = {Opcode.LOAD_CONST, Opcode.MAKE_FUNCTION, Opcode.RAISE_ERROR}
+NAME_ARGUMENT = {
+    Opcode.LOAD_NAME, Opcode.STORE_NAME, Opcode.DEFINE_NAME, Opcode.LOAD_FUNCTION,
+    Opcode.LOAD_LOCAL, Opcode.STORE_LOCAL, Opcode.LOAD_GLOBAL, Opcode.STORE_GLOBAL,
+    Opcode.PREFIX_INCREMENT, Opcode.PREFIX_DECREMENT, Opcode.POSTFIX_INCREMENT, Opcode.POSTFIX_DECREMENT,
+    Opcode.INCREMENT_NAME, Opcode.DECREMENT_NAME, Opcode.INCREMENT_LOCAL, Opcode.DECREMENT_LOCAL,
+    Opcode.INCREMENT_GLOBAL, Opcode.DECREMENT_GLOBAL,
+}
+JUMP_ARGUMENT = {Opcode.JUMP, Opcode.POP_JUMP_IF_FALSE, Opcode.FOR_ITER}
+
+BINARY_OPCODES = {
+    '+': Opcode.BINARY_ADD,
+    '-': Opcode.BINARY_SUBTRACT,
+    '*': Opcode.BINARY_MULTIPLY,
+    '/': Opcode.BINARY_DIVIDE,
+    '%': Opcode.BINARY_MODULO,
+    '==': Opcode.COMPARE_EQUAL,
+    '!=': Opcode.COMPARE_NOT_EQUAL,
+    '<': Opcode.COMPARE_LESS,
+    '>': Opcode.COMPARE_GREATER,
+    '<=': Opcode.COMPARE_LESS_EQUAL,
+    '>=': Opcode.COMPARE_GREATER_EQUAL,
+    'in': Opcode.COMPARE_IN,
+}
+
+UNARY_OPCODES = {
+    '!': Opcode.UNARY_NOT,
+    '-': Opcode.UNARY_NEGATIVE,
+}
+
+def name_opcode(node, local, global_name, other):
+    # The opcode for a resolved name: innermost-scope names and globals skip the general
+    # address walk
+    if node.slot is None:
+        return global_name
+    if node.depth == 0:
+        return local
+    return other
+
+class CodeObject:
+    # Instructions are a flat list of (opcode, argument) pairs; jump targets are list indexes.
+    def __init__(self, name, parameters=(), definition=None):
+        self.name = name
+        self.parameters = list(parameters)
+        # FunctionDefinition this was compiled from, so values are still regular Functions
+        self.definition = definition
+        self.instructions = []
+        self.constants = []
+        self.names = []
+
+    def __repr__(self):
+        return f"<code {self.name}>"
+
+class LoopContext:
+    def __init__(self, scope_depth):
+        self.scope_depth = scope_depth
+        self.break_jumps = []
+        self.continue_jumps = []
+
+class Compiler:
+    def __init__(self):
+        self.code = None
+        self.scope_depth = 0
+        self.loops = []
+
+    def compile(self, program):
+        # Expects a program already annotated by the Resolver
+        self.code = CodeObject("<program>")
+        program.accept(self)
+        self.emit(Opcode.LOAD_CONST, self.constant(None))
+        self.emit(Opcode.RETURN_VALUE)
+        return self.code
+
+    # Emission helpers
+    def emit(self, opcode, argument=0):
+        self.code.instructions.extend((opcode, argument))
+        return len(self.code.instructions) - 2
+
+    def constant(self, value):
+        constants = self.code.constants
+        for index, existing in enumerate(constants):
+            if type(existing) is type(value) and existing == value:
+                return index
+        constants.append(value)
+        return len(constants) - 1
+
+    def name(self, node):
+        return self.address(node.name, node.depth, node.slot, getattr(node, 'fallback', ()))
+
+    def declared_name(self, node):
+        # Declarations always target the innermost scope
+        return self.address(node.name, None if node.slot is None else 0, node.slot)
+
+    def address(self, name, depth, slot, fallback=()):
+        # Name table entries are resolver addresses: (name, depth, slot, fallback), slot None
+        # for globals; fallback lists the outer addresses read while the slot is unset
+        entry = (name, depth, slot, fallback)
+        names = self.code.names
+        if entry not in names:
+            names.append(entry)
+        return names.index(entry)
+
+    def position(self):
+        return len(self.code.instructions)
+
+    def patch(self, at, target):
+        self.code.instructions[at + 1] = target
+
+    def compile_expression(self, node):
+        if node is None:
+            self.emit(Opcode.LOAD_CONST, self.constant(None))
+        else:
+            node.accept(self)
+
+    def compile_statements(self, statements):
+        for statement in statements:
+            statement.accept(self)
+
+    def unwind_scopes(self, depth):
+        for _ in range(self.scope_depth - depth):
+            self.emit(Opcode.POP_SCOPE)
+
+    # Statements
+    def visit_program(self, node):
+        self.compile_statements(node.statements)
+
+    def visit_variable_declaration(self, node):
+        self.compile_expression(node.value)
+        self.emit(Opcode.DEFINE_NAME, self.declared_name(node))
+
+    def visit_assignment(self, node):
+        self.compile_expression(node.value)
+        self.emit(name_opcode(node, Opcode.STORE_LOCAL, Opcode.STORE_GLOBAL, Opcode.STORE_NAME), self.name(node))
+
+    def visit_if_statement(self, node):
+        self.compile_expression(node.condition)
+        jump_to_else = self.emit(Opcode.POP_JUMP_IF_FALSE)
+        node.then_block.accept(self)
+
+        if node.else_block:
+            jump_to_end = self.emit(Opcode.JUMP)
+            self.patch(jump_to_else, self.position())
+            node.else_block.accept(self)
+            self.patch(jump_to_end, self.position())
+        else:
+            self.patch(jump_to_else, self.position())
+
+    def visit_while_statement(self, node):
+        start = self.position()
+        self.compile_expression(node.condition)
+        exit_jump = self.emit(Opcode.POP_JUMP_IF_FALSE)
+
+        loop = self.compile_loop_body(node.body)
+        self.emit(Opcode.JUMP, start)
+
+        self.finish_loop(loop, continue_target=start)
+        self.patch(exit_jump, self.position())
+
+    def visit_for_statement(self, node):
+        if node.initializer:
+            node.initializer.accept(self)
+
+        start = self.position()
+        exit_jump = None
+        if node.condition:
+            self.compile_expression(node.condition)
+            exit_jump = self.emit(Opcode.POP_JUMP_IF_FALSE)
+
+        loop = self.compile_loop_body(node.body)
+
+        continue_target = self.position()
+        if node.increment:
+            self.compile_discarded(node.increment)
+        self.emit(Opcode.JUMP, start)
+
+        self.finish_loop(loop, continue_target)
+        if exit_jump is not None:
+            self.patch(exit_jump, self.position())
+
+    def visit_for_in_statement(self, node):
+        # The iterator stays on the stack for the whole loop. FOR_ITER pushes the next
+        # value, or pops the iterator and jumps past the loop once it is exhausted;
+        # break jumps to a POP_TOP that drops it instead.
+        self.compile_expression(node.iterable)
+        self.emit(Opcode.GET_ITER)
+
+        start = self.position()
+        exhausted_jump = self.emit(Opcode.FOR_ITER)
+        self.emit(Opcode.DEFINE_NAME, self.declared_name(node))
+
+        loop = self.compile_loop_body(node.body)
+        self.emit(Opcode.JUMP, start)
+
+        self.finish_loop(loop, continue_target=start)
+        self.emit(Opcode.POP_TOP)
+        self.patch(exhausted_jump, self.position())
+
+    def compile_loop_body(self, body):
+        loop = LoopContext(self.scope_depth)
+        self.loops.append(loop)
+        body.accept(self)
+        self.loops.pop()
+        return loop
+
+    def finish_loop(self, loop, continue_target):
+        for jump in loop.continue_jumps:
+            self.patch(jump, continue_target)
+        for jump in loop.break_jumps:
+            self.patch(jump, self.position())
+
+    def visit_break_statement(self, node):
+        if not self.loops:
+            self.emit(Opcode.RAISE_ERROR, self.constant("break or continue outside of loop"))
+            return
+        loop = self.loops[-1]
+        self.unwind_scopes(loop.scope_depth)
+        loop.break_jumps.append(self.emit(Opcode.JUMP))
+
+    def visit_continue_statement(self, node):
+        if not self.loops:
+            self.emit(Opcode.RAISE_ERROR, self.constant("break or continue outside of loop"))
+            return
+        loop = self.loops[-1]
+        self.unwind_scopes(loop.scope_depth)
+        loop.continue_jumps.append(self.emit(Opcode.JUMP))
+
+    def visit_function_definition(self, node):
+        outer = (self.code, self.scope_depth, self.loops)
+        self.code = CodeObject(node.name, node.parameters, node)
+        self.scope_depth = 0
+        self.loops = []
+
+        # Parameters and the body's own declarations share one scope
+        self.compile_statements(node.body.statements)
+        self.emit(Opcode.LOAD_CONST, self.constant(None))
+        self.emit(Opcode.RETURN_VALUE)
+
+        function_code = self.code
+        self.code, self.scope_depth, self.loops = outer
+        self.emit(Opcode.MAKE_FUNCTION, self.constant(function_code))
+        self.emit(Opcode.DEFINE_NAME, self.declared_name(node))
+
+    def visit_return_statement(self, node):
+        if node.tail_call:
+            # TAIL_CALL replaces the frame when the callee is bytecode; otherwise it
+            # leaves the result for the RETURN_VALUE after it
+            call = node.value
+            self.emit(Opcode.LOAD_FUNCTION, self.name(call))
+            for argument in call.arguments:
+                self.compile_expression(argument)
+            self.emit(Opcode.TAIL_CALL, len(call.arguments))
+        else:
+            self.compile_expression(node.value)
+        self.emit(Opcode.RETURN_VALUE)
+
+    def visit_block_statement(self, node):
+        if not node.frame_size:
+            self.compile_statements(node.statements)
+            return
+
+        self.emit(Opcode.PUSH_SCOPE, node.frame_size)
+        self.scope_depth += 1
+        self.compile_statements(node.statements)
+        self.scope_depth -= 1
+        self.emit(Opcode.POP_SCOPE)
+
+    def visit_expression_statement(self, node):
+        self.compile_discarded(node.expression)
+
+    def compile_discarded(self, node):
+        # `i++;` as a statement or for-loop increment does not need its value on the stack
+        if isinstance(node, (PrefixIncrement, PostfixIncrement, PrefixDecrement, PostfixDecrement)) \
+                and isinstance(node.operand, Variable):
+            if isinstance(node, (PrefixIncrement, PostfixIncrement)):
+                opcode = name_opcode(node.operand, Opcode.INCREMENT_LOCAL, Opcode.INCREMENT_GLOBAL, Opcode.INCREMENT_NAME)
+            else:
+                opcode = name_opcode(node.operand, Opcode.DECREMENT_LOCAL, Opcode.DECREMENT_GLOBAL, Opcode.DECREMENT_NAME)
+            self.emit(opcode, self.name(node.operand))
+            return
+        self.compile_expression(node)
+        self.emit(Opcode.POP_TOP)
+
+    # Expressions
+    def visit_binary_expression(self, node):
+        if node.operator == '&&' or node.operator == '||':
+            self.compile_logical(node)
+            return
+
+        self.compile_expression(node.left)
+        self.compile_expression(node.right)
+        opcode = BINARY_OPCODES.get(node.operator)
+        if opcode is None:
+            self.emit(Opcode.RAISE_ERROR, self.constant(f"Unknown operator: {node.operator}"))
+        else:
+            self.emit(opcode)
+
+    def compile_logical(self, node):
+        # Short-circuits with jumps and leaves a boolean on the stack
+        self.compile_expression(node.left)
+        end_jumps = []
+        if node.operator == '&&':
+            false_jumps = [self.emit(Opcode.POP_JUMP_IF_FALSE)]
+        else:
+            false_jumps = []
+            jump_to_right = self.emit(Opcode.POP_JUMP_IF_FALSE)
+            self.emit(Opcode.LOAD_CONST, self.constant(True))
+            end_jumps.append(self.emit(Opcode.JUMP))
+            self.patch(jump_to_right, self.position())
+
+        self.compile_expression(node.right)
+        false_jumps.append(self.emit(Opcode.POP_JUMP_IF_FALSE))
+        self.emit(Opcode.LOAD_CONST, self.constant(True))
+        end_jumps.append(self.emit(Opcode.JUMP))
+
+        for jump in false_jumps:
+            self.patch(jump, self.position())
+        self.emit(Opcode.LOAD_CONST, self.constant(False))
+        for jump in end_jumps:
+            self.patch(jump, self.position())
+
+    def visit_unary_expression(self, node):
+        self.compile_expression(node.operand)
+        opcode = UNARY_OPCODES.get(node.operator)
+        if opcode is None:
+            self.emit(Opcode.RAISE_ERROR, self.constant(f"Unknown unary operator: {node.operator}"))
+        else:
+            self.emit(opcode)
+
+    def visit_literal(self, node):
+        self.emit(Opcode.LOAD_CONST, self.constant(node.value))
+
+    def visit_variable(self, node):
+        self.emit(name_opcode(node, Opcode.LOAD_LOCAL, Opcode.LOAD_GLOBAL, Opcode.LOAD_NAME), self.name(node))
+
+    def visit_function_call(self, node):
+        self.emit(Opcode.LOAD_FUNCTION, self.name(node))
+        for argument in node.arguments:
+            self.compile_expression(argument)
+        self.emit(Opcode.CALL_FUNCTION, len(node.arguments))
+
+    def visit_array_literal(self, node):
+        for element in node.elements:
+            self.compile_expression(element)
+        self.emit(Opcode.BUILD_ARRAY, len(node.elements))
+
+    def visit_map_literal(self, node):
+        # Keys and values are pushed alternately; the argument counts the pairs
+        for key, value in zip(node.keys, node.values):
+            self.compile_expression(key)
+            self.compile_expression(value)
+        self.emit(Opcode.BUILD_MAP, len(node.keys))
+
+    def visit_set_literal(self, node):
+        for element in node.elements:
+            self.compile_expression(element)
+        self.emit(Opcode.BUILD_SET, len(node.elements))
+
+    def visit_array_access(self, node):
+        self.compile_expression(node.array)
+        self.compile_expression(node.index)
+        self.emit(Opcode.LOAD_INDEX)
+
+    def visit_array_assignment(self, node):
+        self.compile_expression(node.array)
+        self.compile_expression(node.index)
+        self.compile_expression(node.value)
+        self.emit(Opcode.STORE_INDEX)
+
+    def compile_step(self, node, opcode, verb):
+        if not isinstance(node.operand, Variable):
+            self.emit(Opcode.RAISE_ERROR, self.constant(f"{verb} operator requires a variable"))
+            return
+        self.emit(opcode, self.name(node.operand))
+
+    def visit_prefix_increment(self, node):
+        self.compile_step(node, Opcode.PREFIX_INCREMENT, "Increment")
+
+    def visit_prefix_decrement(self, node):
+        self.compile_step(node, Opcode.PREFIX_DECREMENT, "Decrement")
+
+    def visit_postfix_increment(self, node):
+        self.compile_step(node, Opcode.POSTFIX_INCREMENT, "Increment")
+
+    def visit_postfix_decrement(self, node):
+        self.compile_step(node, Opcode.POSTFIX_DECREMENT, "Decrement")
+
+def disassemble(code):
+    lines = []
+    pending = [code]
+
+    while pending:
+        code = pending.pop(0)
+        if lines:
+            lines.append("")
+        if code.definition is None:
+            lines.append(f"Disassembly of {code.name}:")
+        else:
+            lines.append(f"Disassembly of {code.name}({', '.join(code.parameters)}):")
+
+        targets = set()
+        instructions = code.instructions
+        for pc in range(0, len(instructions), 2):
+            if instructions[pc] in JUMP_ARGUMENT:
+                targets.add(instructions[pc + 1])
+
+        for pc in range(0, len(instructions), 2):
+            opcode, argument = instructions[pc], instructions[pc + 1]
+            marker = ">>" if pc in targets else "  "
+            text = f"{marker} {pc:4} {OPCODE_NAMES[opcode]:<22}"
+
+            if opcode in CONSTANT_ARGUMENT:
+                value = code.constants[argument]
+                if isinstance(value, CodeObject):
+                    pending.append(value)
+                text += f"{argument:4} ({value!r})"
+            elif opcode in NAME_ARGUMENT:
+                name, depth, slot, fallback = code.names[argument]
+                where = "global" if slot is None else f"depth {depth}, slot {slot}"
+                text += f"{argument:4} ({name}: {where})"
+            elif opcode in JUMP_ARGUMENT:
+                text += f"{argument:4}"
+            elif opcode in (Opcode.CALL_FUNCTION, Opcode.TAIL_CALL, Opcode.BUILD_ARRAY, Opcode.BUILD_MAP,
+                            Opcode.BUILD_SET, Opcode.PUSH_SCOPE):
+                text += f"{argument:4}"
+            lines.append(text.rstrip())
+
+    return "\n".join(lines)
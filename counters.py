@@ -0,0 +1,73 @@
+import json
+import atexit
+from ast_nodes import WhileStatement, ForStatement, ForInStatement
+from profiler import first_line
+
+# Execution counters collected through the interpreter's hooks, used by
+# `main.py --counters`: how often each node type was evaluated, how often each function
+# was entered and returned from, how often each builtin was called, and how many
+# iterations each loop ran. Loops are counted from the statement hook: a loop statement
+# is seen before its body, so every later visit of that body is one iteration.
+
+class CounterCollector:
+    def __init__(self):
+        self.nodes = {}
+        self.calls = {}
+        self.returns = {}
+        self.builtins = {}
+        # Per loop line, [times the loop was started, iterations]
+        self.loops = {}
+        self.loop_bodies = {}
+        self.lines = {}
+
+    def attach(self, interpreter):
+        interpreter.on_node(self.count_node)
+        interpreter.on_statement(self.count_statement)
+        interpreter.on_call(self.count_call)
+        interpreter.on_return(self.count_return)
+        interpreter.on_builtin(self.count_builtin)
+        return self
+
+    def count_node(self, node):
+        name = node.__class__.__name__
+        self.nodes[name] = self.nodes.get(name, 0) + 1
+
+    def count_statement(self, node):
+        if isinstance(node, (WhileStatement, ForStatement, ForInStatement)):
+            loop = self.loop_bodies.get(id(node.body))
+            if loop is None:
+                loop = self.loops.setdefault(first_line(node, self.lines), [0, 0])
+                self.loop_bodies[id(node.body)] = loop
+            loop[0] += 1
+            return
+
+        loop = self.loop_bodies.get(id(node))
+        if loop is not None:
+            loop[1] += 1
+
+    def count_call(self, function, arguments):
+        self.calls[function.name] = self.calls.get(function.name, 0) + 1
+
+    def count_return(self, function, value):
+        self.returns[function.name] = self.returns.get(function.name, 0) + 1
+
+    def count_builtin(self, name, arguments):
+        self.builtins[name] = self.builtins.get(name, 0) + 1
+
+    def as_dict(self):
+        return {
+            'nodes': dict(sorted(self.nodes.items(), key=lambda item: -item[1])),
+            'calls': self.calls,
+            'returns': self.returns,
+            'builtins': self.builtins,
+            'loops': {str(line): {'runs': runs, 'iterations': iterations}
+                      for line, (runs, iterations) in sorted(self.loops.items())},
+        }
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+    def dump_at_exit(self, path):
+        atexit.register(self.dump, path)
+        return self
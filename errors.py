@@ -0,0 +1,8 @@
+# Raised for errors in running scripts. Lives in its own module so that value types
+# such as typed arrays can raise it without importing the interpreter.
+class RuntimeError(Exception):
+    def __init__(self, message, line=None, column=None):
+        self.message = message
+        self.line = line
+        self.column = column
+        super().__init__(f"RuntimeError at line {line}, column {column}: {message}")
@@ -0,0 +1,151 @@
+from bisect import bisect_right
+from lexer import Lexer, TokenType
+from parser import Parser
+from ast_nodes import Program, IfStatement, walk
+
+# Incremental front end for sources edited a few characters at a time, as in an editor.
+# Each top-level statement owns the text from the end of the previous statement through
+# its own final ';' or '}', so the statements tile the source and the lexer is outside
+# any string or comment at every boundary. An edit is re-lexed and re-parsed from the
+# first statement it touches until a new statement ends exactly where an old one did,
+# past the edit. The text from there on is unchanged, so the old statements are reused
+# as they are, with their line numbers shifted by the number of lines the edit added or
+# removed. Shifting happens in place: a Program returned before an edit shares those
+# statements and should not be used after it. The nodes of a statement are collected the
+# first time it has to be shifted and kept for later edits.
+
+class IncrementalParser:
+    def __init__(self, source_code):
+        self.source = source_code
+        self.program = None
+        # Offset just past each top-level statement, and the line that offset is on
+        self.ends = []
+        self.end_lines = []
+        # Per top-level statement, its nodes that carry a line, or None until needed
+        self.positioned = []
+        self.parse_all()
+
+    def parse_all(self):
+        statements, self.ends, self.end_lines, _ = self.parse_from(0, 1)
+        self.positioned = [None] * len(statements)
+        self.program = Program(statements, line=1, column=1)
+        return self.program
+
+    def offset(self, line, column):
+        # Source offset of a 1-based line and column, for edits given as positions
+        position = 0
+        for _ in range(line - 1):
+            position = self.source.index('\n', position) + 1
+        return position + column - 1
+
+    def edit(self, start, end, text):
+        # Replaces source[start:end] with text and returns the updated Program
+        if not 0 <= start <= end <= len(self.source):
+            raise IndexError(f"Edit range {start}:{end} is outside the source")
+
+        old_source = self.source
+        self.source = old_source[:start] + text + old_source[end:]
+        if self.program is None:
+            # The previous version did not parse, so there is nothing to reuse
+            return self.parse_all()
+
+        delta = len(text) - (end - start)
+        line_delta = text.count('\n') - old_source.count('\n', start, end)
+
+        # Statements ending at or before the edit are untouched, except that text added
+        # right after an if statement may be its else branch
+        first = bisect_right(self.ends, start)
+        if first > 0 and isinstance(self.program.statements[first - 1], IfStatement):
+            first -= 1
+
+        old_ends = self.ends
+        candidates = iter(range(first, len(old_ends)))
+        candidate = next(candidates, None)
+
+        def resync(offset, column):
+            # Index of the old statement that ends where this new one does, if the rest
+            # of the source can be reused from there
+            nonlocal candidate
+            while candidate is not None and old_ends[candidate] + delta < offset:
+                candidate = next(candidates, None)
+            if candidate is None or old_ends[candidate] < end or old_ends[candidate] + delta != offset:
+                return None
+            old_end = old_ends[candidate]
+            # Statements on the same line after this one would need their columns moved
+            old_column = old_end - old_source.rfind('\n', 0, old_end) - 1
+            if column != old_column and not at_line_end(old_source, old_end):
+                return None
+            return candidate
+
+        region_start = old_ends[first - 1] if first else 0
+        region_line = self.end_lines[first - 1] if first else 1
+        try:
+            statements, ends, end_lines, last = self.parse_from(region_start, region_line, resync)
+        except ValueError:
+            self.program = None
+            raise
+
+        # Everything after the last re-parsed statement is unchanged text
+        reuse = len(old_ends) if last is None else last + 1
+        reused = self.program.statements[reuse:]
+        positioned = self.positioned[reuse:]
+        if line_delta:
+            for index, statement in enumerate(reused):
+                nodes = positioned[index]
+                if nodes is None:
+                    nodes = positioned[index] = positioned_nodes(statement)
+                for node in nodes:
+                    node.line += line_delta
+
+        self.positioned = self.positioned[:first] + [None] * len(statements) + positioned
+        self.ends = old_ends[:first] + ends + [offset + delta for offset in old_ends[reuse:]]
+        self.end_lines = self.end_lines[:first] + end_lines + [line + line_delta for line in self.end_lines[reuse:]]
+        self.program = Program(self.program.statements[:first] + statements + reused, line=1, column=1)
+        return self.program
+
+    def parse_from(self, start, line, resync=None):
+        # Parses top-level statements from offset start, which is on the given line,
+        # until resync accepts a statement's end or the source runs out
+        source = self.source
+        parser = Parser(Lexer(source).tokens(start, line))
+        line_start = source.rfind('\n', 0, start) + 1
+        statements = []
+        ends = []
+        end_lines = []
+
+        while parser.current_token and parser.current_token.type != TokenType.EOF:
+            statement = parser.parse_statement()
+            if statement is None:
+                continue
+
+            # Statements always end in a one-character ';' or '}'
+            last = parser.token_at(parser.position - 1)
+            while line < last.line:
+                line_start = source.index('\n', line_start) + 1
+                line += 1
+            offset = line_start + last.column
+
+            statements.append(statement)
+            ends.append(offset)
+            end_lines.append(last.line)
+
+            if resync is not None:
+                index = resync(offset, last.column)
+                if index is not None:
+                    return statements, ends, end_lines, index
+
+        return statements, ends, end_lines, None
+
+def at_line_end(source, offset):
+    # Whether nothing but whitespace or a line comment follows offset on its line
+    newline = source.find('\n', offset)
+    rest = source[offset:newline if newline != -1 else len(source)].strip()
+    return not rest or rest.startswith('//')
+
+def positioned_nodes(statement):
+    # Keyed by identity: compound array assignments share their target between two parents
+    nodes = {}
+    for node in walk(statement):
+        if node.line is not None:
+            nodes[id(node)] = node
+    return list(nodes.values())
@@ -1,26 +1,66 @@
+import itertools
+from collections import OrderedDict
 from ast_nodes import *
+from resolver import Resolver
+from errors import RuntimeError
+from typed_arrays import (TypedArray, ARRAY_TYPES, FLOAT, INT, make_array, array_sum, array_fill,
+                          array_scale, array_dot, array_cumsum, array_minmax)
+from sequences import Range
+from ropes import Rope, StringBuilder, STRING_TYPES, concat
 
-class RuntimeError(Exception):
-    def __init__(self, message, line=None, column=None):
-        self.message = message
-        self.line = line
-        self.column = column
-        super().__init__(f"RuntimeError at line {line}, column {column}: {message}")
+# Completion signals returned by statements. Normal completion is None; only real
+# errors are raised.
+BREAK = object()
+CONTINUE = object()
+
+class ReturnSignal:
+    __slots__ = ('value',)
 
-class ReturnException(Exception):
     def __init__(self, value):
         self.value = value
 
-class BreakException(Exception):
-    pass
-
-class ContinueException(Exception):
-    pass
-
+# Returned by `return f(...)` in place of calling f; the enclosing Function.call runs f
+# next in its own loop, so tail calls take no Python stack
+class TailCall:
+    __slots__ = ('function', 'arguments')
+
+    def __init__(self, function, arguments):
+        self.function = function
+        self.arguments = arguments
+
+# Value of a local slot whose declaration has not run yet
+UNSET = object()
+
+# Values that can be indexed and sliced, and those a for-in loop can walk. Maps are
+# dicts and sets are Python sets; loops over them walk a snapshot of the keys or elements.
+# Boolean and float keys and elements are stored as TypedKeys.
+SEQUENCE_TYPES = ARRAY_TYPES + (Range,)
+COLLECTION_TYPES = (dict, set)
+ITERABLE_TYPES = SEQUENCE_TYPES + STRING_TYPES + COLLECTION_TYPES
+
+# Events a hook can be registered for, and the arguments its callbacks receive:
+#   node       (node)                 every node evaluated
+#   statement  (node)                 every statement, blocks included, before it runs
+#   call       (function, arguments)  a user function is about to be called
+#   return     (function, value)      a user function returned normally
+#   builtin    (name, arguments)      a builtin is about to be called
+HOOK_EVENTS = ('node', 'statement', 'call', 'return', 'builtin')
+
+ENVIRONMENT_VERSIONS = itertools.count()
+
+# Globals (including builtins) live in an Environment; locals live in scope lists
+# laid out by the resolver: [parent_scope, slot1, slot2, ...]
 class Environment:
     def __init__(self, parent=None):
         self.variables = {}
         self.parent = parent
+        # Inline caches on Variable and FunctionCall nodes remember a global's value along
+        # with the version it was read at. Rebinding a name some cache has read (a watched
+        # name) moves the environment to a new version, which invalidates every cache.
+        # Versions come from one counter, so nodes shared between interpreters cannot
+        # mistake another environment's version for their own.
+        self.version = next(ENVIRONMENT_VERSIONS)
+        self.watched = set()
 
     def get(self, name):
         if name in self.variables:
@@ -34,6 +74,8 @@ class Environment:
     def set(self, name, value):
         if name in self.variables:
             self.variables[name] = value
+            if name in self.watched:
+                self.version = next(ENVIRONMENT_VERSIONS)
         elif self.parent:
             self.parent.set(name, value)
         else:
@@ -41,12 +83,145 @@ class Environment:
 
     def define(self, name, value):
         self.variables[name] = value
+        if name in self.watched:
+            self.version = next(ENVIRONMENT_VERSIONS)
+
+class DispatchTable(dict):
+    # Maps a node class to the visitor method that evaluates it. Node types without an
+    # entry fall back to accept() and are cached on first use.
+    def __init__(self, visitor, handlers):
+        super().__init__(handlers)
+        self.visitor = visitor
+
+    def __missing__(self, node_class):
+        visitor = self.visitor
+        handler = lambda node: node.accept(visitor)
+        self[node_class] = handler
+        return handler
 
 class Interpreter:
+    # Whether the engine evaluates through self.dispatch and so can run hooks
+    supports_hooks = True
+
     def __init__(self):
         self.environment = Environment()
+        self.scope = None
+        self.hooks = {event: [] for event in HOOK_EVENTS}
+        # Functions wrapped by memoize(), for --stats
+        self.memoized = []
+        self.dispatch = self.build_dispatch()
         self.setup_builtins()
 
+    def build_dispatch(self):
+        dispatch = DispatchTable(self, {
+            Program: self.visit_program,
+            VariableDeclaration: self.visit_variable_declaration,
+            Assignment: self.visit_assignment,
+            IfStatement: self.visit_if_statement,
+            WhileStatement: self.visit_while_statement,
+            ForStatement: self.visit_for_statement,
+            ForInStatement: self.visit_for_in_statement,
+            BreakStatement: self.visit_break_statement,
+            ContinueStatement: self.visit_continue_statement,
+            FunctionDefinition: self.visit_function_definition,
+            ReturnStatement: self.visit_return_statement,
+            BlockStatement: self.visit_block_statement,
+            ExpressionStatement: self.visit_expression_statement,
+            BinaryExpression: self.visit_binary_expression,
+            Add: self.visit_add,
+            Subtract: self.visit_subtract,
+            Multiply: self.visit_multiply,
+            Divide: self.visit_divide,
+            Modulo: self.visit_modulo,
+            Equal: self.visit_equal,
+            NotEqual: self.visit_not_equal,
+            Less: self.visit_less,
+            Greater: self.visit_greater,
+            LessEqual: self.visit_less_equal,
+            GreaterEqual: self.visit_greater_equal,
+            In: self.visit_in,
+            And: self.visit_and,
+            Or: self.visit_or,
+            UnaryExpression: self.visit_unary_expression,
+            Not: self.visit_not,
+            Negate: self.visit_negate,
+            Literal: self.visit_literal,
+            BooleanLiteral: self.visit_literal,
+            NumberLiteral: self.visit_literal,
+            StringLiteral: self.visit_literal,
+            Variable: self.visit_variable,
+            FunctionCall: self.visit_function_call,
+            ArrayLiteral: self.visit_array_literal,
+            MapLiteral: self.visit_map_literal,
+            SetLiteral: self.visit_set_literal,
+            ArrayAccess: self.visit_array_access,
+            ArrayAssignment: self.visit_array_assignment,
+            PrefixIncrement: self.visit_prefix_increment,
+            PrefixDecrement: self.visit_prefix_decrement,
+            PostfixIncrement: self.visit_postfix_increment,
+            PostfixDecrement: self.visit_postfix_decrement,
+        })
+        # Whether Function.call must report the functions it runs through tail calls
+        self.observes_calls = bool(self.hooks['call'] or self.hooks['return'])
+        if any(self.hooks.values()):
+            self.install_hooks(dispatch)
+        return dispatch
+
+    # Hooks are installed by rebuilding the dispatch table with wrapped handlers, so an
+    # interpreter without any pays nothing for them. Registering or removing a hook
+    # while a script runs takes effect for the nodes visited afterwards.
+    def add_hook(self, event, callback):
+        if event not in self.hooks:
+            raise ValueError(f"Unknown hook event '{event}'; expected one of {', '.join(HOOK_EVENTS)}")
+        if not self.supports_hooks:
+            raise TypeError(f"{self.__class__.__name__} does not run execution hooks")
+        self.hooks[event].append(callback)
+        self.dispatch = self.build_dispatch()
+        return callback
+
+    def remove_hook(self, event, callback):
+        self.hooks[event].remove(callback)
+        self.dispatch = self.build_dispatch()
+
+    def on_node(self, callback):
+        return self.add_hook('node', callback)
+
+    def on_statement(self, callback):
+        return self.add_hook('statement', callback)
+
+    def on_call(self, callback):
+        return self.add_hook('call', callback)
+
+    def on_return(self, callback):
+        return self.add_hook('return', callback)
+
+    def on_builtin(self, callback):
+        return self.add_hook('builtin', callback)
+
+    def install_hooks(self, dispatch):
+        hooks = self.hooks
+        if hooks['call'] or hooks['return'] or hooks['builtin']:
+            dispatch[FunctionCall] = self.visit_hooked_function_call
+
+        node_hooks = hooks['node']
+        statement_hooks = hooks['statement']
+        if node_hooks:
+            dispatch[ReturnStatement] = self.visit_hooked_return_statement
+
+        def hooked(handler, callbacks):
+            def run(node):
+                for callback in callbacks:
+                    callback(node)
+                return handler(node)
+            return run
+
+        for node_class, handler in list(dispatch.items()):
+            callbacks = list(node_hooks)
+            if issubclass(node_class, Statement) and node_class is not Program:
+                callbacks.extend(statement_hooks)
+            if callbacks:
+                dispatch[node_class] = hooked(handler, callbacks)
+
     def setup_builtins(self):
         # Built-in functions
         self.environment.define('print', self.builtin_print)
@@ -63,6 +238,16 @@ class Interpreter:
         self.environment.define('join', self.builtin_join)
         self.environment.define('slice', self.builtin_slice)
 
+        # Typed arrays and bulk array functions
+        self.environment.define('farray', self.builtin_farray)
+        self.environment.define('iarray', self.builtin_iarray)
+        self.environment.define('sum', self.builtin_sum)
+        self.environment.define('fill', self.builtin_fill)
+        self.environment.define('scale', self.builtin_scale)
+        self.environment.define('dot', self.builtin_dot)
+        self.environment.define('cumsum', self.builtin_cumsum)
+        self.environment.define('minmax', self.builtin_minmax)
+
         # Math functions
         self.environment.define('abs', self.builtin_abs)
         self.environment.define('pow', self.builtin_pow)
@@ -81,199 +266,436 @@ class Interpreter:
         self.environment.define('toupper', self.builtin_toupper)
         self.environment.define('startswith', self.builtin_startswith)
         self.environment.define('endswith', self.builtin_endswith)
+        self.environment.define('stringbuilder', self.builtin_stringbuilder)
 
         # Utility functions
         self.environment.define('range', self.builtin_range)
         self.environment.define('type', self.builtin_type)
+        self.environment.define('memoize', self.builtin_memoize)
+        self.environment.define('memostats', self.builtin_memostats)
+        self.environment.define('pmap', self.builtin_pmap)
+
+        # Map and set functions
+        self.environment.define('set', self.builtin_set)
+        self.environment.define('keys', self.builtin_keys)
+        self.environment.define('values', self.builtin_values)
+        self.environment.define('has', self.builtin_has)
+        self.environment.define('add', self.builtin_add)
+        self.environment.define('remove', self.builtin_remove)
+
+    def resolve(self, program):
+        if not program.resolved:
+            Resolver(self.environment.variables).resolve(program)
+        return program
 
     def interpret(self, program):
-        try:
-            return self.visit_program(program)
-        except ReturnException as e:
-            return e.value
-        except (BreakException, ContinueException):
+        self.resolve(program)
+        signal = self.visit_program(program)
+
+        if signal is BREAK or signal is CONTINUE:
             raise RuntimeError("break or continue outside of loop")
+        if signal is not None:
+            return signal.value
+        return None
 
     def visit_program(self, node):
-        result = None
+        dispatch = self.dispatch
         for statement in node.statements:
-            result = statement.accept(self)
-        return result
+            signal = dispatch[statement.__class__](statement)
+            if signal is not None:
+                return signal
+        return None
+
+    def lookup(self, node):
+        if node.slot is None:
+            return self.environment.get(node.name)
+
+        scope = self.scope
+        for _ in range(node.depth):
+            scope = scope[0]
+        value = scope[node.slot]
+        if value is UNSET:
+            return fallback_value(node.name, node.fallback, self.scope, self.environment)
+        return value
+
+    def store(self, node, value):
+        if node.slot is None:
+            self.environment.set(node.name, value)
+            return
+
+        scope = self.scope
+        for _ in range(node.depth):
+            scope = scope[0]
+        if node.depth and scope[node.slot] is UNSET:
+            fallback_store(node.name, node.fallback, self.scope, self.environment, value)
+            return
+        scope[node.slot] = value
+
+    def declare(self, node, value):
+        if node.slot is None:
+            self.environment.define(node.name, value)
+        else:
+            self.scope[node.slot] = value
 
     def visit_variable_declaration(self, node):
-        value = node.value.accept(self) if node.value else None
-        self.environment.define(node.name, value)
+        value = self.dispatch[node.value.__class__](node.value) if node.value else None
+        self.declare(node, value)
 
     def visit_assignment(self, node):
-        value = node.value.accept(self)
-        self.environment.set(node.name, value)
+        value = self.dispatch[node.value.__class__](node.value)
+        self.store(node, value)
 
     def visit_if_statement(self, node):
-        condition = node.condition.accept(self)
+        dispatch = self.dispatch
+        condition = dispatch[node.condition.__class__](node.condition)
 
         if self.is_truthy(condition):
-            return node.then_block.accept(self)
+            return dispatch[node.then_block.__class__](node.then_block)
         elif node.else_block:
-            return node.else_block.accept(self)
+            return dispatch[node.else_block.__class__](node.else_block)
 
         return None
 
     def visit_while_statement(self, node):
-        while self.is_truthy(node.condition.accept(self)):
-            try:
-                node.body.accept(self)
-            except BreakException:
+        dispatch = self.dispatch
+        condition = node.condition
+        body = node.body
+        is_truthy = self.is_truthy
+        while True:
+            value = dispatch[condition.__class__](condition)
+            if value is not True and not is_truthy(value):
                 break
-            except ContinueException:
-                continue
-            except RuntimeError:
-                raise  # Re-raise runtime errors
+
+            signal = dispatch[body.__class__](body)
+            if signal is not None:
+                if signal is BREAK:
+                    break
+                if signal is not CONTINUE:
+                    return signal
 
         return None
 
     def visit_for_statement(self, node):
+        dispatch = self.dispatch
+        condition = node.condition
+        increment = node.increment
+        body = node.body
+
         # Execute initializer
         if node.initializer:
-            node.initializer.accept(self)
+            dispatch[node.initializer.__class__](node.initializer)
 
         while True:
             # Check condition
-            if node.condition:
-                if not self.is_truthy(node.condition.accept(self)):
+            if condition:
+                value = dispatch[condition.__class__](condition)
+                if value is not True and not self.is_truthy(value):
                     break
             else:
                 # No condition means infinite loop (condition is always true)
                 pass
 
-            try:
-                # Execute body
-                node.body.accept(self)
-            except BreakException:
-                break
-            except ContinueException:
-                # Execute increment and continue
-                if node.increment:
-                    node.increment.accept(self)
-                continue
-            except RuntimeError:
-                raise  # Re-raise runtime errors
+            # Execute body; continue falls through to the increment
+            signal = dispatch[body.__class__](body)
+            if signal is not None:
+                if signal is BREAK:
+                    break
+                if signal is not CONTINUE:
+                    return signal
 
             # Execute increment
-            if node.increment:
-                node.increment.accept(self)
+            if increment:
+                dispatch[increment.__class__](increment)
+
+        return None
+
+    def visit_for_in_statement(self, node):
+        dispatch = self.dispatch
+        iterable = dispatch[node.iterable.__class__](node.iterable)
+        if not isinstance(iterable, ITERABLE_TYPES):
+            raise RuntimeError(f"Cannot iterate over a {self.builtin_type(iterable)} value")
+        if isinstance(iterable, COLLECTION_TYPES):
+            iterable = collection_items(iterable)
+
+        body = node.body
+        run_body = dispatch[body.__class__]
+        slot = node.slot
+        environment = self.environment
+        variables = environment.variables
+        watched = environment.watched
+        name = node.name
+        for value in iterable:
+            if slot is None:
+                variables[name] = value
+                if name in watched:
+                    environment.version = next(ENVIRONMENT_VERSIONS)
+            else:
+                self.scope[slot] = value
+
+            signal = run_body(body)
+            if signal is not None:
+                if signal is BREAK:
+                    break
+                if signal is not CONTINUE:
+                    return signal
 
         return None
 
     def visit_break_statement(self, node):
-        raise BreakException()
+        return BREAK
 
     def visit_continue_statement(self, node):
-        raise ContinueException()
+        return CONTINUE
 
     def visit_function_definition(self, node):
-        func = Function(node.name, node.parameters, node.body, self.environment)
-        self.environment.define(node.name, func)
+        func = Function(node.name, node.parameters, node.body, self.scope, node.frame_size)
+        self.declare(node, func)
 
     def visit_return_statement(self, node):
-        value = None
-        if node.value:
-            value = node.value.accept(self)
-        raise ReturnException(value)
+        value = node.value
+        if value is None:
+            return ReturnSignal(None)
+        if node.tail_call:
+            if value.cache_version == self.environment.version:
+                func = value.cached_value
+            else:
+                func = self.lookup(value)
+            if func.__class__ is Function:
+                dispatch = self.dispatch
+                return TailCall(func, [dispatch[arg.__class__](arg) for arg in value.arguments])
+        return ReturnSignal(self.dispatch[value.__class__](value))
+
+    def visit_hooked_return_statement(self, node):
+        # A tail call evaluates its call node without dispatching it, so node hooks are
+        # told about it here
+        signal = self.visit_return_statement(node)
+        if signal.__class__ is TailCall:
+            for callback in self.hooks['node']:
+                callback(node.value)
+        return signal
+
+    # Function.call runs tail calls in a loop instead of through visit_function_call. When
+    # observes_calls is set it reports each function it enters that way, and once the
+    # chain ends, all of them at once, innermost first. value is UNSET if it ended in an
+    # error, which return hooks are not told about.
+    def enter_tail_call(self, function, arguments):
+        for callback in self.hooks['call']:
+            callback(function, arguments)
+
+    def exit_tail_calls(self, functions, value):
+        if value is UNSET:
+            return
+        return_hooks = self.hooks['return']
+        for function in reversed(functions):
+            for callback in return_hooks:
+                callback(function, value)
 
     def visit_block_statement(self, node):
-        previous_env = self.environment
-        self.environment = Environment(previous_env)
+        dispatch = self.dispatch
+        if not node.frame_size:
+            for statement in node.statements:
+                signal = dispatch[statement.__class__](statement)
+                if signal is not None:
+                    return signal
+            return None
 
-        result = None
-        for statement in node.statements:
-            result = statement.accept(self)
+        previous_scope = self.scope
+        self.scope = [previous_scope] + [UNSET] * node.frame_size
 
-        self.environment = previous_env
-        return result
+        try:
+            for statement in node.statements:
+                signal = dispatch[statement.__class__](statement)
+                if signal is not None:
+                    return signal
+            return None
+        finally:
+            self.scope = previous_scope
 
     def visit_expression_statement(self, node):
-        return node.expression.accept(self)
+        self.dispatch[node.expression.__class__](node.expression)
 
     def visit_binary_expression(self, node):
-        left = node.left.accept(self)
-        right = node.right.accept(self)
-
-        if node.operator == '+':
-            if isinstance(left, str) or isinstance(right, str):
-                return str(left) + str(right)
-            return left + right
-        elif node.operator == '-':
-            return left - right
-        elif node.operator == '*':
-            return left * right
-        elif node.operator == '/':
-            if right == 0:
-                raise RuntimeError("Division by zero")
-            return left / right
-        elif node.operator == '%':
-            return left % right
-        elif node.operator == '==':
-            return left == right
-        elif node.operator == '!=':
-            return left != right
-        elif node.operator == '<':
-            return left < right
-        elif node.operator == '>':
-            return left > right
-        elif node.operator == '<=':
-            return left <= right
-        elif node.operator == '>=':
-            return left >= right
-        elif node.operator == '&&':
-            return self.is_truthy(left) and self.is_truthy(right)
-        elif node.operator == '||':
-            return self.is_truthy(left) or self.is_truthy(right)
-
-        raise RuntimeError(f"Unknown operator: {node.operator}")
+        # Generic nodes, e.g. built by hand rather than by the parser
+        node_class = BINARY_NODES.get(node.operator)
+        if node_class is None:
+            raise RuntimeError(f"Unknown operator: {node.operator}")
+        return self.dispatch[node_class](node)
+
+    def visit_add(self, node):
+        dispatch = self.dispatch
+        left = dispatch[node.left.__class__](node.left)
+        right = dispatch[node.right.__class__](node.right)
+        if isinstance(left, str) or isinstance(right, str):
+            return concat(left, right)
+        return left + right
+
+    def visit_subtract(self, node):
+        dispatch = self.dispatch
+        return dispatch[node.left.__class__](node.left) - dispatch[node.right.__class__](node.right)
+
+    def visit_multiply(self, node):
+        dispatch = self.dispatch
+        return dispatch[node.left.__class__](node.left) * dispatch[node.right.__class__](node.right)
+
+    def visit_divide(self, node):
+        dispatch = self.dispatch
+        left = dispatch[node.left.__class__](node.left)
+        right = dispatch[node.right.__class__](node.right)
+        # A typed array divisor compares element-wise; its zeros are checked on division
+        if right == 0 and right.__class__ is not TypedArray:
+            raise RuntimeError("Division by zero")
+        return left / right
+
+    def visit_modulo(self, node):
+        dispatch = self.dispatch
+        return dispatch[node.left.__class__](node.left) % dispatch[node.right.__class__](node.right)
+
+    def visit_equal(self, node):
+        dispatch = self.dispatch
+        return dispatch[node.left.__class__](node.left) == dispatch[node.right.__class__](node.right)
+
+    def visit_not_equal(self, node):
+        dispatch = self.dispatch
+        return dispatch[node.left.__class__](node.left) != dispatch[node.right.__class__](node.right)
+
+    def visit_less(self, node):
+        dispatch = self.dispatch
+        return dispatch[node.left.__class__](node.left) < dispatch[node.right.__class__](node.right)
+
+    def visit_greater(self, node):
+        dispatch = self.dispatch
+        return dispatch[node.left.__class__](node.left) > dispatch[node.right.__class__](node.right)
+
+    def visit_less_equal(self, node):
+        dispatch = self.dispatch
+        return dispatch[node.left.__class__](node.left) <= dispatch[node.right.__class__](node.right)
+
+    def visit_greater_equal(self, node):
+        dispatch = self.dispatch
+        return dispatch[node.left.__class__](node.left) >= dispatch[node.right.__class__](node.right)
+
+    def visit_in(self, node):
+        dispatch = self.dispatch
+        value = dispatch[node.left.__class__](node.left)
+        return contains(dispatch[node.right.__class__](node.right), value)
+
+    # Logical operators short-circuit: the right operand is only evaluated when needed
+    def visit_and(self, node):
+        dispatch = self.dispatch
+        if not self.is_truthy(dispatch[node.left.__class__](node.left)):
+            return False
+        return self.is_truthy(dispatch[node.right.__class__](node.right))
+
+    def visit_or(self, node):
+        dispatch = self.dispatch
+        if self.is_truthy(dispatch[node.left.__class__](node.left)):
+            return True
+        return self.is_truthy(dispatch[node.right.__class__](node.right))
 
     def visit_unary_expression(self, node):
-        operand = node.operand.accept(self)
+        node_class = UNARY_NODES.get(node.operator)
+        if node_class is None:
+            raise RuntimeError(f"Unknown unary operator: {node.operator}")
+        return self.dispatch[node_class](node)
 
-        if node.operator == '!':
-            return not self.is_truthy(operand)
-        elif node.operator == '-':
-            return -operand
+    def visit_not(self, node):
+        return not self.is_truthy(self.dispatch[node.operand.__class__](node.operand))
 
-        raise RuntimeError(f"Unknown unary operator: {node.operator}")
+    def visit_negate(self, node):
+        return -self.dispatch[node.operand.__class__](node.operand)
 
     def visit_literal(self, node):
         return node.value
 
     def visit_variable(self, node):
-        return self.environment.get(node.name)
+        # Fast paths for globals and the innermost scope; lookup() handles the rest
+        if node.slot is None:
+            environment = self.environment
+            if node.cache_version == environment.version:
+                return node.cached_value
+            variables = environment.variables
+            if node.name in variables:
+                value = variables[node.name]
+                # Functions and builtins are cached; other globals are rebound too often
+                if callable(value):
+                    environment.watched.add(node.name)
+                    node.cache_version = environment.version
+                    node.cached_value = value
+                return value
+        elif node.depth == 0:
+            value = self.scope[node.slot]
+            if value is not UNSET:
+                return value
+        return self.lookup(node)
 
     def visit_function_call(self, node):
-        func = self.environment.get(node.name)
+        environment = self.environment
+        if node.cache_version == environment.version:
+            func = node.cached_value
+            is_function = node.cached_is_function
+        else:
+            func = self.lookup(node)
+            if not callable(func):
+                raise RuntimeError(f"'{node.name}' is not a function")
+            is_function = isinstance(func, Function)
+            if node.slot is None:
+                environment.watched.add(node.name)
+                node.cache_version = environment.version
+                node.cached_value = func
+                node.cached_is_function = is_function
+
+        dispatch = self.dispatch
+        arguments = [dispatch[arg.__class__](arg) for arg in node.arguments]
+
+        if is_function:
+            return func(self, arguments)
+        else:
+            # Built-in function
+            return func(*arguments)
+
+    def visit_hooked_function_call(self, node):
+        func = self.lookup(node)
 
         if not callable(func):
             raise RuntimeError(f"'{node.name}' is not a function")
 
-        arguments = []
-        for arg in node.arguments:
-            arguments.append(arg.accept(self))
+        dispatch = self.dispatch
+        arguments = [dispatch[arg.__class__](arg) for arg in node.arguments]
 
+        hooks = self.hooks
         if isinstance(func, Function):
-            return func(self, arguments)
-        else:
-            # Built-in function
-            return func(*arguments)
+            for callback in hooks['call']:
+                callback(func, arguments)
+            value = func(self, arguments)
+            for callback in hooks['return']:
+                callback(func, value)
+            return value
+
+        for callback in hooks['builtin']:
+            callback(node.name, arguments)
+        return func(*arguments)
 
     def visit_array_literal(self, node):
-        elements = []
-        for element in node.elements:
-            elements.append(element.accept(self))
-        return elements
+        dispatch = self.dispatch
+        return [dispatch[element.__class__](element) for element in node.elements]
+
+    def visit_map_literal(self, node):
+        dispatch = self.dispatch
+        return make_map([dispatch[key.__class__](key) for key in node.keys],
+                        [dispatch[value.__class__](value) for value in node.values])
+
+    def visit_set_literal(self, node):
+        dispatch = self.dispatch
+        return make_set([dispatch[element.__class__](element) for element in node.elements])
 
     def visit_array_access(self, node):
-        array = node.array.accept(self)
-        index = node.index.accept(self)
+        dispatch = self.dispatch
+        array = dispatch[node.array.__class__](node.array)
+        index = dispatch[node.index.__class__](node.index)
 
-        if not isinstance(array, list):
+        if not isinstance(array, SEQUENCE_TYPES):
+            if array.__class__ is dict:
+                return map_get(array, index)
             raise RuntimeError("Cannot index into non-array value")
 
         if not isinstance(index, int):
@@ -285,11 +707,15 @@ class Interpreter:
         return array[index]
 
     def visit_array_assignment(self, node):
-        array = node.array.accept(self)
-        index = node.index.accept(self)
-        value = node.value.accept(self)
-
-        if not isinstance(array, list):
+        dispatch = self.dispatch
+        array = dispatch[node.array.__class__](node.array)
+        index = dispatch[node.index.__class__](node.index)
+        value = dispatch[node.value.__class__](node.value)
+
+        if not isinstance(array, SEQUENCE_TYPES):
+            if array.__class__ is dict:
+                map_set(array, index, value)
+                return
             raise RuntimeError("Cannot index into non-array value")
 
         if not isinstance(index, int):
@@ -298,48 +724,47 @@ class Interpreter:
         if index < 0 or index >= len(array):
             raise RuntimeError(f"Array index {index} out of bounds")
 
-        array[index] = value
+        try:
+            array[index] = value
+        except (TypeError, OverflowError):
+            raise RuntimeError(element_error(array, value))
 
     def visit_prefix_increment(self, node):
         if not isinstance(node.operand, Variable):
             raise RuntimeError("Increment operator requires a variable")
-        var_name = node.operand.name
-        current_value = self.environment.get(var_name)
+        current_value = self.lookup(node.operand)
         if not isinstance(current_value, (int, float)):
             raise RuntimeError("Increment operator requires a numeric value")
         new_value = current_value + 1
-        self.environment.set(var_name, new_value)
+        self.store(node.operand, new_value)
         return new_value
 
     def visit_prefix_decrement(self, node):
         if not isinstance(node.operand, Variable):
             raise RuntimeError("Decrement operator requires a variable")
-        var_name = node.operand.name
-        current_value = self.environment.get(var_name)
+        current_value = self.lookup(node.operand)
         if not isinstance(current_value, (int, float)):
             raise RuntimeError("Decrement operator requires a numeric value")
         new_value = current_value - 1
-        self.environment.set(var_name, new_value)
+        self.store(node.operand, new_value)
         return new_value
 
     def visit_postfix_increment(self, node):
         if not isinstance(node.operand, Variable):
             raise RuntimeError("Increment operator requires a variable")
-        var_name = node.operand.name
-        current_value = self.environment.get(var_name)
+        current_value = self.lookup(node.operand)
         if not isinstance(current_value, (int, float)):
             raise RuntimeError("Increment operator requires a numeric value")
-        self.environment.set(var_name, current_value + 1)
+        self.store(node.operand, current_value + 1)
         return current_value
 
     def visit_postfix_decrement(self, node):
         if not isinstance(node.operand, Variable):
             raise RuntimeError("Decrement operator requires a variable")
-        var_name = node.operand.name
-        current_value = self.environment.get(var_name)
+        current_value = self.lookup(node.operand)
         if not isinstance(current_value, (int, float)):
             raise RuntimeError("Decrement operator requires a numeric value")
-        self.environment.set(var_name, current_value - 1)
+        self.store(node.operand, current_value - 1)
         return current_value
 
     def is_truthy(self, value):
@@ -369,6 +794,8 @@ class Interpreter:
         return str(obj)
 
     def builtin_int(self, obj):
+        if isinstance(obj, Rope):
+            obj = str(obj)
         try:
             return int(obj)
         except (ValueError, TypeError):
@@ -379,30 +806,108 @@ class Interpreter:
 
     # Array built-in functions
     def builtin_push(self, array, value):
-        if not isinstance(array, list):
-            raise RuntimeError("push() requires an array as first argument")
-        array.append(value)
+        if isinstance(array, StringBuilder):
+            array.append(str(value))
+            return array
+        if not isinstance(array, SEQUENCE_TYPES):
+            raise RuntimeError("push() requires an array or a string builder as first argument")
+        try:
+            array.append(value)
+        except (TypeError, OverflowError):
+            raise RuntimeError(element_error(array, value))
         return array
 
     def builtin_pop(self, array):
-        if not isinstance(array, list):
+        if not isinstance(array, SEQUENCE_TYPES):
             raise RuntimeError("pop() requires an array as argument")
         if len(array) == 0:
             raise RuntimeError("Cannot pop from empty array")
         return array.pop()
 
     def builtin_join(self, array, separator=""):
-        if not isinstance(array, list):
+        if not isinstance(array, SEQUENCE_TYPES):
             raise RuntimeError("join() requires an array as first argument")
         return separator.join(str(item) for item in array)
 
     def builtin_slice(self, array, start=0, end=None):
-        if not isinstance(array, list):
+        if not isinstance(array, SEQUENCE_TYPES):
             raise RuntimeError("slice() requires an array as first argument")
         if end is None:
             end = len(array)
+        if isinstance(array, TypedArray):
+            return TypedArray(array.typecode, array[start:end])
         return array[start:end]
 
+    # Typed arrays: farray(n) and iarray(n) make n zeros (or n copies of a second
+    # argument); given an array instead of a size, they copy and convert it
+    def builtin_farray(self, source, value=0.0):
+        return self.make_typed_array(FLOAT, source, value)
+
+    def builtin_iarray(self, source, value=0):
+        return self.make_typed_array(INT, source, value)
+
+    def make_typed_array(self, typecode, source, value):
+        name = 'farray' if typecode == FLOAT else 'iarray'
+        try:
+            if isinstance(source, SEQUENCE_TYPES):
+                return TypedArray(typecode, source)
+            if isinstance(source, int) and not isinstance(source, bool):
+                if source < 0:
+                    raise RuntimeError(f"{name}() size must not be negative")
+                return make_array(typecode, source, value)
+        except (TypeError, OverflowError) as e:
+            raise RuntimeError(f"{name}(): {e}")
+        raise RuntimeError(f"{name}() requires a size or an array")
+
+    def numeric_array(self, name, values):
+        if not isinstance(values, SEQUENCE_TYPES):
+            raise RuntimeError(f"{name}() requires an array")
+        return values
+
+    def builtin_sum(self, values):
+        try:
+            return array_sum(self.numeric_array('sum', values))
+        except TypeError:
+            raise RuntimeError("sum() requires an array of numbers")
+
+    def builtin_fill(self, values, value):
+        try:
+            return array_fill(self.numeric_array('fill', values), value)
+        except (TypeError, OverflowError) as e:
+            raise RuntimeError(f"fill(): {e}")
+
+    def builtin_scale(self, values, factor):
+        if isinstance(factor, bool) or not isinstance(factor, (int, float)):
+            raise RuntimeError("scale() requires a numeric factor")
+        try:
+            return array_scale(self.numeric_array('scale', values), factor)
+        except (TypeError, OverflowError) as e:
+            raise RuntimeError(f"scale(): {e}")
+
+    def builtin_dot(self, left, right):
+        self.numeric_array('dot', left)
+        self.numeric_array('dot', right)
+        if len(left) != len(right):
+            raise RuntimeError(f"dot() requires arrays of the same length, got {len(left)} and {len(right)}")
+        try:
+            return array_dot(left, right)
+        except TypeError:
+            raise RuntimeError("dot() requires arrays of numbers")
+
+    def builtin_cumsum(self, values):
+        try:
+            return array_cumsum(self.numeric_array('cumsum', values))
+        except (TypeError, OverflowError):
+            raise RuntimeError("cumsum() requires an array of numbers")
+
+    def builtin_minmax(self, values):
+        if not len(self.numeric_array('minmax', values)):
+            raise RuntimeError("minmax() of an empty array")
+        try:
+            return array_minmax(values)
+        except TypeError:
+            raise RuntimeError("minmax() requires an array of numbers")
+
     # Math functions
     def builtin_abs(self, x):
         try:
@@ -464,8 +969,9 @@ class Interpreter:
 
     # String functions
     def builtin_substring(self, s, start, end=None):
-        if not isinstance(s, str):
+        if not isinstance(s, STRING_TYPES):
             raise RuntimeError("substring() requires a string as first argument")
+        s = str(s)
         try:
             if end is None:
                 return s[int(start):]
@@ -475,42 +981,45 @@ class Interpreter:
             raise RuntimeError("substring() requires integer start and end arguments")
 
     def builtin_replace(self, s, old, new):
-        if not isinstance(s, str):
+        if not isinstance(s, STRING_TYPES):
             raise RuntimeError("replace() requires a string as first argument")
         return str(s).replace(str(old), str(new))
 
     def builtin_split(self, s, separator=" "):
-        if not isinstance(s, str):
+        if not isinstance(s, STRING_TYPES):
             raise RuntimeError("split() requires a string as first argument")
         return str(s).split(str(separator))
 
     def builtin_tolower(self, s):
-        if not isinstance(s, str):
+        if not isinstance(s, STRING_TYPES):
             raise RuntimeError("tolower() requires a string argument")
         return str(s).lower()
 
     def builtin_toupper(self, s):
-        if not isinstance(s, str):
+        if not isinstance(s, STRING_TYPES):
             raise RuntimeError("toupper() requires a string argument")
         return str(s).upper()
 
     def builtin_startswith(self, s, prefix):
-        if not isinstance(s, str):
+        if not isinstance(s, STRING_TYPES):
             raise RuntimeError("startswith() requires a string as first argument")
         return str(s).startswith(str(prefix))
 
     def builtin_endswith(self, s, suffix):
-        if not isinstance(s, str):
+        if not isinstance(s, STRING_TYPES):
             raise RuntimeError("endswith() requires a string as first argument")
         return str(s).endswith(str(suffix))
 
+    def builtin_stringbuilder(self, text=""):
+        return StringBuilder(str(text))
+
     # Utility functions
     def builtin_range(self, start, end=None, step=1):
         try:
             if end is None:
-                return list(range(int(start)))
+                return Range(range(int(start)))
             else:
-                return list(range(int(start), int(end), int(step)))
+                return Range(range(int(start), int(end), int(step)))
         except (ValueError, TypeError):
             raise RuntimeError("range() requires integer arguments")
 
@@ -521,41 +1030,285 @@ class Interpreter:
             return "boolean"
         elif isinstance(obj, (int, float)):
             return "number"
-        elif isinstance(obj, str):
+        elif isinstance(obj, STRING_TYPES):
             return "string"
-        elif isinstance(obj, list):
+        elif isinstance(obj, StringBuilder):
+            return "stringbuilder"
+        elif isinstance(obj, (list, Range)):
+            # range() arrays are lazy, but still arrays to the language
             return "array"
+        elif isinstance(obj, TypedArray):
+            return obj.type_name()
+        elif isinstance(obj, dict):
+            return "map"
+        elif isinstance(obj, set):
+            return "set"
         elif isinstance(obj, Function):
             return "function"
         else:
             return "object"
 
+    # Map and set functions
+    def builtin_set(self, values=None):
+        if values is None:
+            return set()
+        if not isinstance(values, ITERABLE_TYPES):
+            raise RuntimeError("set() requires an array, string, map or set")
+        return make_set(values)
+
+    def builtin_keys(self, mapping):
+        if not isinstance(mapping, dict):
+            raise RuntimeError("keys() requires a map")
+        return collection_items(mapping)
+
+    def builtin_values(self, mapping):
+        if not isinstance(mapping, dict):
+            raise RuntimeError("values() requires a map")
+        return list(mapping.values())
+
+    def builtin_has(self, collection, value):
+        return contains(collection, value)
+
+    def builtin_add(self, elements, value):
+        if not isinstance(elements, set):
+            raise RuntimeError("add() requires a set as first argument")
+        elements.add(hashable(value, "Set elements"))
+        return elements
+
+    def builtin_remove(self, collection, value):
+        # True if the key or element was there
+        if not isinstance(collection, COLLECTION_TYPES):
+            raise RuntimeError("remove() requires a map or a set as first argument")
+        if not contains(collection, value):
+            return False
+        if isinstance(collection, dict):
+            del collection[collection_key(value)]
+        else:
+            collection.remove(collection_key(value))
+        return True
+
+    def builtin_memoize(self, function, maxsize=128):
+        if not isinstance(function, Function):
+            raise RuntimeError("memoize() requires a function as first argument")
+        if isinstance(maxsize, bool) or not isinstance(maxsize, int) or maxsize < 1:
+            raise RuntimeError("memoize() requires a positive integer size")
+        memoized = MemoizedFunction(function, maxsize)
+        self.memoized.append(memoized)
+        return memoized
+
+    def builtin_memostats(self, function):
+        if not isinstance(function, MemoizedFunction):
+            raise RuntimeError("memostats() requires a memoized function")
+        return [function.hits, function.misses, function.evictions, len(function.cache)]
+
+    def builtin_pmap(self, function, values, workers=None, chunksize=None):
+        # parallel imports this module, so it is loaded on first use
+        from parallel import parallel_map
+        return parallel_map(self, function, values, workers, chunksize)
+
+class TypedKey:
+    # A boolean or float map key or set element. Python would merge true, 1 and 1.0 into
+    # one entry; wrapped, they only match values of their own type, as memoize() does.
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return other.__class__ is TypedKey and other.value.__class__ is self.value.__class__ \
+            and other.value == self.value
+
+    def __hash__(self):
+        return hash(self.value)
+
+    def __repr__(self):
+        return repr(self.value)
+
+def collection_key(value):
+    # How a value is stored as a map key or set element
+    value_class = value.__class__
+    if value_class is bool or value_class is float:
+        return TypedKey(value)
+    if value_class is Rope:
+        return str(value)
+    return value
+
+def collection_items(collection):
+    # The keys of a map or the elements of a set, as a new array of the values stored
+    return [key.value if key.__class__ is TypedKey else key for key in collection]
+
+def hashable(value, what):
+    # A map key or set element; ropes are stored as the flat string they stand for
+    value = collection_key(value)
+    try:
+        hash(value)
+    except TypeError:
+        raise RuntimeError(f"{what} must be strings, numbers, booleans, null or functions")
+    return value
+
+def make_map(keys, values):
+    return {hashable(key, "Map keys"): value for key, value in zip(keys, values)}
+
+def make_set(elements):
+    return {hashable(element, "Set elements") for element in elements}
+
+def map_get(mapping, key):
+    try:
+        return mapping[collection_key(key)]
+    except KeyError:
+        raise RuntimeError(f"Key {key!r} not found in map")
+    except TypeError:
+        raise RuntimeError("Map keys must be strings, numbers, booleans, null or functions")
+
+def map_set(mapping, key, value):
+    mapping[hashable(key, "Map keys")] = value
+
+def contains(collection, value):
+    # `value in collection`: a key of a map, an element of a set or sequence, or a
+    # substring of a string. Arrays are never keys or elements, so they are not found.
+    if isinstance(collection, COLLECTION_TYPES):
+        try:
+            return collection_key(value) in collection
+        except TypeError:
+            return False
+    if isinstance(collection, STRING_TYPES):
+        if not isinstance(value, STRING_TYPES):
+            raise RuntimeError("'in' on a string requires a string to look for")
+        return str(value) in str(collection)
+    if isinstance(collection, SEQUENCE_TYPES):
+        return value in collection
+    raise RuntimeError("'in' requires a map, set, array or string on the right")
+
+def fallback_value(name, fallback, scope, environment):
+    # A local that is read before its declaration has run: the next of the outer
+    # addresses that is set, else the global
+    for depth, slot in fallback:
+        outer = scope
+        for _ in range(depth):
+            outer = outer[0]
+        value = outer[slot]
+        if value is not UNSET:
+            return value
+    return environment.get(name)
+
+def fallback_store(name, fallback, scope, environment, value):
+    # An assignment to an enclosing function's local before its declaration has run:
+    # it goes to the next of the outer addresses that is set, else the global
+    for depth, slot in fallback:
+        outer = scope
+        for _ in range(depth):
+            outer = outer[0]
+        if outer[slot] is not UNSET:
+            outer[slot] = value
+            return
+    environment.set(name, value)
+
+def element_error(array, value):
+    # Typed arrays refuse values of the wrong type
+    kind = "an integer" if array.typecode == INT else "a number"
+    return f"Cannot store {value!r} in an {array.type_name()}; elements must be {kind}"
+
 class Function:
-    def __init__(self, name, parameters, body, closure):
+    def __init__(self, name, parameters, body, closure, frame_size=None):
         self.name = name
         self.parameters = parameters
         self.body = body
+        # Scope list the function was defined in (None at the top level)
         self.closure = closure
+        self.frame_size = len(parameters) if frame_size is None else frame_size
 
     def __call__(self, interpreter, arguments):
         return self.call(interpreter, arguments)
 
     def call(self, interpreter, arguments):
-        if len(arguments) != len(self.parameters):
-            raise RuntimeError(f"Function '{self.name}' expects {len(self.parameters)} arguments, got {len(arguments)}")
-
-        # Create new environment with closure
-        previous_env = interpreter.environment
-        interpreter.environment = Environment(self.closure)
-
-        # Define parameters
-        for param, arg in zip(self.parameters, arguments):
-            interpreter.environment.define(param, arg)
-
+        # Tail calls come back as TailCall signals and run here, one after the other
+        function = self
+        previous_scope = interpreter.scope
+        tail_called = None
+        value = UNSET
         try:
-            result = self.body.accept(interpreter)
-            return result
-        except ReturnException as e:
-            return e.value
+            while True:
+                if len(arguments) != len(function.parameters):
+                    raise RuntimeError(f"Function '{function.name}' expects {len(function.parameters)} arguments, got {len(arguments)}")
+
+                # Parameters fill the first slots of the function's scope
+                scope = [function.closure]
+                scope.extend(arguments)
+                scope.extend([UNSET] * (function.frame_size - len(arguments)))
+                interpreter.scope = scope
+
+                signal = interpreter.dispatch[function.body.__class__](function.body)
+                if signal is None:
+                    value = None
+                    return None
+                if signal.__class__ is TailCall:
+                    function = signal.function
+                    arguments = signal.arguments
+                    if interpreter.observes_calls:
+                        if tail_called is None:
+                            tail_called = []
+                        tail_called.append(function)
+                        interpreter.enter_tail_call(function, arguments)
+                    continue
+                if signal is BREAK or signal is CONTINUE:
+                    raise RuntimeError("break or continue outside of loop")
+                value = signal.value
+                return value
         finally:
-            interpreter.environment = previous_env
+            interpreter.scope = previous_scope
+            if tail_called is not None:
+                interpreter.exit_tail_calls(tail_called, value)
+
+# The function returned by memoize(f, maxsize): calls with arguments seen before return
+# the stored result, and the least recently used result is dropped once maxsize are
+# stored. Recursive calls are only memoized when they reach the wrapper, as they do after
+# `f = memoize(f, n);`.
+class MemoizedFunction(Function):
+    def __init__(self, function, maxsize):
+        super().__init__(function.name, function.parameters, function.body, function.closure, function.frame_size)
+        self.function = function
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def call(self, interpreter, arguments):
+        key = tuple([memo_key(argument) for argument in arguments])
+        cache = self.cache
+        value = cache.get(key, UNSET)
+        if value is not UNSET:
+            cache.move_to_end(key)
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        value = self.function.call(interpreter, arguments)
+        cache[key] = value
+        if len(cache) > self.maxsize:
+            cache.popitem(last=False)
+            self.evictions += 1
+        return value
+
+def memo_key(value):
+    # Arguments match by type as well as value, so f(1), f(1.0) and f(true) are separate
+    # entries. Arrays and string builders are mutable and match by a snapshot of their
+    # contents: changing one after a call makes the next call with it a miss, never a
+    # stale hit. A stored array result is returned as the same array on every hit.
+    value_class = value.__class__
+    if value_class is list or value_class is TypedArray:
+        return (value_class, tuple([memo_key(element) for element in value]))
+    if value_class is Rope:
+        return (str, str(value))
+    if value_class is StringBuilder:
+        return (value_class, str(value))
+    if value_class is Range:
+        # Written to, a range matches like the array it has become
+        if value.values.__class__ is range:
+            return (value_class, value.values)
+        return memo_key(value.values)
+    if value_class is dict:
+        return (value_class, frozenset([(memo_key(key), memo_key(item)) for key, item in value.items()]))
+    if value_class is set:
+        return (value_class, frozenset([memo_key(element) for element in value]))
+    return (value_class, value)
@@ -1,3 +1,4 @@
+import gc
 import re
 
 class TokenType:
@@ -11,6 +12,7 @@ class TokenType:
     RETURN = "RETURN"
     BREAK = "BREAK"
     CONTINUE = "CONTINUE"
+    IN = "IN"
     TRUE = "TRUE"
     FALSE = "FALSE"
 
@@ -52,12 +54,15 @@ class TokenType:
     RBRACKET = "RBRACKET"
     SEMICOLON = "SEMICOLON"
     COMMA = "COMMA"
+    COLON = "COLON"
 
     # Special
     EOF = "EOF"
     COMMENT = "COMMENT"
 
 class Token:
+    __slots__ = ('type', 'value', 'line', 'column')
+
     def __init__(self, type_, value, line, column):
         self.type = type_
         self.value = value
@@ -67,236 +72,213 @@ class Token:
     def __repr__(self):
         return f"Token({self.type}, '{self.value}', line={self.line}, col={self.column})"
 
+KEYWORDS = {
+    'let': TokenType.LET,
+    'if': TokenType.IF,
+    'else': TokenType.ELSE,
+    'while': TokenType.WHILE,
+    'for': TokenType.FOR,
+    'def': TokenType.DEF,
+    'return': TokenType.RETURN,
+    'break': TokenType.BREAK,
+    'continue': TokenType.CONTINUE,
+    'in': TokenType.IN,
+    'true': TokenType.TRUE,
+    'false': TokenType.FALSE,
+}
+
+OPERATORS = {
+    '==': TokenType.EQUAL,
+    '!=': TokenType.NOT_EQUAL,
+    '<=': TokenType.LESS_EQUAL,
+    '>=': TokenType.GREATER_EQUAL,
+    '++': TokenType.PLUS_PLUS,
+    '--': TokenType.MINUS_MINUS,
+    '&&': TokenType.AND,
+    '||': TokenType.OR,
+    '+=': TokenType.PLUS_ASSIGN,
+    '-=': TokenType.MINUS_ASSIGN,
+    '*=': TokenType.MULTIPLY_ASSIGN,
+    '/=': TokenType.DIVIDE_ASSIGN,
+    '%=': TokenType.MODULO_ASSIGN,
+    '+': TokenType.PLUS,
+    '-': TokenType.MINUS,
+    '*': TokenType.MULTIPLY,
+    '/': TokenType.DIVIDE,
+    '%': TokenType.MODULO,
+    '=': TokenType.ASSIGN,
+    '<': TokenType.LESS,
+    '>': TokenType.GREATER,
+    '(': TokenType.LPAREN,
+    ')': TokenType.RPAREN,
+    '{': TokenType.LBRACE,
+    '}': TokenType.RBRACE,
+    '[': TokenType.LBRACKET,
+    ']': TokenType.RBRACKET,
+    ';': TokenType.SEMICOLON,
+    ',': TokenType.COMMA,
+    ':': TokenType.COLON,
+}
+
+ESCAPES = {'n': '\n', 't': '\t'}
+
+# Every lexeme of the source as a pair: the whitespace and comments before it, then the
+# lexeme itself. Consecutive matches tile the text, so offsets can be tracked by adding
+# up lengths. Comments are skipped before operators are tried, so that // and /* win
+# over /=. A string without a closing quote runs to the end of the text, like an
+# unterminated block comment. Any other single character is matched last and sorted out
+# by read_other; at the end of the text the lexeme is empty. As the lexeme always
+# matches, the skipped part never has to give back what it took.
+LEXEME_PATTERN = re.compile(r"""
+    ((?: \s+ | //[^\n]* | /\*.*?\*/ | /\*.* )*)
+    ( [A-Za-z_]\w*
+    | == | != | <= | >= | \+\+ | -- | && | \|\| | [-+*/%]=
+    | [0-9][0-9.]*
+    | "[^"\\]*(?:\\.[^"\\]*)*"
+    | ".*
+    | .
+    | \Z
+    )
+""", re.VERBOSE | re.DOTALL)
+
+STRING_PATTERN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+ESCAPE_PATTERN = re.compile(r'\\(.)', re.DOTALL)
+WORD_PATTERN = re.compile(r'\w*')
+
+IDENTIFIER_START = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_')
+DIGITS = frozenset('0123456789')
+
+# Characters scanned per findall() call; lexemes are produced a chunk at a time. Chunks
+# start small, so that a caller reading only a few tokens does not scan far ahead.
+FIRST_CHUNK_SIZE = 1 << 10
+CHUNK_SIZE = 1 << 16
+
+def unescape(match):
+    char = match.group(1)
+    return ESCAPES.get(char, char)
+
 class Lexer:
     def __init__(self, source_code):
         self.source = source_code
-        self.position = 0
         self.line = 1
-        self.column = 1
-        self.current_char = self.source[0] if self.source else None
-
-    def advance(self):
-        if self.current_char == '\n':
-            self.line += 1
-            self.column = 1
-        else:
-            self.column += 1
-
-        self.position += 1
-        self.current_char = self.source[self.position] if self.position < len(self.source) else None
-
-    def peek(self):
-        peek_pos = self.position + 1
-        return self.source[peek_pos] if peek_pos < len(self.source) else None
-
-    def skip_whitespace(self):
-        while self.current_char and self.current_char.isspace():
-            self.advance()
-
-    def skip_comment(self):
-        if self.current_char == '/' and self.peek() == '/':
-            # Single line comment
-            while self.current_char and self.current_char != '\n':
-                self.advance()
-            return True
-        elif self.current_char == '/' and self.peek() == '*':
-            # Multi-line comment
-            self.advance()  # skip /
-            self.advance()  # skip *
-            while self.current_char:
-                if self.current_char == '*' and self.peek() == '/':
-                    self.advance()  # skip *
-                    self.advance()  # skip /
-                    break
-                self.advance()
-            return True
-        return False
-
-    def read_number(self):
-        start_col = self.column
-        num_str = ''
-        while self.current_char and (self.current_char.isdigit() or self.current_char == '.'):
-            num_str += self.current_char
-            self.advance()
-
-        if num_str.count('.') > 1:
-            raise ValueError(f"Invalid number format at line {self.line}, column {start_col}")
-
-        return Token(TokenType.NUMBER, num_str, self.line, start_col)
 
-    def read_string(self):
-        start_col = self.column
-        self.advance()  # skip opening quote
-        string_val = ''
-
-        while self.current_char and self.current_char != '"':
-            if self.current_char == '\\':
-                self.advance()
-                if self.current_char == 'n':
-                    string_val += '\n'
-                elif self.current_char == 't':
-                    string_val += '\t'
-                elif self.current_char == '"':
-                    string_val += '"'
-                elif self.current_char == '\\':
-                    string_val += '\\'
-                else:
-                    string_val += self.current_char
+    def tokens(self, start=0, line=1):
+        # Lexing can resume mid-source, outside any string or comment, given the line there
+        source = self.source
+        length = len(source)
+        findall = LEXEME_PATTERN.findall
+        keywords = KEYWORDS
+        operators = OPERATORS
+        identifier_start = IDENTIFIER_START
+        identifier_type = TokenType.IDENTIFIER
+        # Offset of the first character of the current line; columns are 1-based from it
+        line_start = source.rfind('\n', 0, start) + 1
+        position = start
+        chunk_size = FIRST_CHUNK_SIZE
+
+        while position < length:
+            end = position + chunk_size
+            if end < length:
+                lexemes = findall(source, position, end)
+                # Besides the empty match at the end, the last lexeme may have been cut
+                # short by the end of the chunk, so it is scanned again with the next one
+                del lexemes[-2:]
+                if not lexemes:
+                    chunk_size *= 2
+                    continue
             else:
-                string_val += self.current_char
-            self.advance()
-
-        if not self.current_char:
-            raise ValueError(f"Unterminated string at line {self.line}, column {start_col}")
-
-        self.advance()  # skip closing quote
-        return Token(TokenType.STRING, string_val, self.line, start_col)
-
-    def read_identifier(self):
-        start_col = self.column
-        ident_str = ''
-
-        while self.current_char and (self.current_char.isalnum() or self.current_char == '_'):
-            ident_str += self.current_char
-            self.advance()
-
-        # Check if it's a keyword
-        keywords = {
-            'let': TokenType.LET,
-            'if': TokenType.IF,
-            'else': TokenType.ELSE,
-            'while': TokenType.WHILE,
-            'for': TokenType.FOR,
-            'def': TokenType.DEF,
-            'return': TokenType.RETURN,
-            'break': TokenType.BREAK,
-            'continue': TokenType.CONTINUE,
-            'true': TokenType.TRUE,
-            'false': TokenType.FALSE,
-        }
-
-        token_type = keywords.get(ident_str, TokenType.IDENTIFIER)
-        return Token(token_type, ident_str, self.line, start_col)
-
-    def get_next_token(self):
-        while self.current_char:
-            if self.current_char.isspace():
-                self.skip_whitespace()
-                continue
-
-            if self.skip_comment():
-                continue
-
-            if self.current_char.isdigit():
-                return self.read_number()
-
-            if self.current_char == '"':
-                return self.read_string()
-
-            if self.current_char.isalpha() or self.current_char == '_':
-                return self.read_identifier()
-
-            # Two-character operators
-            if self.current_char == '=' and self.peek() == '=':
-                self.advance()
-                self.advance()
-                return Token(TokenType.EQUAL, '==', self.line, self.column - 1)
-
-            if self.current_char == '!' and self.peek() == '=':
-                self.advance()
-                self.advance()
-                return Token(TokenType.NOT_EQUAL, '!=', self.line, self.column - 1)
-
-            if self.current_char == '<' and self.peek() == '=':
-                self.advance()
-                self.advance()
-                return Token(TokenType.LESS_EQUAL, '<=', self.line, self.column - 1)
-
-            if self.current_char == '>' and self.peek() == '=':
-                self.advance()
-                self.advance()
-                return Token(TokenType.GREATER_EQUAL, '>=', self.line, self.column - 1)
-
-            if self.current_char == '+' and self.peek() == '+':
-                self.advance()
-                self.advance()
-                return Token(TokenType.PLUS_PLUS, '++', self.line, self.column - 1)
-
-            if self.current_char == '-' and self.peek() == '-':
-                self.advance()
-                self.advance()
-                return Token(TokenType.MINUS_MINUS, '--', self.line, self.column - 1)
-
-            if self.current_char == '&' and self.peek() == '&':
-                self.advance()
-                self.advance()
-                return Token(TokenType.AND, '&&', self.line, self.column - 1)
-
-            if self.current_char == '|' and self.peek() == '|':
-                self.advance()
-                self.advance()
-                return Token(TokenType.OR, '||', self.line, self.column - 1)
-
-            # Compound assignment operators
-            if self.current_char == '+' and self.peek() == '=':
-                self.advance()
-                self.advance()
-                return Token(TokenType.PLUS_ASSIGN, '+=', self.line, self.column - 1)
-
-            if self.current_char == '-' and self.peek() == '=':
-                self.advance()
-                self.advance()
-                return Token(TokenType.MINUS_ASSIGN, '-=', self.line, self.column - 1)
-
-            if self.current_char == '*' and self.peek() == '=':
-                self.advance()
-                self.advance()
-                return Token(TokenType.MULTIPLY_ASSIGN, '*=', self.line, self.column - 1)
-
-            if self.current_char == '/' and self.peek() == '=':
-                self.advance()
-                self.advance()
-                return Token(TokenType.DIVIDE_ASSIGN, '/=', self.line, self.column - 1)
-
-            if self.current_char == '%' and self.peek() == '=':
-                self.advance()
-                self.advance()
-                return Token(TokenType.MODULO_ASSIGN, '%=', self.line, self.column - 1)
-
-            # Single-character operators and delimiters
-            char_to_token = {
-                '+': TokenType.PLUS,
-                '-': TokenType.MINUS,
-                '*': TokenType.MULTIPLY,
-                '/': TokenType.DIVIDE,
-                '%': TokenType.MODULO,
-                '=': TokenType.ASSIGN,
-                '<': TokenType.LESS,
-                '>': TokenType.GREATER,
-                '(': TokenType.LPAREN,
-                ')': TokenType.RPAREN,
-                '{': TokenType.LBRACE,
-                '}': TokenType.RBRACE,
-                '[': TokenType.LBRACKET,
-                ']': TokenType.RBRACKET,
-                ';': TokenType.SEMICOLON,
-                ',': TokenType.COMMA,
-            }
-
-            if self.current_char in char_to_token:
-                token = Token(char_to_token[self.current_char], self.current_char, self.line, self.column)
-                self.advance()
-                return token
-
-            raise ValueError(f"Unexpected character '{self.current_char}' at line {self.line}, column {self.column}")
+                lexemes = findall(source, position)
+                lexemes.pop()
+
+            offset = position
+            for skipped, text in lexemes:
+                if skipped:
+                    if '\n' in skipped:
+                        line += skipped.count('\n')
+                        line_start = offset + skipped.rindex('\n') + 1
+                    offset += len(skipped)
+                start = offset
+                offset += len(text)
+
+                token_type = operators.get(text)
+                if token_type is not None:
+                    # Two-character operators have always reported the column of their
+                    # second character
+                    yield Token(token_type, text, line, offset - line_start)
+                    continue
+                if not text:
+                    continue
+
+                first = text[0]
+                if first in identifier_start:
+                    yield Token(keywords.get(text, identifier_type), text, line, start - line_start + 1)
+                elif first in DIGITS:
+                    if offset < length and source[offset] > '\x7f':
+                        # Non-ASCII digits continue the number; rescan from its start
+                        token, offset = self.read_number(start, line, line_start)
+                        yield token
+                        break
+                    yield self.number_token(text, line, start - line_start + 1)
+                elif first == '"':
+                    column = start - line_start + 1
+                    if offset == length and not STRING_PATTERN.fullmatch(text):
+                        line += text.count('\n')
+                        raise ValueError(f"Unterminated string at line {line}, column {column}")
+                    value = text[1:-1]
+                    if '\n' in value:
+                        # The token reports the line the string ends on
+                        line += value.count('\n')
+                        line_start = start + 1 + value.rindex('\n') + 1
+                    if '\\' in value:
+                        value = ESCAPE_PATTERN.sub(unescape, value)
+                    yield Token(TokenType.STRING, value, line, column)
+                else:
+                    token, offset = self.read_other(start, line, line_start)
+                    yield token
+                    break
+            position = offset
+            if chunk_size < CHUNK_SIZE:
+                chunk_size *= 2
 
-        return Token(TokenType.EOF, '', self.line, self.column)
+        self.line = line
+        yield Token(TokenType.EOF, '', line, length - line_start + 1)
 
     def tokenize(self):
-        tokens = []
-        while True:
-            token = self.get_next_token()
-            tokens.append(token)
-            if token.type == TokenType.EOF:
-                break
-        return tokens
+        # Tokens are plain objects that cannot form cycles; pausing the cyclic
+        # collector while hundreds of thousands are allocated saves a third of the time
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return list(self.tokens())
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    def number_token(self, text, line, column):
+        if text.count('.') > 1:
+            raise ValueError(f"Invalid number format at line {line}, column {column}")
+        return Token(TokenType.NUMBER, text, line, column)
+
+    def read_number(self, start, line, line_start):
+        # Slow path for numbers containing non-ASCII digits, using str.isdigit()
+        source = self.source
+        end = start
+        while end < len(source) and (source[end].isdigit() or source[end] == '.'):
+            end += 1
+        return self.number_token(source[start:end], line, start - line_start + 1), end
+
+    def read_other(self, start, line, line_start):
+        # A character no other alternative matched: the start of a non-ASCII
+        # identifier or number, or an error
+        char = self.source[start]
+        column = start - line_start + 1
+
+        if char.isdigit():
+            return self.read_number(start, line, line_start)
+
+        if char.isalpha():
+            end = WORD_PATTERN.match(self.source, start + 1).end()
+            text = self.source[start:end]
+            return Token(KEYWORDS.get(text, TokenType.IDENTIFIER), text, line, column), end
+
+        raise ValueError(f"Unexpected character '{char}' at line {line}, column {column}")
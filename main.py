@@ -2,11 +2,24 @@
 
 import sys
 import os
-from lexer import Lexer
-from parser import Parser
+import argparse
 from interpreter import Interpreter, RuntimeError
+from closure_compiler import ClosureInterpreter
+from compiler import Compiler, disassemble
+from vm import VirtualMachine
+from profiler import Profiler, ProfilingInterpreter, Sampler
+from counters import CounterCollector
+from stats import RunStats, phase
+import cache
 
-def run_file(filename):
+ENGINES = {
+    'tree': Interpreter,
+    'closure': ClosureInterpreter,
+    'vm': VirtualMachine,
+}
+
+def run_file(filename, engine="tree", show_bytecode=False, optimize=False, use_cache=True, profile=False, profile_output=None,
+             sample_interval=None, sample_output=None, counters_output=None, stats_format=None):
     if not os.path.exists(filename):
         print(f"Error: File '{filename}' not found")
         sys.exit(1)
@@ -14,21 +27,68 @@ def run_file(filename):
     with open(filename, 'r') as f:
         source_code = f.read()
 
-    run(source_code, filename)
+    run(source_code, filename, engine, show_bytecode, optimize, use_cache, profile, profile_output,
+        sample_interval, sample_output, counters_output, RunStats() if stats_format else None, stats_format)
+
+def script_source(lines):
+    # Source of a script run through ss_interpreter.py: the shebang line and blank lines are dropped
+    return ''.join(line for line in lines[1:] if line.strip())
 
-def run(source_code, filename="<string>"):
+def run(source_code, filename="<string>", engine="tree", show_bytecode=False, optimize=False, use_cache=True,
+        profile=False, profile_output=None, sample_interval=None, sample_output=None, counters_output=None,
+        stats=None, stats_format=None):
+    if stats is not None:
+        stats.engine = 'tree' if profile else engine
     try:
-        # Lexing
-        lexer = Lexer(source_code)
-        tokens = lexer.tokenize()
+        try:
+            # Lexing and parsing, skipped when the file has an up-to-date cache entry
+            program = cache.load_program(filename, source_code, optimize, use_cache, stats)
+            if stats is not None:
+                stats.count_nodes(program)
 
-        # Parsing
-        parser = Parser(tokens)
-        program = parser.parse_program()
+            # Scope resolution happens before any engine runs, so undefined names are reported up front
+            if profile:
+                profiler = Profiler(filename)
+                interpreter = ProfilingInterpreter(profiler)
+            else:
+                interpreter = ENGINES[engine]()
+            if counters_output:
+                counters = CounterCollector().attach(interpreter)
+            if stats is not None:
+                stats.attach(interpreter)
+            with phase(stats, 'resolve'):
+                interpreter.resolve(program)
 
-        # Interpretation
-        interpreter = Interpreter()
-        interpreter.interpret(program)
+            if show_bytecode:
+                print(disassemble(Compiler().compile(program)))
+                return
+
+            # Interpretation
+            if sample_interval:
+                sampler = Sampler(filename, sample_interval)
+                sampler.start()
+            try:
+                with phase(stats, 'interpret'):
+                    interpreter.interpret(program)
+            finally:
+                # Also reports runs that end in an error
+                if counters_output:
+                    counters.dump(counters_output)
+                if sample_interval:
+                    sampler.stop()
+                    if sample_output:
+                        sampler.write_folded(sample_output)
+                    else:
+                        sampler.print_report()
+                if profile:
+                    if profile_output:
+                        profiler.dump_stats(profile_output)
+                    else:
+                        profiler.print_report(source_code)
+        finally:
+            # Covers whatever phases ran, syntax errors included
+            if stats is not None and stats_format:
+                stats.report(stats_format)
 
     except ValueError as e:
         print(f"Syntax Error: {e}")
@@ -40,14 +100,118 @@ def run(source_code, filename="<string>"):
         print(f"Error: {e}")
         sys.exit(1)
 
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: python main.py <filename>")
-        print("Example: python main.py examples/hello.ss")
+def precompile(directory, optimize=False):
+    # Writes a cache entry for every .ss file under directory; returns (compiled, failed)
+    compiled = failed = 0
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [name for name in dirs if name != cache.CACHE_DIRECTORY]
+        for name in sorted(files):
+            if not name.endswith('.ss'):
+                continue
+            filename = os.path.join(root, name)
+            with open(filename, 'r') as f:
+                lines = f.readlines()
+            # Scripts with a shebang are run through ss_interpreter.py, which strips it
+            if lines and lines[0].startswith('#!'):
+                source_code = script_source(lines)
+            else:
+                source_code = ''.join(lines)
+
+            try:
+                program = cache.compile_source(source_code, optimize)
+            except ValueError as e:
+                print(f"{filename}: Syntax Error: {e}")
+                failed += 1
+                continue
+            if cache.store(filename, source_code, program, optimize):
+                compiled += 1
+            else:
+                print(f"{filename}: could not write {cache.cache_path(filename, optimize)}")
+                failed += 1
+    return compiled, failed
+
+def precompile_main(argv):
+    arg_parser = argparse.ArgumentParser(
+        prog="python main.py precompile",
+        description="Parse every .ss file under a directory and cache the result",
+    )
+    arg_parser.add_argument('directory')
+    arg_parser.add_argument('-O', dest='optimize', action='store_true',
+                            help="cache the optimized program used by -O runs")
+    args = arg_parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        print(f"Error: Directory '{args.directory}' not found")
         sys.exit(1)
 
-    filename = sys.argv[1]
-    run_file(filename)
+    compiled, failed = precompile(args.directory, args.optimize)
+    print(f"Precompiled {compiled} file(s), {failed} failed")
+    if failed:
+        sys.exit(1)
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'precompile':
+        precompile_main(sys.argv[2:])
+        return
+
+    arg_parser = argparse.ArgumentParser(
+        usage="python main.py [--engine=tree|closure|vm] [-O] [--no-cache] [--disassemble]\n"
+              "                      [--profile] [--profile-output=<file>]\n"
+              "                      [--sample] [--sample-interval=<ms>] [--sample-output=<file>]\n"
+              "                      [--counters=<file>] [--stats] [--stats-json] <filename>\n"
+              "       python main.py precompile [-O] <directory>",
+        epilog="Example: python main.py examples/hello.ss",
+    )
+    arg_parser.add_argument('filename')
+    arg_parser.add_argument('--engine', choices=sorted(ENGINES), default='tree',
+                            help="execution engine (default: tree)")
+    arg_parser.add_argument('--disassemble', action='store_true',
+                            help="print the compiled bytecode instead of running the script")
+    arg_parser.add_argument('-O', dest='optimize', action='store_true',
+                            help="fold constants, drop dead code and share repeated expressions before running")
+    arg_parser.add_argument('--no-cache', dest='use_cache', action='store_false',
+                            help="always lex and parse; neither read nor write the __pycache__ entry")
+    arg_parser.add_argument('--profile', action='store_true',
+                            help="time every function and line and print a report to stderr after the run")
+    arg_parser.add_argument('--profile-output', metavar='FILE',
+                            help="with --profile, write pstats-compatible results to FILE instead")
+    arg_parser.add_argument('--sample', action='store_true',
+                            help="sample the call stack on a CPU timer and print the hottest stacks to stderr")
+    arg_parser.add_argument('--sample-interval', metavar='MS', type=float, default=1.0,
+                            help="with --sample, milliseconds of CPU time between samples (default: 1)")
+    arg_parser.add_argument('--sample-output', metavar='FILE',
+                            help="with --sample, write folded stacks for flamegraph tools to FILE instead")
+    arg_parser.add_argument('--counters', metavar='FILE',
+                            help="count node types, calls, builtins and loop iterations and write them to FILE as JSON")
+    arg_parser.add_argument('--stats', action='store_true',
+                            help="print phase times, program size, memory and call counts to stderr after the run")
+    arg_parser.add_argument('--stats-json', action='store_true',
+                            help="print the --stats report as JSON instead")
+    args = arg_parser.parse_args()
+
+    if args.profile_output and not args.profile:
+        arg_parser.error("--profile-output requires --profile")
+    if args.profile and args.engine != 'tree':
+        arg_parser.error("--profile instruments the tree engine; use --engine=tree")
+    if args.sample_output and not args.sample:
+        arg_parser.error("--sample-output requires --sample")
+    if args.sample and args.engine != 'tree':
+        arg_parser.error("--sample reads the tree engine's call stack; use --engine=tree")
+    if args.sample and args.profile:
+        arg_parser.error("--sample and --profile cannot be combined")
+    if args.counters and args.engine != 'tree':
+        arg_parser.error("--counters hooks into the tree engine; use --engine=tree")
+    if args.counters and args.profile:
+        arg_parser.error("--counters and --profile cannot be combined")
+    stats_format = 'json' if args.stats_json else 'text' if args.stats else None
+    if stats_format and args.profile:
+        arg_parser.error("--stats and --profile cannot be combined")
+    if args.sample_interval <= 0:
+        arg_parser.error("--sample-interval must be positive")
+
+    sample_interval = args.sample_interval / 1000 if args.sample else None
+    run_file(args.filename, args.engine, args.disassemble, args.optimize, args.use_cache, args.profile, args.profile_output,
+             sample_interval, args.sample_output, args.counters, stats_format)
 
 if __name__ == "__main__":
     main()
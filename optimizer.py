@@ -0,0 +1,389 @@
+from ast_nodes import *
+from interpreter import Interpreter
+
+# AST-to-AST optimizations run on the parsed Program before scope resolution:
+#   - constant folding of operators and pure builtins whose operands are all literals,
+#     and propagation of top-level `let` constants that are never rebound
+#   - dead code elimination of constant-condition branches/loops and unreachable statements
+#   - common subexpression elimination of repeated pure comparisons within a block
+# Folding evaluates nodes with a scratch Interpreter, so folded values match the runtime
+# exactly; anything that would raise is left in place to fail at runtime as before.
+
+# Builtins without side effects whose results can be computed ahead of time
+PURE_BUILTINS = {
+    'len', 'str', 'int', 'bool', 'abs', 'pow', 'sqrt', 'floor', 'ceil', 'round', 'min', 'max',
+    'substring', 'replace', 'tolower', 'toupper', 'startswith', 'endswith', 'type',
+}
+
+FOLDABLE_TYPES = (bool, int, float, str)
+
+# Operators whose results are always booleans, so one computed value can stand in for
+# several occurrences. Arithmetic is left alone: on arrays and typed arrays it makes a new
+# mutable value each time, and sharing one would let a change to it show through the other.
+# The ordering comparisons give iarrays on typed arrays, so they are left alone as well.
+CSE_OPERATORS = {'==', '!=', 'in'}
+
+# Longer folded strings are left to be built at runtime rather than stored in the tree
+MAX_FOLDED_STRING = 4096
+
+def binding_counts(program):
+    # How many times the script binds each name. Calls to bound names are never treated
+    # as builtins, and only names bound exactly once can be propagated as constants.
+    counts = {}
+    for node in walk(program):
+        if isinstance(node, (VariableDeclaration, Assignment, ForInStatement)):
+            names = [node.name]
+        elif isinstance(node, FunctionDefinition):
+            names = [node.name] + list(node.parameters)
+        elif isinstance(node, (PrefixIncrement, PrefixDecrement, PostfixIncrement, PostfixDecrement)):
+            names = [getattr(node.operand, 'name', None)]
+        else:
+            continue
+        for name in names:
+            counts[name] = counts.get(name, 0) + 1
+    return counts
+
+def is_terminator(statement):
+    return isinstance(statement, (ReturnStatement, BreakStatement, ContinueStatement))
+
+def expression_key(node):
+    # Structural identity of a pure expression, or None if it may have side effects
+    if isinstance(node, Literal):
+        return ('literal', type(node.value), node.value)
+    if isinstance(node, Variable):
+        return ('variable', node.name)
+    if isinstance(node, BinaryExpression):
+        left = expression_key(node.left)
+        right = expression_key(node.right)
+        if left is None or right is None:
+            return None
+        return (node.operator, left, right)
+    if isinstance(node, UnaryExpression):
+        operand = expression_key(node.operand)
+        if operand is None:
+            return None
+        return ('unary' + node.operator, operand)
+    return None
+
+def variables_in(key):
+    if key[0] == 'variable':
+        return {key[1]}
+    names = set()
+    for part in key[1:]:
+        if isinstance(part, tuple):
+            names |= variables_in(part)
+    return names
+
+class Occurrence:
+    def __init__(self, index, holder, attribute, node):
+        self.index = index
+        self.holder = holder
+        self.attribute = attribute
+        self.node = node
+
+class Optimizer:
+    def __init__(self):
+        self.interpreter = Interpreter()
+        self.bindings = {}
+        self.constants = {}
+        self.block_depth = 0
+        self.temporaries = 0
+
+    def optimize(self, program):
+        self.bindings = binding_counts(program)
+        program.statements = self.optimize_statements(program.statements)
+        return program
+
+    def optimize_statements(self, statements):
+        result = []
+        for statement in statements:
+            optimized = statement.accept(self)
+            if optimized is None:
+                continue
+            if isinstance(optimized, BlockStatement) and not declares_names(optimized.statements):
+                # A folded branch that declares nothing runs in place
+                result.extend(optimized.statements)
+            else:
+                result.append(optimized)
+
+        return self.eliminate_common_subexpressions(self.remove_unreachable(result))
+
+    def remove_unreachable(self, statements):
+        for index, statement in enumerate(statements):
+            if is_terminator(statement):
+                break
+        else:
+            return statements
+
+        # Declarations after a return/break/continue never run, but they still shape
+        # the block's scope, so they are kept without their initializers
+        result = statements[:index + 1]
+        for statement in statements[index + 1:]:
+            if isinstance(statement, VariableDeclaration):
+                result.append(VariableDeclaration(statement.name, None, statement.line, statement.column))
+            elif isinstance(statement, FunctionDefinition):
+                result.append(statement)
+            elif isinstance(statement, ForStatement) and isinstance(statement.initializer, VariableDeclaration):
+                initializer = statement.initializer
+                result.append(VariableDeclaration(initializer.name, None, initializer.line, initializer.column))
+            elif isinstance(statement, ForInStatement):
+                result.append(VariableDeclaration(statement.name, None, statement.line, statement.column))
+        return result
+
+    def optimize_block(self, block):
+        self.block_depth += 1
+        block.statements = self.optimize_statements(block.statements)
+        self.block_depth -= 1
+        return block
+
+    def optimize_expression(self, node):
+        if node is None:
+            return None
+        return node.accept(self)
+
+    def is_constant(self, node):
+        return isinstance(node, Literal)
+
+    def fold(self, node):
+        # All operands are literals: evaluate now with the interpreter's own semantics
+        try:
+            value = self.interpreter.dispatch[node.__class__](node)
+        except Exception:
+            return node
+        if not isinstance(value, FOLDABLE_TYPES):
+            return node
+        if isinstance(value, str) and len(value) > MAX_FOLDED_STRING:
+            return node
+        return Literal(value, node.line, node.column)
+
+    # Statements
+    def visit_program(self, node):
+        return self.optimize(node)
+
+    def visit_variable_declaration(self, node):
+        node.value = self.optimize_expression(node.value)
+
+        # A top-level declaration runs once, before any code after it, so if nothing
+        # else binds the name every later read sees this value
+        if self.block_depth == 0 and self.is_constant(node.value) and self.bindings.get(node.name) == 1:
+            self.constants[node.name] = node.value.value
+        return node
+
+    def visit_assignment(self, node):
+        node.value = self.optimize_expression(node.value)
+        return node
+
+    def visit_if_statement(self, node):
+        node.condition = self.optimize_expression(node.condition)
+        node.then_block = self.optimize_block(node.then_block)
+        if node.else_block:
+            node.else_block = self.optimize_block(node.else_block)
+
+        if self.is_constant(node.condition):
+            if self.interpreter.is_truthy(node.condition.value):
+                return node.then_block
+            return node.else_block
+        return node
+
+    def visit_while_statement(self, node):
+        node.condition = self.optimize_expression(node.condition)
+        if self.is_constant(node.condition) and not self.interpreter.is_truthy(node.condition.value):
+            return None
+        node.body = self.optimize_block(node.body)
+        return node
+
+    def visit_for_statement(self, node):
+        if node.initializer:
+            node.initializer = node.initializer.accept(self)
+        node.condition = self.optimize_expression(node.condition)
+        if self.is_constant(node.condition) and not self.interpreter.is_truthy(node.condition.value):
+            # Only the initializer ever runs
+            return node.initializer
+        node.increment = self.optimize_expression(node.increment)
+        node.body = self.optimize_block(node.body)
+        return node
+
+    def visit_for_in_statement(self, node):
+        node.iterable = self.optimize_expression(node.iterable)
+        node.body = self.optimize_block(node.body)
+        return node
+
+    def visit_break_statement(self, node):
+        return node
+
+    def visit_continue_statement(self, node):
+        return node
+
+    def visit_function_definition(self, node):
+        node.body = self.optimize_block(node.body)
+        return node
+
+    def visit_return_statement(self, node):
+        node.value = self.optimize_expression(node.value)
+        return node
+
+    def visit_block_statement(self, node):
+        return self.optimize_block(node)
+
+    def visit_expression_statement(self, node):
+        node.expression = self.optimize_expression(node.expression)
+        if self.is_constant(node.expression):
+            return None
+        return node
+
+    # Expressions
+    def visit_binary_expression(self, node):
+        node.left = self.optimize_expression(node.left)
+        node.right = self.optimize_expression(node.right)
+
+        if self.is_constant(node.left):
+            if self.is_constant(node.right):
+                return self.fold(node)
+            # A constant left operand that decides && or || makes the right side dead
+            truthy = self.interpreter.is_truthy(node.left.value)
+            if node.operator == '&&' and not truthy:
+                return Literal(False, node.line, node.column)
+            if node.operator == '||' and truthy:
+                return Literal(True, node.line, node.column)
+        return node
+
+    def visit_unary_expression(self, node):
+        node.operand = self.optimize_expression(node.operand)
+        if self.is_constant(node.operand):
+            return self.fold(node)
+        return node
+
+    def visit_literal(self, node):
+        return node
+
+    def visit_variable(self, node):
+        if node.name in self.constants:
+            return Literal(self.constants[node.name], node.line, node.column)
+        return node
+
+    def visit_function_call(self, node):
+        node.arguments = [self.optimize_expression(argument) for argument in node.arguments]
+        if node.name in PURE_BUILTINS and node.name not in self.bindings:
+            if all(self.is_constant(argument) for argument in node.arguments):
+                return self.fold(node)
+        return node
+
+    def visit_array_literal(self, node):
+        node.elements = [self.optimize_expression(element) for element in node.elements]
+        return node
+
+    def visit_map_literal(self, node):
+        node.keys = [self.optimize_expression(key) for key in node.keys]
+        node.values = [self.optimize_expression(value) for value in node.values]
+        return node
+
+    def visit_set_literal(self, node):
+        node.elements = [self.optimize_expression(element) for element in node.elements]
+        return node
+
+    def visit_array_access(self, node):
+        node.array = self.optimize_expression(node.array)
+        node.index = self.optimize_expression(node.index)
+        return node
+
+    def visit_array_assignment(self, node):
+        node.index = self.optimize_expression(node.index)
+        node.value = self.optimize_expression(node.value)
+        return node
+
+    def visit_prefix_increment(self, node):
+        return node
+
+    def visit_prefix_decrement(self, node):
+        return node
+
+    def visit_postfix_increment(self, node):
+        return node
+
+    def visit_postfix_decrement(self, node):
+        return node
+
+    # Common subexpression elimination
+    def eliminate_common_subexpressions(self, statements):
+        # Within a run of straight-line statements made only of pure expressions, a
+        # repeated comparison is computed once into a temporary declared just
+        # before its first use. Any other statement ends the run, and assigning a
+        # variable ends every expression that reads it.
+        groups = []
+        live = {}
+        for index, statement in enumerate(statements):
+            holders = self.pure_holders(statement)
+            if holders is None:
+                groups.extend(live.values())
+                live = {}
+                continue
+
+            for holder, attribute in holders:
+                self.collect_occurrences(index, holder, attribute, live)
+
+            written = getattr(statement, 'name', None)
+            if written is not None:
+                for key in [key for key in live if written in variables_in(key)]:
+                    groups.append(live.pop(key))
+        groups.extend(live.values())
+
+        groups = [group for group in groups if len(group) > 1]
+        if not groups:
+            return statements
+
+        # Larger expressions first, so that their parts are not extracted on their own
+        groups.sort(key=lambda group: -sum(1 for _ in walk(group[0].node)))
+        detached = set()
+        inserted = {}
+        for group in groups:
+            group = [occurrence for occurrence in group if id(occurrence.node) not in detached]
+            if len(group) < 2:
+                continue
+
+            self.temporaries += 1
+            name = f"$cse{self.temporaries}"
+            first = group[0]
+            declaration = VariableDeclaration(name, first.node, first.node.line, first.node.column)
+            inserted.setdefault(first.index, []).insert(0, declaration)
+
+            for occurrence in group:
+                setattr(occurrence.holder, occurrence.attribute, Variable(name, occurrence.node.line, occurrence.node.column))
+                if occurrence is not first:
+                    detached.update(id(node) for node in walk(occurrence.node))
+
+        result = []
+        for index, statement in enumerate(statements):
+            result.extend(inserted.get(index, ()))
+            result.append(statement)
+        return result
+
+    def pure_holders(self, statement):
+        # (node, attribute) pairs holding the statement's expressions, or None if the
+        # statement is not a straight-line statement over pure expressions
+        if isinstance(statement, (VariableDeclaration, Assignment, ReturnStatement)):
+            attribute = 'value'
+        elif isinstance(statement, ExpressionStatement):
+            attribute = 'expression'
+        else:
+            return None
+
+        expression = getattr(statement, attribute)
+        if expression is None:
+            return []
+        if expression_key(expression) is None:
+            return None
+        return [(statement, attribute)]
+
+    def collect_occurrences(self, index, holder, attribute, live):
+        node = getattr(holder, attribute)
+        if not isinstance(node, BinaryExpression):
+            if isinstance(node, UnaryExpression):
+                self.collect_occurrences(index, node, 'operand', live)
+            return
+
+        if node.operator in CSE_OPERATORS:
+            live.setdefault(expression_key(node), []).append(Occurrence(index, holder, attribute, node))
+        self.collect_occurrences(index, node, 'left', live)
+        if node.operator != '&&' and node.operator != '||':
+            # The right side of a logical operator may never run, so it is not hoisted
+            self.collect_occurrences(index, node, 'right', live)
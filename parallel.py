@@ -0,0 +1,318 @@
+import os
+import sys
+import atexit
+import pickle
+import multiprocessing
+from ast_nodes import (ASTNode, Program, FunctionDefinition, BlockStatement, Variable, FunctionCall, Assignment,
+                       PrefixIncrement, PrefixDecrement, PostfixIncrement, PostfixDecrement, node_fields)
+from interpreter import Function, MemoizedFunction, RuntimeError, UNSET, SEQUENCE_TYPES
+from ropes import Rope
+from sequences import Range
+
+# pmap(f, array, workers, chunksize): f applied to every element of array in a pool of
+# worker processes, with the results gathered in order.
+#
+# Functions cannot be sent to another process as they are, since the engines compile
+# them into closures or bytecode bound to one interpreter. Instead pmap() packs a job:
+# the AST of f and of every function it calls, along with the globals and enclosing
+# variables they read. A worker unpacks a job into a fresh interpreter of the same engine,
+# which it keeps for the later chunks of the same call. Workers only ever see copies, so a
+# function that assigns to a variable outside itself, or reads an array, map, set or
+# string builder from outside, is refused up front instead of silently diverging.
+#
+# The array is split into about CHUNKS_PER_WORKER chunks per worker: several chunks each
+# keep workers busy when elements take uneven time, while every chunk resends the job. The
+# pool is started on first use and kept for later calls with the same number of workers.
+# Output printed by workers goes to the same stdout and may interleave between them.
+
+CHUNKS_PER_WORKER = 4
+
+# Values that are the same in every process, and sent as they are. Ranges are arrays
+# that can be written to, so like arrays they are not among them.
+CONSTANT_TYPES = (type(None), bool, int, float, str)
+
+class Ref:
+    # Stands in for a value a worker builds itself: a function of the job (by index), a
+    # builtin (by method name), or a local slot whose declaration has not run
+    __slots__ = ('kind', 'value')
+
+    def __init__(self, kind, value=None):
+        self.kind = kind
+        self.value = value
+
+class JobBuilder:
+    def __init__(self, interpreter, name):
+        self.interpreter = interpreter
+        # Name of the function passed to pmap(), for error messages
+        self.name = name
+        self.functions = []
+        self.indices = {}
+        self.globals = {}
+        # id(scope) -> (scope, {slot: value}) for the enclosing variables functions read
+        self.captured = {}
+        self.copies = {}
+
+    def build(self, function):
+        target = self.add_function(function)
+        images = []
+        for entry in self.functions:
+            native = entry.function if isinstance(entry, MemoizedFunction) else entry
+            maxsize = entry.maxsize if isinstance(entry, MemoizedFunction) else None
+            images.append((native.name, native.parameters, native.body, native.frame_size,
+                           self.copy_scope(native.closure), maxsize))
+        return (self.interpreter.__class__, images, self.globals, target)
+
+    def add_function(self, function):
+        index = self.indices.get(id(function))
+        if index is not None:
+            return Ref('function', index)
+
+        # Registered before its body is walked, so recursive functions refer to themselves
+        index = len(self.functions)
+        self.indices[id(function)] = index
+        self.functions.append(function)
+        if isinstance(function, MemoizedFunction):
+            function = function.function
+        for statement in function.body.statements:
+            self.walk(function, statement, 0)
+        return Ref('function', index)
+
+    def walk(self, function, node, level):
+        # level counts the scopes between node and the function's own scope
+        node_class = node.__class__
+        if node_class is Variable or node_class is FunctionCall:
+            self.reference(function, node, level, False)
+        elif node_class is Assignment:
+            self.reference(function, node, level, True)
+        elif node_class in (PrefixIncrement, PrefixDecrement, PostfixIncrement, PostfixDecrement) \
+                and node.operand.__class__ is Variable:
+            self.reference(function, node.operand, level, True)
+
+        if node_class is FunctionDefinition:
+            for statement in node.body.statements:
+                self.walk(function, statement, level + 1)
+            return
+        if node_class is BlockStatement and node.frame_size:
+            level += 1
+
+        for field in node_fields(node_class):
+            if field == 'cached_value':
+                continue
+            value = getattr(node, field, None)
+            if isinstance(value, ASTNode):
+                self.walk(function, value, level)
+            elif isinstance(value, list):
+                for item in value:
+                    if isinstance(item, ASTNode):
+                        self.walk(function, item, level)
+
+    def reference(self, function, node, level, write):
+        if node.slot is None:
+            if write:
+                self.refuse(f"it assigns to the global '{node.name}'")
+            if node.name not in self.globals:
+                value = self.interpreter.environment.variables.get(node.name, UNSET)
+                if value is not UNSET:
+                    # Reserved first, so a function that calls itself is only walked once
+                    self.globals[node.name] = None
+                    self.globals[node.name] = self.ship(node.name, value)
+            return
+
+        if node.depth <= level:
+            return
+        if write:
+            self.refuse(f"it assigns to '{node.name}', a variable of an enclosing function")
+        if self.capture(function, node.name, node.depth - level - 1, node.slot) is UNSET:
+            # Not declared yet, so the function would read the next binding outwards
+            for depth, slot in node.fallback:
+                if depth > level and self.capture(function, node.name, depth - level - 1, slot) is not UNSET:
+                    return
+            self.reference(function, Variable(node.name), level, False)
+
+    def capture(self, function, name, up, slot):
+        # The value of an enclosing function's variable, recorded for the job
+        scope = function.closure
+        for _ in range(up):
+            scope = scope[0]
+        scope_id = id(scope)
+        if scope_id not in self.captured:
+            self.captured[scope_id] = (scope, {})
+        slots = self.captured[scope_id][1]
+        if slot not in slots:
+            slots[slot] = None
+            slots[slot] = self.ship(name, scope[slot])
+        return scope[slot]
+
+    def ship(self, name, value):
+        if value is UNSET:
+            return Ref('unset')
+        if value.__class__ is Rope:
+            return str(value)
+        if isinstance(value, CONSTANT_TYPES):
+            return value
+        if isinstance(value, Function):
+            return self.add_function(value)
+        if getattr(value, '__self__', None) is self.interpreter:
+            return Ref('builtin', value.__name__)
+        self.refuse(f"it reads '{name}' from outside the function, and {self.interpreter.builtin_type(value)} "
+                    f"values cannot be shared with workers; pass it in the array instead")
+
+    def refuse(self, reason):
+        raise RuntimeError(f"pmap() cannot run '{self.name}' in worker processes: {reason}")
+
+    def copy_scope(self, scope):
+        # Copies of the enclosing scopes holding only the slots the job's functions read
+        if scope is None:
+            return None
+        copy = self.copies.get(id(scope))
+        if copy is None:
+            copy = [self.copy_scope(scope[0])] + [None] * (len(scope) - 1)
+            self.copies[id(scope)] = copy
+            if id(scope) in self.captured:
+                for slot, value in self.captured[id(scope)][1].items():
+                    copy[slot] = value
+        return copy
+
+def holds_function(value, seen=None):
+    # Functions and builtins belong to one interpreter, so they cannot be elements or results
+    if value.__class__ is Range:
+        value = value.values
+    if isinstance(value, (list, dict, set)):
+        if seen is None:
+            seen = set()
+        if id(value) in seen:
+            return False
+        seen.add(id(value))
+        if isinstance(value, dict):
+            return any(holds_function(key, seen) or holds_function(item, seen) for key, item in value.items())
+        return any(holds_function(item, seen) for item in value)
+    return callable(value)
+
+# Worker side. Each worker keeps the interpreter and function of the last job it unpacked.
+worker_job = None
+worker_state = None
+
+def load_job(data):
+    global worker_job, worker_state
+    if data != worker_job:
+        worker_state = unpack_job(pickle.loads(data))
+        worker_job = data
+    return worker_state
+
+def unpack_job(job):
+    engine, images, global_values, target = job
+    interpreter = engine()
+    variables = interpreter.environment.variables
+
+    natives = []
+    for name, parameters, body, frame_size, closure, maxsize in images:
+        # Each definition is run by the engine itself, so it builds its own kind of function
+        definition = FunctionDefinition(name, parameters, body)
+        definition.frame_size = frame_size
+        program = Program([definition])
+        program.resolved = True
+        previous = variables.get(name, UNSET)
+        interpreter.interpret(program)
+        natives.append(variables.pop(name))
+        if previous is not UNSET:
+            variables[name] = previous
+
+    functions = [MemoizedFunction(native, image[5]) if image[5] is not None else native
+                 for native, image in zip(natives, images)]
+
+    def value(shipped):
+        if shipped.__class__ is not Ref:
+            return shipped
+        if shipped.kind == 'function':
+            return functions[shipped.value]
+        if shipped.kind == 'builtin':
+            return getattr(interpreter, shipped.value)
+        return UNSET
+
+    resolved = set()
+    def resolve_scope(scope):
+        while scope is not None and id(scope) not in resolved:
+            resolved.add(id(scope))
+            for slot in range(1, len(scope)):
+                scope[slot] = value(scope[slot])
+            scope = scope[0]
+
+    for native, function, image in zip(natives, functions, images):
+        closure = image[4]
+        resolve_scope(closure)
+        native.closure = closure
+        function.closure = closure
+
+    for name, shipped in global_values.items():
+        interpreter.environment.define(name, value(shipped))
+    return interpreter, functions[target.value]
+
+def run_chunk(task):
+    data, chunk = task
+    interpreter, function = load_job(data)
+    try:
+        results = [function.call(interpreter, [element]) for element in chunk]
+        if holds_function(results):
+            return None, f"pmap() cannot send the results of '{function.name}' back from workers; they contain functions"
+        return results, None
+    except RuntimeError as error:
+        # Sent back as the message; the exception itself does not survive pickling intact
+        return None, error.message
+    finally:
+        # Workers are terminated rather than exiting, which would lose buffered prints
+        sys.stdout.flush()
+
+pool = None
+pool_size = 0
+
+def get_pool(workers):
+    global pool, pool_size
+    if pool is None or pool_size != workers:
+        close_pool()
+        # Forked workers would otherwise inherit, and later repeat, unwritten output
+        sys.stdout.flush()
+        pool = multiprocessing.Pool(workers)
+        pool_size = workers
+    return pool
+
+def close_pool():
+    global pool
+    if pool is not None:
+        pool.terminate()
+        pool = None
+
+atexit.register(close_pool)
+
+def parallel_map(interpreter, function, values, workers=None, chunksize=None):
+    if isinstance(function, str):
+        function = interpreter.environment.get(function)
+    if not isinstance(function, Function):
+        raise RuntimeError("pmap() requires a function or the name of one as first argument")
+    if len(function.parameters) != 1:
+        raise RuntimeError(f"pmap() requires a function of one argument, '{function.name}' takes {len(function.parameters)}")
+    if not isinstance(values, SEQUENCE_TYPES):
+        raise RuntimeError("pmap() requires an array as second argument")
+    if workers is None:
+        workers = os.cpu_count() or 1
+    for what, count in (("number of workers", workers), ("chunk size", chunksize)):
+        if count is not None and (isinstance(count, bool) or not isinstance(count, int) or count < 1):
+            raise RuntimeError(f"pmap() requires a positive integer {what}")
+    if multiprocessing.current_process().daemon:
+        raise RuntimeError("pmap() cannot be called from a function run by pmap()")
+
+    if values.__class__ in (list, Range) and holds_function(values):
+        raise RuntimeError("pmap() cannot send the array to workers; it contains functions")
+
+    data = pickle.dumps(JobBuilder(interpreter, function.name).build(function))
+    if not values:
+        return []
+    if chunksize is None:
+        chunksize = -(-len(values) // (workers * CHUNKS_PER_WORKER))
+    tasks = [(data, values[start:start + chunksize]) for start in range(0, len(values), chunksize)]
+
+    results = []
+    for chunk_results, error in get_pool(workers).imap(run_chunk, tasks):
+        if error is not None:
+            raise RuntimeError(error)
+        results.extend(chunk_results)
+    return results
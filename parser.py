@@ -1,19 +1,42 @@
 from lexer import TokenType
 from ast_nodes import *
 
+# Tokens are pulled from the lexer as the parser needs them. Only a window around the
+# current token is kept: tokens more than BACKTRACK_LIMIT behind it are dropped once the
+# window has grown past WINDOW_SIZE, so memory does not grow with the source.
+BACKTRACK_LIMIT = 1
+WINDOW_SIZE = 64
+
 class Parser:
     def __init__(self, tokens):
-        self.tokens = tokens
+        # tokens may be a list or a lazy iterator such as Lexer.tokens()
+        self.tokens = iter(tokens)
+        self.buffer = []
+        # Position of buffer[0] in the token stream
+        self.buffer_start = 0
         self.position = 0
-        self.current_token = self.tokens[0] if tokens else None
+        self.current_token = self.token_at(0)
+
+    def token_at(self, position):
+        index = position - self.buffer_start
+        buffer = self.buffer
+        while index >= len(buffer):
+            token = next(self.tokens, None)
+            if token is None:
+                return None
+            buffer.append(token)
+        return buffer[index]
 
     def advance(self):
         self.position += 1
-        self.current_token = self.tokens[self.position] if self.position < len(self.tokens) else None
+        if self.position - self.buffer_start > WINDOW_SIZE:
+            keep_from = self.position - BACKTRACK_LIMIT
+            del self.buffer[:keep_from - self.buffer_start]
+            self.buffer_start = keep_from
+        self.current_token = self.token_at(self.position)
 
     def peek(self, offset=1):
-        peek_pos = self.position + offset
-        return self.tokens[peek_pos] if peek_pos < len(self.tokens) else None
+        return self.token_at(self.position + offset)
 
     def match(self, token_type):
         if self.current_token and self.current_token.type == token_type:
@@ -84,12 +107,12 @@ class Parser:
                 value_expr = self.parse_expression()
                 self.expect(TokenType.SEMICOLON)
 
-                array_var = Variable(name_token.value)
+                array_var = Variable(name_token.value, name_token.line, name_token.column)
                 array_access = ArrayAccess(array_var, index)
 
                 if compound_op:
                     # Compound assignment: arr[index] op= value becomes arr[index] = arr[index] op value
-                    binary_expr = BinaryExpression(array_access, compound_op, value_expr)
+                    binary_expr = binary_expression(array_access, compound_op, value_expr)
                     return ArrayAssignment(array_var, index, binary_expr, name_token.line, name_token.column)
                 else:
                     # Regular assignment
@@ -124,7 +147,7 @@ class Parser:
                 if compound_op:
                     # Compound assignment: var op= value becomes var = var op value
                     var_expr = Variable(name_token.value, name_token.line, name_token.column)
-                    binary_expr = BinaryExpression(var_expr, compound_op, value_expr)
+                    binary_expr = binary_expression(var_expr, compound_op, value_expr)
                     return Assignment(name_token.value, binary_expr, name_token.line, name_token.column)
                 else:
                     # Regular assignment
@@ -179,6 +202,18 @@ class Parser:
     def parse_for_statement(self):
         self.expect(TokenType.LPAREN)
 
+        # for (x in expr) or for (let x in expr)
+        offset = 1 if self.current_token.type == TokenType.LET else 0
+        name_token = self.peek(offset) if offset else self.current_token
+        following = self.peek(offset + 1)
+        if name_token and name_token.type == TokenType.IDENTIFIER and following and following.type == TokenType.IN:
+            for _ in range(offset + 2):
+                self.advance()
+            iterable = self.parse_expression()
+            self.expect(TokenType.RPAREN)
+            body = self.parse_block()
+            return ForInStatement(name_token.value, iterable, body, name_token.line, name_token.column)
+
         # Parse initializer (variable declaration or assignment or empty)
         initializer = None
         if self.match(TokenType.LET):
@@ -275,7 +310,7 @@ class Parser:
         while self.match(TokenType.OR):
             operator = "||"
             right = self.parse_and_expression()
-            expr = BinaryExpression(expr, operator, right)
+            expr = binary_expression(expr, operator, right)
 
         return expr
 
@@ -285,7 +320,7 @@ class Parser:
         while self.match(TokenType.AND):
             operator = "&&"
             right = self.parse_equality_expression()
-            expr = BinaryExpression(expr, operator, right)
+            expr = binary_expression(expr, operator, right)
 
         return expr
 
@@ -296,11 +331,11 @@ class Parser:
             if self.match(TokenType.EQUAL):
                 operator = "=="
                 right = self.parse_comparison_expression()
-                expr = BinaryExpression(expr, operator, right)
+                expr = binary_expression(expr, operator, right)
             elif self.match(TokenType.NOT_EQUAL):
                 operator = "!="
                 right = self.parse_comparison_expression()
-                expr = BinaryExpression(expr, operator, right)
+                expr = binary_expression(expr, operator, right)
             else:
                 break
 
@@ -313,19 +348,23 @@ class Parser:
             if self.match(TokenType.LESS):
                 operator = "<"
                 right = self.parse_additive_expression()
-                expr = BinaryExpression(expr, operator, right)
+                expr = binary_expression(expr, operator, right)
             elif self.match(TokenType.GREATER):
                 operator = ">"
                 right = self.parse_additive_expression()
-                expr = BinaryExpression(expr, operator, right)
+                expr = binary_expression(expr, operator, right)
             elif self.match(TokenType.LESS_EQUAL):
                 operator = "<="
                 right = self.parse_additive_expression()
-                expr = BinaryExpression(expr, operator, right)
+                expr = binary_expression(expr, operator, right)
             elif self.match(TokenType.GREATER_EQUAL):
                 operator = ">="
                 right = self.parse_additive_expression()
-                expr = BinaryExpression(expr, operator, right)
+                expr = binary_expression(expr, operator, right)
+            elif self.match(TokenType.IN):
+                operator = "in"
+                right = self.parse_additive_expression()
+                expr = binary_expression(expr, operator, right)
             else:
                 break
 
@@ -338,11 +377,11 @@ class Parser:
             if self.match(TokenType.PLUS):
                 operator = "+"
                 right = self.parse_multiplicative_expression()
-                expr = BinaryExpression(expr, operator, right)
+                expr = binary_expression(expr, operator, right)
             elif self.match(TokenType.MINUS):
                 operator = "-"
                 right = self.parse_multiplicative_expression()
-                expr = BinaryExpression(expr, operator, right)
+                expr = binary_expression(expr, operator, right)
             else:
                 break
 
@@ -355,15 +394,15 @@ class Parser:
             if self.match(TokenType.MULTIPLY):
                 operator = "*"
                 right = self.parse_unary_expression()
-                expr = BinaryExpression(expr, operator, right)
+                expr = binary_expression(expr, operator, right)
             elif self.match(TokenType.DIVIDE):
                 operator = "/"
                 right = self.parse_unary_expression()
-                expr = BinaryExpression(expr, operator, right)
+                expr = binary_expression(expr, operator, right)
             elif self.match(TokenType.MODULO):
                 operator = "%"
                 right = self.parse_unary_expression()
-                expr = BinaryExpression(expr, operator, right)
+                expr = binary_expression(expr, operator, right)
             else:
                 break
 
@@ -373,11 +412,11 @@ class Parser:
         if self.match(TokenType.NOT):
             operator = "!"
             operand = self.parse_unary_expression()
-            return UnaryExpression(operator, operand)
+            return unary_expression(operator, operand)
         elif self.match(TokenType.MINUS):
             operator = "-"
             operand = self.parse_unary_expression()
-            return UnaryExpression(operator, operand)
+            return unary_expression(operator, operand)
         elif self.match(TokenType.PLUS_PLUS):
             operand = self.parse_unary_expression()
             return PrefixIncrement(operand)
@@ -400,13 +439,15 @@ class Parser:
             return self.parse_postfix_operators(BooleanLiteral(False, token.line, token.column))
         elif self.match(TokenType.LBRACKET):
             return self.parse_array_literal()
+        elif self.match(TokenType.LBRACE):
+            return self.parse_map_or_set_literal(token)
         elif self.match(TokenType.IDENTIFIER):
             if self.current_token and self.current_token.type == TokenType.LPAREN:
                 # Function call
-                return self.parse_postfix_operators(self.parse_function_call(token.value))
+                return self.parse_postfix_operators(self.parse_function_call(token))
             elif self.current_token and self.current_token.type == TokenType.LBRACKET:
                 # Array access
-                return self.parse_postfix_operators(self.parse_array_access(token.value))
+                return self.parse_postfix_operators(self.parse_array_access(token))
             else:
                 # Variable reference
                 return self.parse_postfix_operators(Variable(token.value, token.line, token.column))
@@ -417,7 +458,7 @@ class Parser:
 
         return None
 
-    def parse_function_call(self, name):
+    def parse_function_call(self, name_token):
         self.expect(TokenType.LPAREN)
 
         arguments = []
@@ -429,7 +470,7 @@ class Parser:
 
         self.expect(TokenType.RPAREN)
 
-        return FunctionCall(name, arguments)
+        return FunctionCall(name_token.value, arguments, name_token.line, name_token.column)
 
     def parse_postfix_operators(self, expr):
         while True:
@@ -453,10 +494,32 @@ class Parser:
         self.expect(TokenType.RBRACKET)
         return ArrayLiteral(elements)
 
-    def parse_array_access(self, array_name):
+    def parse_map_or_set_literal(self, brace_token):
+        # {} is an empty map, {k: v, ...} a map and {a, b, ...} a set
+        if self.match(TokenType.RBRACE):
+            return MapLiteral([], [], brace_token.line, brace_token.column)
+
+        first = self.parse_expression()
+        if self.match(TokenType.COLON):
+            keys = [first]
+            values = [self.parse_expression()]
+            while self.match(TokenType.COMMA):
+                keys.append(self.parse_expression())
+                self.expect(TokenType.COLON)
+                values.append(self.parse_expression())
+            self.expect(TokenType.RBRACE)
+            return MapLiteral(keys, values, brace_token.line, brace_token.column)
+
+        elements = [first]
+        while self.match(TokenType.COMMA):
+            elements.append(self.parse_expression())
+        self.expect(TokenType.RBRACE)
+        return SetLiteral(elements, brace_token.line, brace_token.column)
+
+    def parse_array_access(self, name_token):
         self.expect(TokenType.LBRACKET)
         index = self.parse_expression()
         self.expect(TokenType.RBRACKET)
 
-        array_var = Variable(array_name)
-        return ArrayAccess(array_var, index)
+        array_var = Variable(name_token.value, name_token.line, name_token.column)
+        return ArrayAccess(array_var, index, name_token.line, name_token.column)
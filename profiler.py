@@ -0,0 +1,316 @@
+import sys
+import time
+import signal
+import marshal
+from ast_nodes import *
+from interpreter import Interpreter, Function, RuntimeError
+
+# Deterministic profiler for the tree-walking interpreter, used by `main.py --profile`.
+# ProfilingInterpreter replaces the dispatch entries of statements and function calls
+# with timed versions; the plain Interpreter is not touched, so running without the flag
+# costs nothing.
+#
+# Functions are keyed like cProfile's entries, (filename, line, name), so the results can
+# be written as a pstats file. Builtins use the filename '~'. The script's top level is
+# the pseudo-function '<module>'. Lines are timed per statement: a line's self time
+# excludes the statements nested under it (loop bodies, called functions), its
+# cumulative time includes them.
+#
+# Sampler, used by `main.py --sample`, instead leaves the interpreter alone: a CPU timer
+# signal interrupts the run every few milliseconds and the handler reads the SimpleScript
+# call stack off the Python stack, from the Function.call frames and the `node` each
+# visitor method is evaluating. The samples add up to folded stacks, one
+# "<module> (file:line);name (file:line);... count" line per distinct stack, the input
+# format of flamegraph.pl and compatible tools.
+
+# Statements that get no line of their own: containers whose statements are timed
+# individually, and jumps that do no work
+UNTIMED_STATEMENTS = (Program, BlockStatement, BreakStatement, ContinueStatement)
+
+def first_line(node, cache):
+    line = cache.get(id(node))
+    if line is None:
+        # Statements such as if, while or expression statements carry no position
+        # themselves; their first line is the lowest among their nodes
+        lines = [child.line for child in walk(node) if child.line is not None]
+        line = cache[id(node)] = min(lines) if lines else 0
+    return line
+
+class Timing:
+    __slots__ = ('primitive_calls', 'calls', 'self_time', 'cumulative', 'active', 'callers')
+
+    def __init__(self):
+        self.primitive_calls = 0
+        self.calls = 0
+        self.self_time = 0.0
+        self.cumulative = 0.0
+        # Frames of this entry currently on the stack; only the outermost one of a
+        # recursive chain adds to the cumulative time
+        self.active = 0
+        self.callers = {}
+
+class Tracker:
+    # Keeps a stack of running frames and the per-key timings they add up to
+    def __init__(self, timer, track_callers=False):
+        self.timer = timer
+        self.track_callers = track_callers
+        self.timings = {}
+        self.stack = []
+
+    def enter(self, key):
+        timing = self.timings.get(key)
+        if timing is None:
+            timing = self.timings[key] = Timing()
+        timing.active += 1
+        # [key, timing, start, time spent in nested frames]
+        self.stack.append([key, timing, self.timer(), 0.0])
+
+    def exit(self):
+        key, timing, start, nested = self.stack.pop()
+        elapsed = self.timer() - start
+        own = elapsed - nested
+        timing.active -= 1
+        primitive = timing.active == 0
+
+        timing.calls += 1
+        timing.self_time += own
+        if primitive:
+            timing.primitive_calls += 1
+            timing.cumulative += elapsed
+
+        if self.stack:
+            caller = self.stack[-1]
+            caller[3] += elapsed
+            if self.track_callers:
+                edge = timing.callers.get(caller[0])
+                if edge is None:
+                    edge = timing.callers[caller[0]] = [0, 0, 0.0, 0.0]
+                edge[0] += 1
+                edge[1] += primitive
+                edge[2] += own
+                if primitive:
+                    edge[3] += elapsed
+
+class Profiler:
+    def __init__(self, filename="<string>", timer=time.perf_counter):
+        self.filename = filename
+        self.functions = Tracker(timer, track_callers=True)
+        self.lines = Tracker(timer)
+        # Line of each timed statement, found on first execution
+        self.statement_lines = {}
+        self.function_keys = {}
+
+    def module_key(self):
+        return (self.filename, 1, '<module>')
+
+    def function_key(self, function):
+        if isinstance(function, Function):
+            # Every Function made from one definition shares its body node
+            key = self.function_keys.get(id(function.body))
+            if key is None:
+                key = (self.filename, 0, function.name)
+            return key
+        name = getattr(function, '__name__', repr(function))
+        if name.startswith('builtin_'):
+            name = name[len('builtin_'):]
+        return ('~', 0, f'<builtin {name}>')
+
+    def define_function(self, node):
+        self.function_keys[id(node.body)] = (self.filename, node.line or 0, node.name)
+
+    def statement_line(self, node):
+        return first_line(node, self.statement_lines)
+
+    def stats(self):
+        # The pstats layout: {(file, line, name): (cc, nc, tt, ct, {caller: (nc, cc, tt, ct)})};
+        # caller edges list the total calls first, unlike the entries themselves
+        return {
+            key: (timing.primitive_calls, timing.calls, timing.self_time, timing.cumulative,
+                  {caller: tuple(edge) for caller, edge in timing.callers.items()})
+            for key, timing in self.functions.timings.items()
+        }
+
+    def dump_stats(self, path):
+        with open(path, 'wb') as f:
+            marshal.dump(self.stats(), f)
+
+    def print_report(self, source_code=None, limit=20, stream=None):
+        stream = stream or sys.stderr
+        functions = sorted(self.functions.timings.items(), key=lambda item: -item[1].self_time)
+        total = sum(timing.self_time for _, timing in functions)
+
+        print(f"Profile: {sum(timing.calls for _, timing in functions)} calls, {total:.3f}s", file=stream)
+        print(file=stream)
+        print(f"{'calls':>10} {'self (s)':>10} {'self %':>7} {'cumul (s)':>10}  function", file=stream)
+        for (filename, line, name), timing in functions[:limit]:
+            calls = str(timing.calls) if timing.calls == timing.primitive_calls else f"{timing.calls}/{timing.primitive_calls}"
+            share = timing.self_time / total * 100 if total else 0.0
+            location = f"{name} (line {line})" if filename != '~' and line else name
+            print(f"{calls:>10} {timing.self_time:10.4f} {share:6.1f}% {timing.cumulative:10.4f}  {location}", file=stream)
+
+        source_lines = source_code.splitlines() if source_code is not None else []
+        lines = sorted(self.lines.timings.items(), key=lambda item: -item[1].self_time)
+        print(file=stream)
+        print(f"{'line':>6} {'hits':>10} {'self (s)':>10} {'self %':>7} {'cumul (s)':>10}  source", file=stream)
+        for line, timing in lines[:limit]:
+            text = source_lines[line - 1].strip() if 0 < line <= len(source_lines) else ''
+            share = timing.self_time / total * 100 if total else 0.0
+            print(f"{line:>6} {timing.calls:>10} {timing.self_time:10.4f} {share:6.1f}% {timing.cumulative:10.4f}  {text}", file=stream)
+
+class ProfilingInterpreter(Interpreter):
+    # Calls are timed in visit_function_call, and tail calls as Function.call runs them
+    def __init__(self, profiler=None):
+        self.profiler = profiler or Profiler()
+        super().__init__()
+
+    def build_dispatch(self):
+        dispatch = super().build_dispatch()
+        profiler = self.profiler
+        lines = profiler.lines
+        statement_line = profiler.statement_line
+
+        def timed(handler):
+            def run(node):
+                lines.enter(statement_line(node))
+                try:
+                    return handler(node)
+                finally:
+                    lines.exit()
+            return run
+
+        for node_class, handler in list(dispatch.items()):
+            if issubclass(node_class, Statement) and not issubclass(node_class, UNTIMED_STATEMENTS):
+                dispatch[node_class] = timed(handler)
+        self.observes_calls = True
+        return dispatch
+
+    def enter_tail_call(self, function, arguments):
+        super().enter_tail_call(function, arguments)
+        self.profiler.functions.enter(self.profiler.function_key(function))
+
+    def exit_tail_calls(self, functions, value):
+        # Each tail-called function's time runs until the whole chain returns, as it
+        # would have had the calls nested
+        for _ in functions:
+            self.profiler.functions.exit()
+        super().exit_tail_calls(functions, value)
+
+    def interpret(self, program):
+        functions = self.profiler.functions
+        functions.enter(self.profiler.module_key())
+        try:
+            return super().interpret(program)
+        finally:
+            functions.exit()
+
+    def visit_function_definition(self, node):
+        self.profiler.define_function(node)
+        return super().visit_function_definition(node)
+
+    def visit_function_call(self, node):
+        func = self.lookup(node)
+
+        if not callable(func):
+            raise RuntimeError(f"'{node.name}' is not a function")
+
+        dispatch = self.dispatch
+        arguments = [dispatch[arg.__class__](arg) for arg in node.arguments]
+
+        functions = self.profiler.functions
+        functions.enter(self.profiler.function_key(func))
+        try:
+            if isinstance(func, Function):
+                return func(self, arguments)
+            return func(*arguments)
+        finally:
+            functions.exit()
+
+FUNCTION_CALL_CODE = Function.call.__code__
+
+class Sampler:
+    def __init__(self, filename="<string>", interval=0.001):
+        if not hasattr(signal, 'setitimer'):
+            raise OSError("Sampling needs signal.setitimer, which this platform does not have")
+        self.filename = filename
+        self.interval = interval
+        self.counts = {}
+        self.samples = 0
+        # Time spent in the signal handler itself
+        self.overhead = 0.0
+        self.statement_lines = {}
+        self.previous_handler = None
+
+    def start(self):
+        self.previous_handler = signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self.previous_handler or signal.SIG_DFL)
+
+    def sample(self, signum, frame):
+        began = time.perf_counter()
+        stack = self.call_stack(frame)
+        self.counts[stack] = self.counts.get(stack, 0) + 1
+        self.samples += 1
+        self.overhead += time.perf_counter() - began
+
+    def call_stack(self, frame):
+        # Walks outwards from the interrupted frame. Each Function.call frame closes the
+        # function running above it, which is at the innermost statement seen since.
+        labels = []
+        statement = None
+        builtin = None
+        while frame is not None:
+            code = frame.f_code
+            if code is FUNCTION_CALL_CODE:
+                # `function` is the callee of the latest tail call, once it is set
+                local_variables = frame.f_locals
+                function = local_variables.get('function') or local_variables['self']
+                labels.append(self.label(function.name, statement))
+                statement = None
+            elif statement is None and 'node' in code.co_varnames:
+                node = frame.f_locals.get('node')
+                if isinstance(node, Statement) and not isinstance(node, UNTIMED_STATEMENTS):
+                    statement = node
+            elif not labels and statement is None and code.co_name.startswith('builtin_'):
+                builtin = f"<builtin {code.co_name[len('builtin_'):]}>"
+            frame = frame.f_back
+        labels.append(self.label('<module>', statement))
+        labels.reverse()
+        if builtin is not None:
+            labels.append(builtin)
+        return ';'.join(labels)
+
+    def label(self, name, statement):
+        if statement is None:
+            return name
+        return f"{name} ({self.filename}:{first_line(statement, self.statement_lines)})"
+
+    def folded(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in sorted(self.counts.items()))
+
+    def write_folded(self, path):
+        with open(path, 'w') as f:
+            f.write(self.folded())
+
+    def print_report(self, limit=20, stream=None):
+        # Flattened for the terminal: samples whose innermost frame is at a line, and
+        # samples with a function anywhere on the stack. The full stacks are in folded().
+        stream = stream or sys.stderr
+        leaves = {}
+        functions = {}
+        for stack, count in self.counts.items():
+            labels = stack.split(';')
+            leaves[labels[-1]] = leaves.get(labels[-1], 0) + count
+            for name in {label.split(' (', 1)[0] for label in labels}:
+                functions[name] = functions.get(name, 0) + count
+
+        print(f"Sampled every {self.interval * 1000:g} ms of CPU time: {self.samples} samples, "
+              f"{self.overhead * 1000:.1f} ms in the sampler", file=stream)
+        for title, counts in (("self", leaves), ("total", functions)):
+            print(file=stream)
+            print(f"{title:>8} {'share':>7}  {'location' if title == 'self' else 'function'}", file=stream)
+            for label, count in sorted(counts.items(), key=lambda item: -item[1])[:limit]:
+                share = count / self.samples * 100 if self.samples else 0.0
+                print(f"{count:>8} {share:6.1f}%  {label}", file=stream)
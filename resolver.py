@@ -0,0 +1,223 @@
+from ast_nodes import *
+
+# Static scope resolution. Every local name gets a (depth, slot) address: `depth` counts
+# the scopes to walk up at runtime and `slot` indexes that scope's list (slot 0 holds the
+# parent scope). Names not found in any local scope are globals, addressed by name with
+# depth and slot left as None. Blocks that declare nothing get frame_size 0 and no scope.
+
+class Scope:
+    def __init__(self):
+        self.slots = {}
+        # Function definitions whose bodies are resolved once this scope is complete
+        self.deferred = []
+
+    def declare(self, name):
+        if name not in self.slots:
+            self.slots[name] = len(self.slots) + 1
+        return self.slots[name]
+
+class Resolver:
+    def __init__(self, builtins=()):
+        self.builtins = set(builtins)
+        self.globals = set()
+        self.scopes = []
+        self.deferred = []
+        self.global_reads = []
+        self.in_function = False
+        # Index in self.scopes of the innermost function's own scope
+        self.function_base = 0
+
+    def resolve(self, program):
+        program.accept(self)
+
+        # Function bodies see every name their enclosing scope declares, including
+        # those declared after the definition, just as a closure would at call time.
+        for node, scopes in self.deferred:
+            self.resolve_function(node, scopes)
+
+        for node in self.global_reads:
+            if node.name not in self.globals and node.name not in self.builtins:
+                raise ValueError(f"Undefined variable '{node.name}' at line {node.line}, column {node.column}")
+
+        program.resolved = True
+        return program
+
+    def declare(self, name, node):
+        if self.scopes:
+            node.slot = self.scopes[-1].declare(name)
+        else:
+            node.slot = None
+            self.globals.add(name)
+
+    def reference(self, name, node, read=True):
+        addresses = []
+        depth = 0
+        for scope in reversed(self.scopes):
+            if name in scope.slots:
+                addresses.append((depth, scope.slots[name]))
+            depth += 1
+
+        if addresses:
+            node.depth, node.slot = addresses[0]
+            # A function body may run before a declaration in an enclosing scope does;
+            # until then it reads and assigns the next binding outwards, or the global,
+            # as it did when names were looked up by walking environments
+            node.fallback = tuple(addresses[1:])
+            if not read and node.depth >= len(self.scopes) - self.function_base:
+                self.globals.add(name)
+            return
+
+        node.depth = None
+        node.slot = None
+        if read:
+            self.global_reads.append(node)
+        else:
+            # Assigning an undeclared name defines it globally
+            self.globals.add(name)
+
+    def resolve_statements(self, statements):
+        for statement in statements:
+            statement.accept(self)
+
+    def resolve_expression(self, node):
+        if node is not None:
+            node.accept(self)
+
+    def close_scope(self, scope):
+        for node, scopes in scope.deferred:
+            self.resolve_function(node, scopes)
+
+    def resolve_function(self, node, scopes):
+        scope = Scope()
+        for parameter in node.parameters:
+            scope.declare(parameter)
+
+        # Parameters and the body's own declarations share one scope
+        saved = self.scopes, self.in_function, self.function_base
+        self.scopes = scopes + [scope]
+        self.in_function = True
+        self.function_base = len(scopes)
+        self.resolve_statements(node.body.statements)
+        self.close_scope(scope)
+        self.scopes, self.in_function, self.function_base = saved
+
+        node.body.frame_size = 0
+        node.frame_size = len(scope.slots)
+
+    def visit_program(self, node):
+        self.resolve_statements(node.statements)
+
+    def visit_variable_declaration(self, node):
+        self.resolve_expression(node.value)
+        self.declare(node.name, node)
+
+    def visit_assignment(self, node):
+        self.resolve_expression(node.value)
+        self.reference(node.name, node, read=False)
+
+    def visit_if_statement(self, node):
+        self.resolve_expression(node.condition)
+        node.then_block.accept(self)
+        if node.else_block:
+            node.else_block.accept(self)
+
+    def visit_while_statement(self, node):
+        self.resolve_expression(node.condition)
+        node.body.accept(self)
+
+    def visit_for_statement(self, node):
+        # The initializer declares into the enclosing scope
+        if node.initializer:
+            node.initializer.accept(self)
+        self.resolve_expression(node.condition)
+        self.resolve_expression(node.increment)
+        node.body.accept(self)
+
+    def visit_for_in_statement(self, node):
+        self.resolve_expression(node.iterable)
+        self.declare(node.name, node)
+        node.body.accept(self)
+
+    def visit_break_statement(self, node):
+        pass
+
+    def visit_continue_statement(self, node):
+        pass
+
+    def visit_function_definition(self, node):
+        self.declare(node.name, node)
+        pending = self.scopes[-1].deferred if self.scopes else self.deferred
+        pending.append((node, list(self.scopes)))
+
+    def visit_return_statement(self, node):
+        self.resolve_expression(node.value)
+        # Nothing runs in the function after a return, so the call can replace its frame
+        node.tail_call = self.in_function and isinstance(node.value, FunctionCall)
+
+    def visit_block_statement(self, node):
+        if not declares_names(node.statements):
+            node.frame_size = 0
+            self.resolve_statements(node.statements)
+            return
+
+        scope = Scope()
+        self.scopes.append(scope)
+        self.resolve_statements(node.statements)
+        self.close_scope(scope)
+        self.scopes.pop()
+        node.frame_size = len(scope.slots)
+
+    def visit_expression_statement(self, node):
+        self.resolve_expression(node.expression)
+
+    def visit_binary_expression(self, node):
+        self.resolve_expression(node.left)
+        self.resolve_expression(node.right)
+
+    def visit_unary_expression(self, node):
+        self.resolve_expression(node.operand)
+
+    def visit_literal(self, node):
+        pass
+
+    def visit_variable(self, node):
+        self.reference(node.name, node)
+
+    def visit_function_call(self, node):
+        self.reference(node.name, node)
+        for argument in node.arguments:
+            self.resolve_expression(argument)
+
+    def visit_array_literal(self, node):
+        for element in node.elements:
+            self.resolve_expression(element)
+
+    def visit_map_literal(self, node):
+        for key, value in zip(node.keys, node.values):
+            self.resolve_expression(key)
+            self.resolve_expression(value)
+
+    def visit_set_literal(self, node):
+        for element in node.elements:
+            self.resolve_expression(element)
+
+    def visit_array_access(self, node):
+        self.resolve_expression(node.array)
+        self.resolve_expression(node.index)
+
+    def visit_array_assignment(self, node):
+        self.resolve_expression(node.array)
+        self.resolve_expression(node.index)
+        self.resolve_expression(node.value)
+
+    def visit_prefix_increment(self, node):
+        self.resolve_expression(node.operand)
+
+    def visit_prefix_decrement(self, node):
+        self.resolve_expression(node.operand)
+
+    def visit_postfix_increment(self, node):
+        self.resolve_expression(node.operand)
+
+    def visit_postfix_decrement(self, node):
+        self.resolve_expression(node.operand)
@@ -0,0 +1,129 @@
+import itertools
+
+# Lazy strings. `s = s + piece` in a loop would copy the whole accumulated string on
+# every +, so once the left operand of a string + is ROPE_THRESHOLD characters or longer
+# the result is a Rope instead: a deferred join buffer that is only flattened into a
+# str when something observes its text (print, substring, comparison, str(), ...).
+# len() is kept alongside, so it does not flatten.
+#
+# Ropes behave as values. Appending to a rope adds the piece to a buffer shared with
+# the rope it came from, so a chain of appends costs O(1) each; appending to a rope that
+# has already been extended copies its own prefix of the buffer first.
+#
+# stringbuilder() makes a StringBuilder, the explicit, mutable version: push() (or its
+# alias append()) adds to it in amortized O(1), and str() gives the text.
+
+ROPE_THRESHOLD = 256
+
+class Rope:
+    __slots__ = ('parts', 'count', 'length', 'text')
+
+    def __init__(self, parts, count, length):
+        # The rope is the first count pieces of parts
+        self.parts = parts
+        self.count = count
+        self.length = length
+        self.text = None
+
+    def append(self, text):
+        parts = self.parts
+        if len(parts) != self.count:
+            parts = parts[:self.count]
+        parts.append(text)
+        return Rope(parts, self.count + 1, self.length + len(text))
+
+    def __str__(self):
+        if self.text is None:
+            parts = self.parts
+            if len(parts) != self.count:
+                parts = itertools.islice(parts, self.count)
+            self.text = ''.join(parts)
+            # Later appends start from the flat text
+            self.parts = [self.text]
+            self.count = 1
+        return self.text
+
+    def __repr__(self):
+        return repr(str(self))
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return iter(str(self))
+
+    def __add__(self, other):
+        return concat(self, other)
+
+    def __radd__(self, other):
+        return concat(other, self)
+
+    # Python calls the reflected comparison itself when the left operand is a str
+    def __eq__(self, other):
+        if isinstance(other, STRING_TYPES):
+            return len(other) == self.length and str(self) == str(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        if isinstance(other, STRING_TYPES):
+            return len(other) != self.length or str(self) != str(other)
+        return NotImplemented
+
+    def __lt__(self, other):
+        if isinstance(other, STRING_TYPES):
+            return str(self) < str(other)
+        return NotImplemented
+
+    def __gt__(self, other):
+        if isinstance(other, STRING_TYPES):
+            return str(self) > str(other)
+        return NotImplemented
+
+    def __le__(self, other):
+        if isinstance(other, STRING_TYPES):
+            return str(self) <= str(other)
+        return NotImplemented
+
+    def __ge__(self, other):
+        if isinstance(other, STRING_TYPES):
+            return str(self) >= str(other)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(str(self))
+
+# Values that are strings to the language
+STRING_TYPES = (str, Rope)
+
+def concat(left, right):
+    # `left + right` where either side is a string
+    if left.__class__ is Rope:
+        return left.append(str(right))
+    left = str(left)
+    if len(left) < ROPE_THRESHOLD:
+        return left + str(right)
+    right = str(right)
+    return Rope([left, right], 2, len(left) + len(right))
+
+class StringBuilder:
+    __slots__ = ('parts', 'length')
+
+    def __init__(self, text=''):
+        self.parts = [text] if text else []
+        self.length = len(text)
+
+    def append(self, text):
+        self.parts.append(text)
+        self.length += len(text)
+
+    def __str__(self):
+        parts = self.parts
+        if len(parts) > 1:
+            parts[:] = [''.join(parts)]
+        return parts[0] if parts else ''
+
+    def __repr__(self):
+        return repr(str(self))
+
+    def __len__(self):
+        return self.length
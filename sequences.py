@@ -0,0 +1,67 @@
+# Lazy ranges, the values returned by range(). They hold a Python range instead of the
+# list it would produce, so `for (i in range(10000000))` allocates nothing per element.
+# len(), indexing, slice(), iteration, str() and comparison with arrays behave as they
+# did for the materialized list, and + concatenates into a new array. A range is still
+# an array to the language: the first element assignment, push() or pop() materializes
+# it into a list in place, so every variable holding it sees the change.
+
+class Range:
+    __slots__ = ('values',)
+
+    def __init__(self, values):
+        # A Python range until the first write, a list after it
+        self.values = values
+
+    def materialize(self):
+        values = self.values
+        if values.__class__ is range:
+            values = self.values = list(values)
+        return values
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            values = self.values[index]
+            return Range(values) if values.__class__ is range else values
+        return self.values[index]
+
+    def __setitem__(self, index, value):
+        self.materialize()[index] = value
+
+    def append(self, value):
+        self.materialize().append(value)
+
+    def pop(self):
+        return self.materialize().pop()
+
+    # Printed like the array it stands for
+    def __repr__(self):
+        return repr(list(self.values))
+
+    __str__ = __repr__
+
+    def __eq__(self, other):
+        if isinstance(other, Range):
+            other = other.values
+            if self.values.__class__ is range and other.__class__ is range:
+                return self.values == other
+        elif not isinstance(other, list):
+            return NotImplemented
+        return len(other) == len(self.values) and list(self.values) == list(other)
+
+    __hash__ = None
+
+    def __add__(self, other):
+        if isinstance(other, (list, Range)):
+            return list(self.values) + list(other)
+        return NotImplemented
+
+    def __radd__(self, other):
+        if isinstance(other, list):
+            return other + list(self.values)
+        return NotImplemented
@@ -2,7 +2,7 @@
 
 import sys
 import os
-from main import run
+from main import run, script_source
 
 def main():
     # Get the script file path (the .ss file being executed)
@@ -26,12 +26,7 @@ def main():
         lines = f.readlines()
 
     # Skip the shebang line (first line) and any empty lines
-    source_lines = []
-    for line in lines[1:]:  # Skip first line (shebang)
-        if line.strip():  # Skip empty lines
-            source_lines.append(line)
-
-    source_code = ''.join(source_lines)
+    source_code = script_source(lines)
 
     # Run the script
     run(source_code, script_file)
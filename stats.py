@@ -0,0 +1,142 @@
+import sys
+import json
+import time
+import contextlib
+from ast_nodes import BlockStatement, ReturnStatement, BreakStatement, ContinueStatement, walk
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Run statistics for `main.py --stats`, or for callers passing a RunStats to main.run:
+# wall and CPU time per phase, the size of the program, peak memory, and what the run
+# did. Calls, environments and control-flow signals are counted through interpreter
+# hooks, so they are only available on the tree engine. The hooks run inside the timed
+# interpret phase, so on that engine the report marks the phase as instrumented: its
+# times are not comparable with the other engines'. Break, continue and return are
+# completion signals rather than Python exceptions here; the count is of those signals.
+# Functions wrapped by memoize() report their cache hits, misses and evictions on every
+# engine.
+
+CONTROL_FLOW_STATEMENTS = (ReturnStatement, BreakStatement, ContinueStatement)
+
+class RunStats:
+    def __init__(self):
+        self.engine = None
+        self.phases = {}
+        self.cache_hit = None
+        self.tokens = None
+        self.nodes = None
+        self.environments = None
+        self.calls = None
+        self.builtin_calls = None
+        self.control_flow = None
+        self.memoized = []
+        # Whether counting hooks ran during the interpret phase
+        self.instrumented = False
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            self.phases[name] = (time.perf_counter() - wall, time.process_time() - cpu)
+
+    def count_nodes(self, program):
+        self.nodes = sum(1 for _ in walk(program))
+
+    def attach(self, interpreter):
+        # Filled in as the script calls memoize(), on every engine
+        self.memoized = interpreter.memoized
+        if not interpreter.supports_hooks:
+            return
+        self.instrumented = True
+        # The global environment
+        self.environments = 1
+        self.calls = self.builtin_calls = self.control_flow = 0
+        interpreter.on_statement(self.count_statement)
+        interpreter.on_call(self.count_call)
+        interpreter.on_builtin(self.count_builtin)
+
+    def count_statement(self, node):
+        node_class = node.__class__
+        if node_class is BlockStatement:
+            if node.frame_size:
+                self.environments += 1
+        elif node_class in CONTROL_FLOW_STATEMENTS:
+            self.control_flow += 1
+
+    def count_call(self, function, arguments):
+        self.calls += 1
+        self.environments += 1
+
+    def count_builtin(self, name, arguments):
+        self.builtin_calls += 1
+
+    def peak_memory(self):
+        # Peak resident set size of the process in bytes; ru_maxrss is in kilobytes on
+        # Linux and bytes on macOS
+        if resource is None:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+    def as_dict(self):
+        return {
+            'engine': self.engine,
+            'phases': {name: {'wall': wall, 'cpu': cpu} for name, (wall, cpu) in self.phases.items()},
+            'interpret_instrumented': self.instrumented,
+            'cache_hit': self.cache_hit,
+            'tokens': self.tokens,
+            'nodes': self.nodes,
+            'peak_memory': self.peak_memory(),
+            'environments': self.environments,
+            'calls': self.calls,
+            'builtin_calls': self.builtin_calls,
+            'control_flow_signals': self.control_flow,
+            'memoized': [{'function': function.name, 'hits': function.hits, 'misses': function.misses,
+                          'evictions': function.evictions, 'size': len(function.cache), 'maxsize': function.maxsize}
+                         for function in self.memoized],
+        }
+
+    def report(self, format='text', stream=None):
+        stream = stream or sys.stderr
+        stats = self.as_dict()
+        if format == 'json':
+            print(json.dumps(stats, indent=2), file=stream)
+            return
+
+        def count(value):
+            return 'n/a' if value is None else str(value)
+
+        print(f"Run statistics ({stats['engine']} engine)", file=stream)
+        print(f"{'phase':12} {'wall (ms)':>10} {'cpu (ms)':>10}", file=stream)
+        for name, (wall, cpu) in self.phases.items():
+            if name == 'interpret' and self.instrumented:
+                name += '*'
+            print(f"{name:12} {wall * 1000:10.2f} {cpu * 1000:10.2f}", file=stream)
+        total_wall = sum(wall for wall, _ in self.phases.values())
+        total_cpu = sum(cpu for _, cpu in self.phases.values())
+        print(f"{'total':12} {total_wall * 1000:10.2f} {total_cpu * 1000:10.2f}", file=stream)
+        if self.instrumented and 'interpret' in self.phases:
+            print("* instrumented: includes the counting hooks, not comparable with other engines", file=stream)
+        print(file=stream)
+        if stats['cache_hit']:
+            print("program loaded from the cache; tokens not counted", file=stream)
+        print(f"tokens:               {count(stats['tokens'])}", file=stream)
+        print(f"AST nodes:            {count(stats['nodes'])}", file=stream)
+        peak = stats['peak_memory']
+        print(f"peak memory:          {'n/a' if peak is None else f'{peak / (1024 * 1024):.1f} MB'}", file=stream)
+        print(f"environments created: {count(stats['environments'])}", file=stream)
+        print(f"function calls:       {count(stats['calls'])} user, {count(stats['builtin_calls'])} builtin", file=stream)
+        print(f"control-flow signals: {count(stats['control_flow_signals'])} (return, break, continue)", file=stream)
+        for memo in stats['memoized']:
+            print(f"memoized {memo['function']}: {memo['hits']} hits, {memo['misses']} misses, "
+                  f"{memo['evictions']} evictions, {memo['size']}/{memo['maxsize']} cached", file=stream)
+
+def phase(stats, name):
+    # Times the block if statistics are being collected
+    return stats.phase(name) if stats is not None else contextlib.nullcontext()
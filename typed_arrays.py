@@ -0,0 +1,240 @@
+import array
+import operator
+import itertools
+from errors import RuntimeError
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Typed numeric arrays, the values made by the farray() and iarray() builtins. They are
+# array.array buffers of C doubles or 64-bit integers, so elements are stored unboxed and
+# the bulk builtins (sum, fill, scale, dot, cumsum, minmax) run over the whole buffer at
+# once. With NumPy installed, buffers of NUMPY_THRESHOLD elements or more are handed to
+# it as zero-copy views; smaller ones, and everything when NumPy is missing, go through
+# the array module and Python's builtins, which are faster than NumPy's call overhead
+# on short arrays anyway. The kernels below also accept plain arrays (lists) of numbers.
+#
+# Storing a value of the wrong type (a float or out-of-range integer in an iarray, a
+# non-number in either) raises TypeError or OverflowError; the interpreter turns those
+# into runtime errors.
+#
+# The arithmetic operators and the ordering comparisons (< > <= >=) work element by
+# element on typed arrays, so every engine gets them from plain Python operators. The
+# other operand is a number, or an array of the same length; a plain array mixed with a
+# typed one is converted first. Results are farrays if either side holds floats or the
+# operator is /, iarrays otherwise; comparisons give iarrays of 1 and 0.
+#
+# == and != compare whole arrays and give a boolean, as they do for plain arrays, so that
+# conditions, array equality and `in` keep working on typed arrays. Plain arrays on their
+# own keep their meaning too: + concatenates.
+
+FLOAT = 'd'
+INT = 'q'
+TYPE_NAMES = {FLOAT: 'farray', INT: 'iarray'}
+NUMPY_THRESHOLD = 64
+
+class TypedArray(array.array):
+    __slots__ = ()
+
+    # Printed like plain arrays
+    def __repr__(self):
+        return repr(self.tolist())
+
+    __str__ = __repr__
+
+    def type_name(self):
+        return TYPE_NAMES[self.typecode]
+
+    def __add__(self, other):
+        return elementwise('+', self, other)
+
+    def __radd__(self, other):
+        return elementwise('+', other, self)
+
+    def __sub__(self, other):
+        return elementwise('-', self, other)
+
+    def __rsub__(self, other):
+        return elementwise('-', other, self)
+
+    def __mul__(self, other):
+        return elementwise('*', self, other)
+
+    def __rmul__(self, other):
+        return elementwise('*', other, self)
+
+    def __truediv__(self, other):
+        return elementwise('/', self, other)
+
+    def __rtruediv__(self, other):
+        return elementwise('/', other, self)
+
+    def __mod__(self, other):
+        return elementwise('%', self, other)
+
+    def __rmod__(self, other):
+        return elementwise('%', other, self)
+
+    # Equal to a typed or plain array holding equal numbers, whatever the element type
+    def __eq__(self, other):
+        if isinstance(other, array.array):
+            return len(self) == len(other) and array.array.__eq__(self, other)
+        if isinstance(other, list):
+            return len(self) == len(other) and self.tolist() == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    # Python calls the reflected comparison itself when the left operand is not a
+    # typed array
+
+    def __lt__(self, other):
+        return elementwise('<', self, other)
+
+    def __gt__(self, other):
+        return elementwise('>', self, other)
+
+    def __le__(self, other):
+        return elementwise('<=', self, other)
+
+    def __ge__(self, other):
+        return elementwise('>=', self, other)
+
+    __hash__ = None
+
+# Values the interpreter can index
+ARRAY_TYPES = (list, TypedArray)
+
+def make_array(typecode, size, value):
+    check_element(typecode, value)
+    return TypedArray(typecode, array.array(typecode, [value]) * size)
+
+def check_element(typecode, value):
+    # Checked before a bulk operation touches the buffer, so a bad value leaves it intact
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise TypeError(f"{TYPE_NAMES[typecode]} elements must be numbers")
+    if typecode == INT and not isinstance(value, int):
+        raise TypeError("iarray elements must be integers")
+
+def uses_numpy(values):
+    return numpy is not None and values.__class__ is TypedArray and len(values) >= NUMPY_THRESHOLD
+
+def view(values):
+    return numpy.frombuffer(values, dtype=values.typecode)
+
+def copy_like(values, elements):
+    # A new array of the same kind as values holding elements
+    if values.__class__ is TypedArray:
+        return TypedArray(values.typecode, elements)
+    return list(elements)
+
+def array_sum(values):
+    if uses_numpy(values):
+        return view(values).sum().item()
+    return sum(values)
+
+def array_fill(values, value):
+    if values.__class__ is TypedArray:
+        check_element(values.typecode, value)
+        values[:] = array.array(values.typecode, [value]) * len(values)
+    else:
+        values[:] = [value] * len(values)
+    return values
+
+def array_scale(values, factor):
+    if values.__class__ is TypedArray:
+        check_element(values.typecode, factor)
+        if uses_numpy(values):
+            numbers = view(values)
+            numbers *= factor
+            return values
+        values[:] = array.array(values.typecode, [element * factor for element in values])
+    else:
+        values[:] = [element * factor for element in values]
+    return values
+
+def array_dot(left, right):
+    if uses_numpy(left) and uses_numpy(right):
+        return numpy.dot(view(left), view(right)).item()
+    return sum(map(operator.mul, left, right))
+
+def array_cumsum(values):
+    if uses_numpy(values):
+        return TypedArray(values.typecode, numpy.cumsum(view(values)).tobytes())
+    return copy_like(values, itertools.accumulate(values))
+
+def array_minmax(values):
+    if uses_numpy(values):
+        numbers = view(values)
+        return [numbers.min().item(), numbers.max().item()]
+    return [min(values), max(values)]
+
+OPERATORS = {
+    '+': (operator.add, 'add'),
+    '-': (operator.sub, 'subtract'),
+    '*': (operator.mul, 'multiply'),
+    '/': (operator.truediv, 'true_divide'),
+    '%': (operator.mod, 'remainder'),
+    '<': (operator.lt, 'less'),
+    '>': (operator.gt, 'greater'),
+    '<=': (operator.le, 'less_equal'),
+    '>=': (operator.ge, 'greater_equal'),
+}
+COMPARISONS = ('<', '>', '<=', '>=')
+
+def typed_operand(value):
+    # A typed array, a number, or None when the value cannot take part
+    if value.__class__ is TypedArray or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, list):
+        try:
+            return TypedArray(INT, value)
+        except TypeError:
+            try:
+                return TypedArray(FLOAT, value)
+            except TypeError:
+                raise RuntimeError("Element-wise operations require arrays of numbers")
+    return None
+
+def elementwise(symbol, left, right):
+    left = typed_operand(left)
+    right = typed_operand(right)
+    if left is None or right is None:
+        return NotImplemented
+
+    left_array = left.__class__ is TypedArray
+    right_array = right.__class__ is TypedArray
+    if left_array and right_array and len(left) != len(right):
+        raise RuntimeError(f"Element-wise '{symbol}' requires arrays of the same length, got {len(left)} and {len(right)}")
+    size = len(left) if left_array else len(right)
+
+    if symbol in COMPARISONS:
+        typecode = INT
+    elif symbol == '/' or FLOAT in (getattr(left, 'typecode', None), getattr(right, 'typecode', None)) \
+            or isinstance(left, float) or isinstance(right, float):
+        typecode = FLOAT
+    else:
+        typecode = INT
+
+    if symbol in ('/', '%'):
+        divisor_zero = (0 in right) if right_array else right == 0
+        if divisor_zero:
+            raise RuntimeError("Division by zero")
+
+    function, ufunc = OPERATORS[symbol]
+    if numpy is not None and size >= NUMPY_THRESHOLD:
+        result = getattr(numpy, ufunc)(view(left) if left_array else left, view(right) if right_array else right)
+        return TypedArray(typecode, result.astype(typecode).tobytes())
+
+    if not left_array:
+        left = itertools.repeat(left, size)
+    elif not right_array:
+        right = itertools.repeat(right, size)
+    try:
+        return TypedArray(typecode, map(function, left, right))
+    except OverflowError:
+        raise RuntimeError(f"Element-wise '{symbol}' overflowed an iarray")
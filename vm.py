@@ -0,0 +1,489 @@
+from interpreter import (Interpreter, Function, RuntimeError, UNSET, element_error, fallback_value, fallback_store, contains, make_map,
+                         make_set, map_get, map_set, collection_items, SEQUENCE_TYPES, COLLECTION_TYPES, ITERABLE_TYPES)
+from typed_arrays import TypedArray
+from ropes import concat
+from compiler import Compiler, Opcode
+
+LOAD_CONST = Opcode.LOAD_CONST
+LOAD_NAME = Opcode.LOAD_NAME
+STORE_NAME = Opcode.STORE_NAME
+DEFINE_NAME = Opcode.DEFINE_NAME
+POP_TOP = Opcode.POP_TOP
+LOAD_LOCAL = Opcode.LOAD_LOCAL
+STORE_LOCAL = Opcode.STORE_LOCAL
+LOAD_GLOBAL = Opcode.LOAD_GLOBAL
+STORE_GLOBAL = Opcode.STORE_GLOBAL
+BINARY_ADD = Opcode.BINARY_ADD
+BINARY_SUBTRACT = Opcode.BINARY_SUBTRACT
+BINARY_MULTIPLY = Opcode.BINARY_MULTIPLY
+BINARY_DIVIDE = Opcode.BINARY_DIVIDE
+BINARY_MODULO = Opcode.BINARY_MODULO
+COMPARE_EQUAL = Opcode.COMPARE_EQUAL
+COMPARE_NOT_EQUAL = Opcode.COMPARE_NOT_EQUAL
+COMPARE_LESS = Opcode.COMPARE_LESS
+COMPARE_GREATER = Opcode.COMPARE_GREATER
+COMPARE_LESS_EQUAL = Opcode.COMPARE_LESS_EQUAL
+COMPARE_GREATER_EQUAL = Opcode.COMPARE_GREATER_EQUAL
+COMPARE_IN = Opcode.COMPARE_IN
+UNARY_NOT = Opcode.UNARY_NOT
+UNARY_NEGATIVE = Opcode.UNARY_NEGATIVE
+PREFIX_INCREMENT = Opcode.PREFIX_INCREMENT
+PREFIX_DECREMENT = Opcode.PREFIX_DECREMENT
+POSTFIX_INCREMENT = Opcode.POSTFIX_INCREMENT
+POSTFIX_DECREMENT = Opcode.POSTFIX_DECREMENT
+INCREMENT_NAME = Opcode.INCREMENT_NAME
+DECREMENT_NAME = Opcode.DECREMENT_NAME
+INCREMENT_LOCAL = Opcode.INCREMENT_LOCAL
+DECREMENT_LOCAL = Opcode.DECREMENT_LOCAL
+INCREMENT_GLOBAL = Opcode.INCREMENT_GLOBAL
+DECREMENT_GLOBAL = Opcode.DECREMENT_GLOBAL
+JUMP = Opcode.JUMP
+POP_JUMP_IF_FALSE = Opcode.POP_JUMP_IF_FALSE
+PUSH_SCOPE = Opcode.PUSH_SCOPE
+POP_SCOPE = Opcode.POP_SCOPE
+RETURN_VALUE = Opcode.RETURN_VALUE
+RAISE_ERROR = Opcode.RAISE_ERROR
+GET_ITER = Opcode.GET_ITER
+FOR_ITER = Opcode.FOR_ITER
+MAKE_FUNCTION = Opcode.MAKE_FUNCTION
+LOAD_FUNCTION = Opcode.LOAD_FUNCTION
+CALL_FUNCTION = Opcode.CALL_FUNCTION
+TAIL_CALL = Opcode.TAIL_CALL
+BUILD_ARRAY = Opcode.BUILD_ARRAY
+LOAD_INDEX = Opcode.LOAD_INDEX
+STORE_INDEX = Opcode.STORE_INDEX
+BUILD_MAP = Opcode.BUILD_MAP
+BUILD_SET = Opcode.BUILD_SET
+
+# The opcodes execute() tests first, which it binds to locals
+HOT_OPCODES = (LOAD_GLOBAL, LOAD_CONST, LOAD_LOCAL, POP_JUMP_IF_FALSE, LOAD_FUNCTION, BINARY_ADD, CALL_FUNCTION,
+               JUMP, COMPARE_LESS, BINARY_MODULO, INCREMENT_GLOBAL, STORE_GLOBAL, DEFINE_NAME, STORE_INDEX,
+               BINARY_MULTIPLY, BINARY_SUBTRACT, RETURN_VALUE, COMPARE_EQUAL, POP_TOP, FOR_ITER, LOAD_INDEX,
+               INCREMENT_LOCAL, TAIL_CALL, LOAD_NAME)
+
+# opcode -> (delta, pushes the old value, pushes the new value, name used in errors)
+STEP_OPCODES = {
+    PREFIX_INCREMENT: (1, False, True, "Increment"),
+    PREFIX_DECREMENT: (-1, False, True, "Decrement"),
+    POSTFIX_INCREMENT: (1, True, False, "Increment"),
+    POSTFIX_DECREMENT: (-1, True, False, "Decrement"),
+    INCREMENT_NAME: (1, False, False, "Increment"),
+    DECREMENT_NAME: (-1, False, False, "Decrement"),
+}
+
+class BytecodeFunction(Function):
+    def __init__(self, code, closure, vm):
+        definition = code.definition
+        super().__init__(definition.name, definition.parameters, definition.body, closure, definition.frame_size)
+        self.code = code
+        self.vm = vm
+
+    def call(self, interpreter, arguments):
+        # Entry point for Python callers; calls made from bytecode push a Frame instead
+        return self.vm.run_function(self, arguments)
+
+class Frame:
+    __slots__ = ('code', 'pc', 'stack', 'scope')
+
+    def __init__(self, code, pc, stack, scope):
+        self.code = code
+        self.pc = pc
+        self.stack = stack
+        self.scope = scope
+
+class VirtualMachine(Interpreter):
+    supports_hooks = False
+
+    def interpret(self, program):
+        self.resolve(program)
+        code = Compiler().compile(program)
+        return self.execute(code, None)
+
+    def run_function(self, func, arguments):
+        return self.execute(func.code, self.enter(func, arguments))
+
+    def enter(self, func, arguments):
+        parameters = func.parameters
+        if len(arguments) != len(parameters):
+            raise RuntimeError(f"Function '{func.name}' expects {len(parameters)} arguments, got {len(arguments)}")
+        scope = [func.closure]
+        scope.extend(arguments)
+        scope.extend([UNSET] * (func.frame_size - len(arguments)))
+        return scope
+
+    def load(self, scope, address):
+        name, depth, slot, fallback = address
+        if slot is None:
+            return self.environment.get(name)
+        outer = scope
+        for _ in range(depth):
+            outer = outer[0]
+        value = outer[slot]
+        if value is UNSET:
+            return fallback_value(name, fallback, scope, self.environment)
+        return value
+
+    def store(self, scope, address, value):
+        name, depth, slot, fallback = address
+        if slot is None:
+            self.environment.variables[name] = value
+            return
+        outer = scope
+        for _ in range(depth):
+            outer = outer[0]
+        if depth and outer[slot] is UNSET:
+            fallback_store(name, fallback, scope, self.environment, value)
+            return
+        outer[slot] = value
+
+    def step(self, scope, address, delta, verb):
+        # Adds delta to a variable and returns its old value
+        value = self.load(scope, address)
+        if not isinstance(value, (int, float)):
+            raise RuntimeError(f"{verb} operator requires a numeric value")
+        self.store(scope, address, value + delta)
+        return value
+
+    def execute(self, code, scope):
+        # Calls between bytecode functions push explicit Frames rather than recursing in Python
+        frames = []
+        is_truthy = self.is_truthy
+        # Every instruction is compared against these, and locals compare faster than globals
+        (LOAD_GLOBAL, LOAD_CONST, LOAD_LOCAL, POP_JUMP_IF_FALSE, LOAD_FUNCTION, BINARY_ADD, CALL_FUNCTION, JUMP,
+         COMPARE_LESS, BINARY_MODULO, INCREMENT_GLOBAL, STORE_GLOBAL, DEFINE_NAME, STORE_INDEX, BINARY_MULTIPLY,
+         BINARY_SUBTRACT, RETURN_VALUE, COMPARE_EQUAL, POP_TOP, FOR_ITER, LOAD_INDEX, INCREMENT_LOCAL, TAIL_CALL,
+         LOAD_NAME) = HOT_OPCODES
+        global_variables = self.environment.variables
+
+        instructions = code.instructions
+        constants = code.constants
+        names = code.names
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        pc = 0
+
+        while True:
+            opcode = instructions[pc]
+            argument = instructions[pc + 1]
+            pc += 2
+
+            # Arms are ordered by how often the bench/ workloads execute each opcode
+            if opcode == LOAD_GLOBAL:
+                try:
+                    push(global_variables[names[argument][0]])
+                except KeyError:
+                    raise RuntimeError(f"Undefined variable '{names[argument][0]}'") from None
+
+            elif opcode == LOAD_CONST:
+                push(constants[argument])
+
+            elif opcode == LOAD_LOCAL:
+                value = scope[names[argument][2]]
+                if value is UNSET:
+                    value = self.load(scope, names[argument])
+                push(value)
+
+            elif opcode == POP_JUMP_IF_FALSE:
+                value = pop()
+                if value is not True and (value is False or not is_truthy(value)):
+                    pc = argument
+
+            elif opcode == LOAD_FUNCTION:
+                name, depth, slot, fallback = names[argument]
+                if slot is None and name in global_variables:
+                    func = global_variables[name]
+                else:
+                    func = self.load(scope, names[argument])
+                if not callable(func):
+                    raise RuntimeError(f"'{name}' is not a function")
+                push(func)
+
+            elif opcode == BINARY_ADD:
+                right = pop()
+                left = stack[-1]
+                if isinstance(left, str) or isinstance(right, str):
+                    stack[-1] = concat(left, right)
+                else:
+                    stack[-1] = left + right
+
+            elif opcode == CALL_FUNCTION:
+                if argument:
+                    arguments = stack[-argument:]
+                    del stack[-argument:]
+                else:
+                    arguments = []
+                func = pop()
+
+                if func.__class__ is BytecodeFunction:
+                    parameters = func.parameters
+                    if len(arguments) != len(parameters):
+                        raise RuntimeError(f"Function '{func.name}' expects {len(parameters)} arguments, got {len(arguments)}")
+                    frames.append(Frame(code, pc, stack, scope))
+                    scope = [func.closure]
+                    scope.extend(arguments)
+                    if func.frame_size > len(arguments):
+                        scope.extend([UNSET] * (func.frame_size - len(arguments)))
+                    code = func.code
+                    instructions = code.instructions
+                    constants = code.constants
+                    names = code.names
+                    stack = []
+                    push = stack.append
+                    pop = stack.pop
+                    pc = 0
+                elif isinstance(func, Function):
+                    push(func(self, arguments))
+                else:
+                    # Built-in function
+                    push(func(*arguments))
+
+            elif opcode == JUMP:
+                pc = argument
+
+            elif opcode == COMPARE_LESS:
+                right = pop()
+                stack[-1] = stack[-1] < right
+
+            elif opcode == BINARY_MODULO:
+                right = pop()
+                stack[-1] = stack[-1] % right
+
+            elif opcode == INCREMENT_GLOBAL:
+                name = names[argument][0]
+                value = global_variables.get(name)
+                if value.__class__ is int:
+                    global_variables[name] = value + 1
+                else:
+                    self.step(scope, names[argument], 1, "Increment")
+
+            elif opcode == STORE_GLOBAL:
+                global_variables[names[argument][0]] = pop()
+
+            elif opcode == DEFINE_NAME:
+                name, depth, slot, fallback = names[argument]
+                if slot is None:
+                    global_variables[name] = pop()
+                else:
+                    scope[slot] = pop()
+
+            elif opcode == STORE_INDEX:
+                value = pop()
+                index = pop()
+                array = pop()
+                if array.__class__ is dict:
+                    map_set(array, index, value)
+                    continue
+                self.check_index(array, index)
+                try:
+                    array[index] = value
+                except (TypeError, OverflowError):
+                    raise RuntimeError(element_error(array, value))
+
+            elif opcode == BINARY_MULTIPLY:
+                right = pop()
+                stack[-1] = stack[-1] * right
+
+            elif opcode == BINARY_SUBTRACT:
+                right = pop()
+                stack[-1] = stack[-1] - right
+
+            elif opcode == RETURN_VALUE:
+                value = pop()
+                if not frames:
+                    return value
+                frame = frames.pop()
+                code = frame.code
+                instructions = code.instructions
+                constants = code.constants
+                names = code.names
+                stack = frame.stack
+                push = stack.append
+                pop = stack.pop
+                pc = frame.pc
+                scope = frame.scope
+                push(value)
+
+            elif opcode == COMPARE_EQUAL:
+                right = pop()
+                stack[-1] = stack[-1] == right
+
+            elif opcode == POP_TOP:
+                pop()
+
+            elif opcode == FOR_ITER:
+                value = next(stack[-1], UNSET)
+                if value is UNSET:
+                    pop()
+                    pc = argument
+                else:
+                    push(value)
+
+            elif opcode == LOAD_INDEX:
+                index = pop()
+                array = pop()
+                if array.__class__ is dict:
+                    push(map_get(array, index))
+                    continue
+                self.check_index(array, index)
+                push(array[index])
+
+            elif opcode == INCREMENT_LOCAL:
+                slot = names[argument][2]
+                value = scope[slot]
+                if value.__class__ is int:
+                    scope[slot] = value + 1
+                else:
+                    self.step(scope, names[argument], 1, "Increment")
+
+            elif opcode == TAIL_CALL:
+                if argument:
+                    arguments = stack[-argument:]
+                    del stack[-argument:]
+                else:
+                    arguments = []
+                func = pop()
+
+                if func.__class__ is BytecodeFunction:
+                    # The callee takes over this frame; its return goes to our caller
+                    parameters = func.parameters
+                    if len(arguments) != len(parameters):
+                        raise RuntimeError(f"Function '{func.name}' expects {len(parameters)} arguments, got {len(arguments)}")
+                    scope = [func.closure]
+                    scope.extend(arguments)
+                    if func.frame_size > len(arguments):
+                        scope.extend([UNSET] * (func.frame_size - len(arguments)))
+                    code = func.code
+                    instructions = code.instructions
+                    constants = code.constants
+                    names = code.names
+                    stack = []
+                    push = stack.append
+                    pop = stack.pop
+                    pc = 0
+                elif isinstance(func, Function):
+                    push(func(self, arguments))
+                else:
+                    push(func(*arguments))
+
+            elif opcode == LOAD_NAME:
+                push(self.load(scope, names[argument]))
+
+            elif opcode == STORE_LOCAL:
+                scope[names[argument][2]] = pop()
+
+            elif opcode == STORE_NAME:
+                self.store(scope, names[argument], pop())
+
+            elif opcode == MAKE_FUNCTION:
+                push(BytecodeFunction(constants[argument], scope, self))
+
+            elif opcode == PUSH_SCOPE:
+                scope = [scope] + [UNSET] * argument
+
+            elif opcode == POP_SCOPE:
+                scope = scope[0]
+
+            elif opcode == COMPARE_IN:
+                collection = pop()
+                stack[-1] = contains(collection, stack[-1])
+
+            elif opcode == COMPARE_GREATER:
+                right = pop()
+                stack[-1] = stack[-1] > right
+
+            elif opcode in STEP_OPCODES:
+                delta, push_old, push_new, verb = STEP_OPCODES[opcode]
+                current_value = self.step(scope, names[argument], delta, verb)
+                if push_old:
+                    push(current_value)
+                elif push_new:
+                    push(current_value + delta)
+
+            elif opcode == DECREMENT_LOCAL:
+                slot = names[argument][2]
+                value = scope[slot]
+                if value.__class__ is int:
+                    scope[slot] = value - 1
+                else:
+                    self.step(scope, names[argument], -1, "Decrement")
+
+            elif opcode == DECREMENT_GLOBAL:
+                name = names[argument][0]
+                value = global_variables.get(name)
+                if value.__class__ is int:
+                    global_variables[name] = value - 1
+                else:
+                    self.step(scope, names[argument], -1, "Decrement")
+
+            elif opcode == GET_ITER:
+                values = stack[-1]
+                if not isinstance(values, ITERABLE_TYPES):
+                    raise RuntimeError(f"Cannot iterate over a {self.builtin_type(values)} value")
+                if isinstance(values, COLLECTION_TYPES):
+                    values = collection_items(values)
+                stack[-1] = iter(values)
+
+            elif opcode == COMPARE_NOT_EQUAL:
+                right = pop()
+                stack[-1] = stack[-1] != right
+
+            elif opcode == COMPARE_LESS_EQUAL:
+                right = pop()
+                stack[-1] = stack[-1] <= right
+
+            elif opcode == COMPARE_GREATER_EQUAL:
+                right = pop()
+                stack[-1] = stack[-1] >= right
+
+            elif opcode == BINARY_DIVIDE:
+                right = pop()
+                if right == 0 and right.__class__ is not TypedArray:
+                    raise RuntimeError("Division by zero")
+                stack[-1] = stack[-1] / right
+
+            elif opcode == UNARY_NOT:
+                stack[-1] = not is_truthy(stack[-1])
+
+            elif opcode == UNARY_NEGATIVE:
+                stack[-1] = -stack[-1]
+
+            elif opcode == BUILD_ARRAY:
+                if argument:
+                    elements = stack[-argument:]
+                    del stack[-argument:]
+                else:
+                    elements = []
+                push(elements)
+
+            elif opcode == BUILD_MAP:
+                if argument:
+                    items = stack[-2 * argument:]
+                    del stack[-2 * argument:]
+                else:
+                    items = []
+                push(make_map(items[0::2], items[1::2]))
+
+            elif opcode == BUILD_SET:
+                if argument:
+                    elements = stack[-argument:]
+                    del stack[-argument:]
+                else:
+                    elements = []
+                push(make_set(elements))
+
+            elif opcode == RAISE_ERROR:
+                raise RuntimeError(constants[argument])
+
+            else:
+                raise RuntimeError(f"Unknown opcode {opcode}")
+
+    def check_index(self, array, index):
+        if not isinstance(array, SEQUENCE_TYPES):
+            raise RuntimeError("Cannot index into non-array value")
+
+        if not isinstance(index, int):
+            raise RuntimeError("Array index must be an integer")
+
+        if index < 0 or index >= len(array):
+            raise RuntimeError(f"Array index {index} out of bounds")